@@ -0,0 +1,273 @@
+"""Aggregate module.
+
+Aggregate the daily model outputs by period (such as weekly, monthly, or
+seasonally), as the model is run, so that only one row per period is
+stored and written (see Facade.run). The daily model outputs are added to
+running totals (and min. and max. values) that are reset at the start of
+every period, so memory use and the model output file grow with the no.
+of periods, not days.
+
+Water fluxes (rain, t, e, influx, outflux, and netflux) are summed over
+each period, whereas the other outputs (such as vwc) are given as their
+mean, min., and max. values over each period. Aggregated outputs are
+named by their daily output and statistic, e.g., layer1_vwc_mean or
+rain_sum.
+
+Periods are:
+    week - every 7 days, starting from day 1
+    month - calendar months
+    season - meteorological seasons (Dec-Feb, Mar-May, Jun-Aug, and
+             Sep-Nov), where December is in the next year's Dec-Feb
+    <no. of days> - every given no. of days, starting from day 1
+
+For calendar periods (months and seasons), day 1 is taken to be the given
+start date (default: 1 January 2001).
+
+Example:
+    from aggregate import Aggregator
+    from facade import Facade
+
+    fac = Facade('ini.txt', 'out.txt')
+    res = fac.run(365, aggregate=Aggregator('month'))
+    print(res['layers'][0]['vwc_mean'])   # monthly mean vwc of layer 1
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import datetime
+
+
+# daily model outputs summed over every period (the rest are averaged):
+SUMMED = ['rain', 't', 'e', 'influx', 'outflux', 'netflux']
+# statistics of the other daily model outputs:
+STATS = ['mean', 'min', 'max']
+# names of the columns that identify every period:
+PERIOD_FIELDS = ['period', 'firstday', 'lastday', 'ndays']
+# names of the periods, and their short forms:
+PERIODS = {'week': 'week', 'w': 'week', 'month': 'month', 'm': 'month',
+           'season': 'season', 's': 'season'}
+
+
+def parse_period(text):
+    """Period given as text, e.g., 'week', 'm', or '10' (days).
+
+    Args:
+        text: name of the period (or its first letter), or no. of days
+
+    Returns:
+        Name of the period, or the no. of days (int)
+    """
+    text = text.strip().lower()
+    if text in PERIODS:
+        return PERIODS[text]
+    if text.isdigit() and int(text) > 0:
+        return int(text)
+    raise ValueError('Unknown aggregation period: ' + text)
+
+
+def parse_date(text):
+    """Date given as text in the form YYYY-MM-DD."""
+    return datetime.datetime.strptime(text.strip(), '%Y-%m-%d').date()
+
+
+class Aggregator(object):
+    """Aggregator class.
+
+    Aggregate the daily model outputs by period, using running totals.
+
+    ATTRIBUTES:
+        period - name of the period ('week', 'month', or 'season'), or
+                 the no. of days of every period
+        startdate - date of day 1 (datetime.date), for calendar periods
+        fields - names of the daily model outputs (see start)
+        headers - names of the columns of the aggregated rows
+
+    METHODS:
+        period_key - key of the period that a given day falls in
+        options - options that change the aggregated results
+        start - get ready for the daily model outputs of a new model run
+        add - add the daily model outputs of a day
+        finish - aggregated row of the last (unfinished) period, if any
+        empty_results - new (empty) dictionary for aggregated results
+        store_row - append an aggregated row to the results
+    """
+
+    def __init__(self, period, startdate=None):
+        """Create the Aggregator object.
+
+        Args:
+            period: name of the period ('week', 'month', or 'season'),
+                    or the no. of days of every period (see parse_period)
+            startdate: date of day 1 (datetime.date), for calendar
+                       periods. Default: 1 January 2001
+        """
+        if isinstance(period, str):
+            period = parse_period(period)
+        self.period = period
+        self.startdate = startdate or datetime.date(2001, 1, 1)
+        self.fields = None
+        self.headers = None
+        self.__summed = []      # True for every summed daily output
+        self.__statcols = []    # columns of the non-summed outputs
+        self.__key = None       # key of the current period
+        self.__count = 0        # no. of periods so far
+        self.__firstday = 0     # first day of the current period
+        self.__lastday = 0      # last day added so far
+        self.__ndays = 0        # no. of days in the current period
+        self.__sums = []        # running totals, one per daily output
+        self.__mins = []        # running min. values
+        self.__maxs = []        # running max. values
+
+    def period_key(self, day):
+        """Key of the period that a given day falls in.
+
+        Args:
+            day: day number (day 1 is the first day)
+
+        Returns:
+            The key, which is the same for all days in the same period
+        """
+        if self.period == 'week':
+            return (day - 1) // 7
+        if not isinstance(self.period, str):
+            return (day - 1) // self.period
+        date = self.startdate + datetime.timedelta(days=day - 1)
+        if self.period == 'month':
+            return date.year, date.month
+        year = date.year + 1 if date.month == 12 else date.year
+        return year, (date.month % 12) // 3     # season
+
+    def options(self):
+        """Options that change the aggregated results (such as for the
+        cache key)."""
+        return {'aggregate': [self.period, self.startdate.isoformat()]}
+
+    def start(self, fields):
+        """Get ready for the daily model outputs of a new model run.
+
+        Args:
+            fields: names of the daily model outputs (as given by
+                    Facade.output_fields)
+
+        Returns:
+            None
+        """
+        self.fields = list(fields)
+        self.headers = list(PERIOD_FIELDS)
+        self.__summed = []
+        self.__statcols = []
+        for col, name in enumerate(self.fields):
+            summed = name.rsplit('_', 1)[-1] in SUMMED
+            self.__summed.append(summed)
+            if summed:
+                self.headers.append(name + '_sum')
+            else:
+                self.__statcols.append(col)
+                self.headers.extend([name + '_' + stat for stat in STATS])
+        self.__key = None
+        self.__count = 0
+
+    def __reset(self, day):
+        """Start a new period on the given day."""
+        n = len(self.fields)
+        self.__firstday = day
+        self.__ndays = 0
+        self.__sums = [0.0] * n
+        self.__mins = [float('inf')] * n
+        self.__maxs = [float('-inf')] * n
+
+    def __row(self):
+        """Aggregated row of the current period."""
+        self.__count += 1
+        n = self.__ndays
+        row = [self.__count, self.__firstday, self.__lastday, n]
+        for col, summed in enumerate(self.__summed):
+            if summed:
+                row.append(self.__sums[col])
+            else:
+                row.extend([self.__sums[col] / n, self.__mins[col],
+                            self.__maxs[col]])
+        return row
+
+    def add(self, day, vals):
+        """Add the daily model outputs of a day.
+
+        Args:
+            day: day number (days must be added in order)
+            vals: values of the daily model outputs, in the same order
+                  as the fields given to start
+
+        Returns:
+            List of the aggregated rows of the periods that ended before
+            this day (either empty or one row)
+        """
+        rows = []
+        key = self.period_key(day)
+        if key != self.__key:
+            if self.__key is not None:
+                rows.append(self.__row())
+            self.__key = key
+            self.__reset(day)
+        sums = self.__sums
+        for col, val in enumerate(vals):
+            sums[col] += val
+        mins = self.__mins
+        maxs = self.__maxs
+        for col in self.__statcols:
+            val = vals[col]
+            if val < mins[col]:
+                mins[col] = val
+            if val > maxs[col]:
+                maxs[col] = val
+        self.__lastday = day
+        self.__ndays += 1
+        return rows
+
+    def finish(self):
+        """Aggregated row of the last period, which may be unfinished.
+
+        Returns:
+            List of the aggregated rows (either empty or one row)
+        """
+        if self.__key is None:
+            return []
+        self.__key = None
+        return [self.__row()]
+
+    def empty_results(self):
+        """New (empty) dictionary to store the aggregated results.
+
+        Returns:
+            Dictionary with an empty list for each aggregated output of
+            the whole soil profile, and a list of such dictionaries (one
+            per soil layer) under 'layers', as with Facade.empty_results
+        """
+        res = {}
+        layers = {}
+        for name in self.headers:
+            if name.startswith('layer'):
+                prefix, key = name.split('_', 1)
+                layers.setdefault(int(prefix[5:]), {})[key] = []
+            else:
+                res[name] = []
+        res['layers'] = [layers[idx] for idx in sorted(layers)]
+        return res
+
+    def store_row(self, res, row):
+        """Append an aggregated row to the aggregated results.
+
+        Args:
+            res: dictionary containing the aggregated results
+            row: the aggregated row (from add or finish)
+
+        Returns:
+            None
+        """
+        for name, val in zip(self.headers, row):
+            if name.startswith('layer'):
+                prefix, key = name.split('_', 1)
+                res['layers'][int(prefix[5:]) - 1][key].append(val)
+            else:
+                res[name].append(val)
@@ -0,0 +1,427 @@
+"""Assimilate module.
+
+Correct the model state with soil moisture sensor readings, using an
+ensemble Kalman filter (EnKF). An ensemble of soil water models (with
+perturbed rain, potential ET, soil texture, and saturated hydraulic
+conductivity, as in the ensemble module) is run in lockstep, one day at a
+time. On every day with sensor readings, the state of all the members is
+gathered into one array (members x state), and the vol. water content of
+every soil layer (and, optionally, the log of the saturated hydraulic
+conductivity of every soil layer) is updated for all members at once, by
+the stochastic (perturbed observations) EnKF analysis:
+
+    Xa = X + (Y - HX) (H P H' + R)^-1 H P
+
+where X is the ensemble of model states, H selects the observed soil
+layers, P is the ensemble covariance, R is the sensor error covariance,
+and Y is the sensor readings perturbed by their errors (one set per
+member). The analysis is done with batched matrix operations (no loop
+over members), so its cost is small next to running the members.
+
+Sensor readings are read from a text file, one reading per line:
+
+    <day>, <soil layer no.>, <vwc (m3/m3)>[, <error s.d. (m3/m3)>]
+
+where soil layers are numbered from 1, and the error s.d. is optional
+(default as given to Assimilation). Lines starting with # are ignored.
+
+Requires numpy.
+
+How to use:
+
+    python assimilate.py <flags>
+
+where <flags> are the following:
+    -i <model input text file>
+    -d <sensor readings text file>
+    -o <model output/results text file, of the ensemble mean>
+    -n <number of daily time steps to run the model, in days>
+    -m <no. of ensemble members, optional (default: 100)>
+    -s <random seed, optional (default: 0)>
+    -r <perturbation size for rain, optional (default: 0.2)>
+    -p <perturbation size for potential ET, optional (default: 0.1)>
+    -t <perturbation size for clay and sand, in %, optional (default: 0)>
+    -k <perturbation size for ksat, optional (default: 0); if given, ksat
+        is also updated from the sensor readings>
+    -e <default error s.d. of the readings, optional (default: 0.02)>
+
+Example:
+    from assimilate import Assimilation, read_observations
+
+    obs = read_observations('sensors.txt')
+    da = Assimilation('ini.txt', 200, seed=1, rainsd=0.2, ksatsd=0.5)
+    da.run(365, obs)
+    rootvwc = da.field('rootvwc')   # (members x days) array
+
+The root zone outputs of a day with readings are found from the updated
+soil layers. To check that they match (difference should be 0):
+
+    from assimilate import rootzone_check
+
+    model = da.models[0]    # or any other SoilWater object
+    diff = rootzone_check(model, [0.3] * model.numlayers)
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import copy
+import getopt
+import sys
+import traceback
+
+import numpy as np
+
+from dailydata import DailyData
+from ensemble import Ensemble
+from facade import Facade
+from soilwater import SoilWater
+
+
+def read_observations(fname, errorsd=None):
+    """Read the sensor readings from a text file.
+
+    Args:
+        fname: sensor readings text file (see module docstring)
+        errorsd: error s.d. of the readings that do not give their own.
+                 Default: None (not set)
+
+    Returns:
+        Dictionary of the readings of every day, indexed by day, as lists
+        of (soil layer index, vwc, error s.d.) tuples, where the soil
+        layer index starts at 0
+
+    Raises:
+        ValueError: if a soil layer no. is below 1
+    """
+    obs = {}
+    with open(fname, 'rt') as fin:
+        for line in fin:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            vals = [val.strip() for val in line.split(',')]
+            sd = float(vals[3]) if len(vals) > 3 else errorsd
+            layer = int(vals[1])
+            if layer < 1:
+                raise ValueError('Soil layer no. {} of reading "{}" must'
+                                 ' be from 1.'.format(layer, line))
+            obs.setdefault(int(vals[0]), []).append(
+                (layer - 1, float(vals[2]), sd))
+    return obs
+
+
+def rootzone_check(model, vwcs):
+    """Check the root zone water of a model after its state is updated.
+
+    The state of a copy of the model is updated, so the given model is
+    not changed.
+
+    Args:
+        model: the soil water model (SoilWater object)
+        vwcs: new vol. water content of every soil layer (m3/m3)
+
+    Returns:
+        Absolute difference (m3/m3) between the root zone vol. water
+        content of the updated model, and the one found from its updated
+        soil layers (should be 0)
+    """
+    model = copy.deepcopy(model)
+    model.update_layers(vwcs)
+    wc = 0.0
+    for layer in model.layers:
+        top = layer.accthick - layer.thick
+        wc += layer.vwc * min(layer.thick, max(0.0, model.rootdepth - top))
+    return abs(model.rootwater.vwc - wc / model.rootdepth)
+
+
+class Assimilation(object):
+    """Assimilation class.
+
+    Run an ensemble of soil water models in lockstep, and update their
+    states with the sensor readings by an ensemble Kalman filter.
+
+    ATTRIBUTES:
+        ensemble - perturbations of the members (Ensemble object)
+        nmembers - number of ensemble members
+        ksatsd - perturbation size for the saturated hydraulic
+                 conductivity (-); if above 0, ksat is also updated
+        errorsd - default error s.d. of the sensor readings (m3/m3)
+        models - the soil water model of every member
+        fields - names of the daily model outputs
+        results - model results, an array of (members x days x fields)
+
+    METHODS:
+        Statics:
+            analysis - EnKF update of an ensemble of model states
+
+        state - model states of all members, as an array
+        set_state - replace the model states of all members
+        assimilate - update the members with a day's sensor readings
+        run - run all the members in lockstep, with assimilation
+        field - model results for a given output field
+        mean_results - ensemble mean of the model results
+    """
+
+    def __init__(self, fname_in, nmembers, seed=0, rainsd=0.0, petsd=0.0,
+                 texturesd=0.0, ksatsd=0.0, errorsd=0.02):
+        """Create the Assimilation object.
+
+        Args:
+            fname_in: model input text file
+            nmembers: number of ensemble members
+            seed: seed for the random streams of all members
+            rainsd: perturbation size for rain (-)
+            petsd: perturbation size for potential ET (-)
+            texturesd: perturbation size for clay and sand (%)
+            ksatsd: perturbation size for ksat (-), as a lognormal random
+                    factor per soil layer and member; if above 0, ksat is
+                    also updated from the sensor readings
+            errorsd: error s.d. of the sensor readings that do not give
+                     their own (m3/m3)
+
+        Raises:
+            ValueError: if there are fewer than 2 ensemble members
+        """
+        if nmembers < 2:
+            raise ValueError('The ensemble must have at least 2 members,'
+                             ' not {}.'.format(nmembers))
+        self.ensemble = Ensemble(fname_in, nmembers, seed, rainsd, petsd,
+                                 texturesd)
+        self.nmembers = nmembers
+        self.ksatsd = ksatsd
+        self.errorsd = errorsd
+        self.models = None
+        self.fields = self.ensemble.fields
+        self.results = None
+        self.__rng = np.random.default_rng([seed, nmembers])
+
+    @staticmethod
+    def analysis(states, obscols, obs, errorsd, rng):
+        """EnKF (perturbed observations) update of an ensemble of states.
+
+        Args:
+            states: model states, an array of (members x state)
+            obscols: state columns that are observed
+            obs: observed values, one per observed column
+            errorsd: error s.d. of the observed values
+            rng: numpy random generator, to perturb the observed values
+
+        Returns:
+            Updated model states, an array of (members x state)
+        """
+        nmembers = states.shape[0]
+        anom = states - states.mean(axis=0)     # (members x state)
+        hx = states[:, obscols]                 # (members x obs)
+        hanom = anom[:, obscols]
+        errorsd = np.asarray(errorsd, dtype=float)
+        # ensemble covariances with, and of, the observed columns:
+        pxy = anom.T @ hanom / (nmembers - 1)   # (state x obs)
+        pyy = hanom.T @ hanom / (nmembers - 1) + np.diag(errorsd ** 2)
+        # every member sees the readings with its own random errors:
+        perturbed = obs + rng.standard_normal(hx.shape) * errorsd
+        innov = perturbed - hx                  # (members x obs)
+        return states + np.linalg.solve(pyy, innov.T).T @ pxy.T
+
+    def state(self):
+        """Model states of all members.
+
+        Returns:
+            Array of (members x state), where the state is the vol. water
+            content of every soil layer (m3/m3), followed by the log of
+            the saturated hydraulic conductivity of every soil layer, if
+            ksat is updated
+        """
+        vwcs = [[layer.vwc for layer in model.layers]
+                for model in self.models]
+        if self.ksatsd <= 0:
+            return np.array(vwcs)
+        ksats = [[layer.ksat for layer in model.layers]
+                 for model in self.models]
+        return np.hstack([np.array(vwcs), np.log(ksats)])
+
+    def set_state(self, states):
+        """Replace the model states of all members (see state)."""
+        nlayers = len(self.models[0].layers)
+        vwcs = states[:, :nlayers].tolist()
+        ksats = None
+        if self.ksatsd > 0:
+            ksats = np.exp(states[:, nlayers:]).tolist()
+        for i, model in enumerate(self.models):
+            model.update_layers(vwcs[i], ksats and ksats[i])
+
+    def assimilate(self, readings):
+        """Update all members with the sensor readings of a day.
+
+        Args:
+            readings: list of (soil layer index, vwc, error s.d.) tuples
+                      (see read_observations)
+
+        Returns:
+            None
+        """
+        obscols = [idx for idx, _, _ in readings]
+        obs = np.array([val for _, val, _ in readings])
+        errorsd = [self.errorsd if sd is None else sd
+                   for _, _, sd in readings]
+        states = Assimilation.analysis(self.state(), obscols, obs,
+                                       errorsd, self.__rng)
+        self.set_state(states)
+
+    def run(self, duration, observations):
+        """Run all the members in lockstep, with assimilation.
+
+        The members are run one day at a time. On a day with sensor
+        readings, the members are updated after that day's water balance,
+        so their daily model outputs for that day (and the next days'
+        water balance) are of the updated states.
+
+        Args:
+            duration: no. of daily simulation days (days)
+            observations: sensor readings of every day (see
+                          read_observations)
+
+        Returns:
+            Array of the model results (members x days x fields)
+
+        Raises:
+            ValueError: if a sensor reading is of a soil layer that the
+                        model does not have
+        """
+        numlayers = self.ensemble.ini['numlayers']
+        for day, readings in observations.items():
+            for idx, _, _ in readings:
+                if not 0 <= idx < numlayers:
+                    raise ValueError(
+                        'Reading of day {} is of soil layer no. {}, but the'
+                        ' model has soil layers 1 to {}.'.format(
+                            day, idx + 1, numlayers))
+        dailydata = DailyData(self.ensemble.ini['dailydatafile'])
+        self.models = []
+        multipliers = []
+        for member in range(self.nmembers):
+            ini, rainmult, petmult = self.ensemble.perturbations(member,
+                                                                 duration)
+            model = SoilWater(ini)
+            if self.ksatsd > 0:
+                factors = Ensemble.lognormal(self.__rng, self.ksatsd,
+                                             model.numlayers)
+                model.update_layers(
+                    [layer.vwc for layer in model.layers],
+                    [layer.ksat * f for layer, f in zip(model.layers,
+                                                        factors)])
+            self.models.append(model)
+            multipliers.append((rainmult, petmult))
+        self.results = np.empty((self.nmembers, duration,
+                                 len(self.fields)))
+        for i in range(duration):
+            day = i + 1     # day number starts at 1, not 0
+            rain, lai, petcrop, petsoil = dailydata[day]
+            for model, (rainmult, petmult) in zip(self.models,
+                                                  multipliers):
+                model.daily_water_balance(rain * rainmult[i], lai,
+                                          petcrop * petmult[i],
+                                          petsoil * petmult[i])
+            if day in observations:
+                self.assimilate(observations[day])
+            self.results[:, i] = [Facade.daily_outputs(model,
+                                                       rain * rainmult[i])
+                                  for model, (rainmult, _)
+                                  in zip(self.models, multipliers)]
+        return self.results
+
+    def field(self, name):
+        """Model results for a given output field.
+
+        Args:
+            name: name of the output, e.g., 'rootvwc' or 'layer1_vwc'
+                  (see Facade.output_fields)
+
+        Returns:
+            Array of (members x days)
+        """
+        return self.results[:, :, self.fields.index(name)]
+
+    def mean_results(self):
+        """Ensemble mean of the model results, same as Facade's."""
+        res = Facade.empty_results(len(self.models[0].layers))
+        for vals in self.results.mean(axis=0).tolist():
+            Facade.store_outputs(res, vals)
+        return res
+
+
+def main(argv):
+    """Main entry point for assimilating sensor readings.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        inifile = obsfile = outfile = duration = None
+        nmembers = 100
+        seed = 0
+        rainsd, petsd, texturesd, ksatsd, errorsd = 0.2, 0.1, 0.0, 0.0, 0.02
+        opts, a = getopt.getopt(argv, "hi:d:o:n:m:s:r:p:t:k:e:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-i':           # initialization file flag
+                inifile = arg
+            elif opt == '-d':           # sensor readings file flag
+                obsfile = arg
+            elif opt == '-o':           # output file flag
+                outfile = arg
+            elif opt == '-n':           # duration of model run flag
+                duration = int(arg)
+            elif opt == '-m':           # no. of members flag
+                nmembers = int(arg)
+            elif opt == '-s':           # random seed flag
+                seed = int(arg)
+            elif opt == '-r':           # rain perturbation flag
+                rainsd = float(arg)
+            elif opt == '-p':           # potential ET perturbation flag
+                petsd = float(arg)
+            elif opt == '-t':           # texture perturbation flag
+                texturesd = float(arg)
+            elif opt == '-k':           # ksat perturbation flag
+                ksatsd = float(arg)
+            elif opt == '-e':           # error s.d. of readings flag
+                errorsd = float(arg)
+
+        if None in [inifile, obsfile, outfile, duration]:
+            print('One or more flags are missing. Flags -m, -s, -r, -p,'
+                  ' -t, -k, and -e are optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        da = Assimilation(inifile, nmembers, seed, rainsd, petsd,
+                          texturesd, ksatsd, errorsd)
+        print('Running ...')
+        da.run(duration, read_observations(obsfile))
+        means = da.results.mean(axis=0)
+        with open(outfile, 'wt') as fout:
+            headers = ['day'] + da.fields
+            fout.write(('{:>15s},' * len(headers)).rstrip(',').format(
+                *headers))
+            fout.write('\n')
+            fmtrow = '{:>15d}' + ',{:>15.3f}' * len(da.fields)
+            for i, vals in enumerate(means.tolist()):
+                fout.write(fmtrow.format(i + 1, *vals))
+                fout.write('\n')
+        print('done.')
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
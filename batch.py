@@ -0,0 +1,369 @@
+"""Batch module.
+
+Run many model runs (jobs) in parallel, in a pool of worker processes.
+The jobs are listed in a plain text (batch) file, one job per line, where
+every line has the model input text file, the model output text file, and
+the duration (days) of the model run, separated by commas, e.g.:
+
+    ini.txt, out1.txt, 90
+    ini2.txt, out2.txt, 365
+
+The jobs are run largest first. The run time of every job is predicted
+from its amount of work (no. of soil layers x duration x no. of
+integration intervals), using a cost model learned from the measured run
+times of earlier jobs (kept in a JSON file, if given), except for jobs
+whose model results were retrieved from the cache (their models were not
+run). The jobs wait in one queue, ordered by their predicted run times,
+from which every worker takes the next largest job as soon as it is idle,
+so no worker is left idle behind a few large jobs.
+
+Jobs predicted to take longer than a given time are run as a chain of
+segments (of consecutive days), where every segment saves the model
+state to a checkpoint file (<model output file>.ckpt) and the next
+segment continues from it. A checkpoint is only continued from if it
+was saved for the same duration and the same contents of the model input
+and daily data files (kept as a hash); otherwise, such as after any is
+edited, it is removed and the job starts again from day 1. The segments
+of a job still run one after another, but every next segment is queued
+by the work left in its job, so the jobs with the most work left are
+always run first, and an interrupted batch continues such jobs from
+their last checkpoint.
+Segmented jobs are not cached.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from collections import namedtuple
+import contextlib
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import multiprocessing as mp
+import os
+import queue
+import time
+
+from dailydata import DailyData
+from facade import Facade
+from soilwater import SoilWater
+
+
+# A model run in a batch.
+#    fname_in: model input text file
+#    fname_out: model output (results) text file
+#    duration: no. of daily simulation days (days)
+Job = namedtuple('Job', 'fname_in fname_out duration')
+
+# A part of a job, run in a worker process.
+#    index: index of the job in the batch
+#    job: the Job object
+#    first: first day of the part (days)
+#    last: last day of the part (days)
+#    cachedir: folder to cache the model results, if any (whole jobs only)
+Task = namedtuple('Task', 'index job first last cachedir')
+
+
+def read_jobs(fname):
+    """Read the jobs from a batch file.
+
+    Args:
+        fname: name of plain text (batch) file listing the jobs
+
+    Returns:
+        List of Job objects
+
+    Raises:
+        ValueError: if more than one job writes the same output file
+    """
+    jobs = []
+    fnames = set()   # model output files, as full paths
+    with open(fname, 'rt') as f:
+        for line in f:
+            items = [item.strip() for item in line.split(',')]
+            if items == [''] or items[0].startswith('#'):
+                continue    # skip blank lines and comments
+            if len(items) != 3:
+                raise IndexError('Each job must have a model input file,'
+                                 ' output file, and duration.')
+            fname_out = os.path.abspath(items[1])
+            if fname_out in fnames:
+                raise ValueError('More than one job writes the output'
+                                 ' file {}.'.format(items[1]))
+            fnames.add(fname_out)
+            jobs.append(Job(items[0], items[1], int(items[2])))
+    return jobs
+
+
+def job_units(job):
+    """Amount of work of a job (soil layers x days x intervals)."""
+    with open(job.fname_in, 'rt') as fin:
+        ini = json.loads(fin.read())
+    return ini['numlayers'] * job.duration * ini['numintervals']
+
+
+class CostModel(object):
+    """CostModel class.
+
+    Predict the run time of a job from its amount of work, as a fixed
+    time plus a time per unit of work, fitted (by least squares) to the
+    measured run times of earlier jobs.
+
+    ATTRIBUTES:
+        fname - JSON file to keep the measured run times in, if any
+        sums - sums of the measured run times and amounts of work (no.,
+               units, secs, units x units, and units x secs)
+
+    METHODS:
+        predict - predicted run time of an amount of work
+        update - add a measured run time
+        save - save the sums to the JSON file (if any)
+    """
+
+    def __init__(self, fname=None):
+        """Create the CostModel object.
+
+        Args:
+            fname: JSON file to keep the measured run times in, read if
+                   it exists. Default: None (not kept)
+        """
+        self.fname = fname
+        self.sums = [0.0] * 5
+        if fname and os.path.exists(fname):
+            with open(fname, 'rt') as fin:
+                self.sums = json.loads(fin.read())['sums']
+
+    def predict(self, units):
+        """Predicted run time (seconds) of a given amount of work."""
+        n, su, ss, suu, sus = self.sums
+        if n < 1 or su <= 0:
+            return units * 5e-6     # nothing measured yet (guess)
+        den = n * suu - su * su
+        slope = (n * sus - su * ss) / den if den > 0 else 0.0
+        if slope <= 0:
+            return units * ss / su  # only one size of job measured
+        return max(0.0, (ss - slope * su) / n) + slope * units
+
+    def update(self, units, secs):
+        """Add a measured run time (seconds) of an amount of work."""
+        for i, val in enumerate([1.0, units, secs, units * units,
+                                 units * secs]):
+            self.sums[i] += val
+
+    def save(self):
+        """Save the sums to the JSON file (if any)."""
+        if self.fname:
+            with open(self.fname, 'wt') as fout:
+                fout.write(json.dumps({'sums': self.sums}))
+
+
+def run_job(job, cachedir=None):
+    """Run the model for a given job (quietly, without a progress bar).
+
+    Args:
+        job: Job object
+        cachedir: folder to cache the model results, if any
+
+    Returns:
+        Tuple of the job, its run time (seconds), and whether its model
+        results were retrieved from the cache (so the model was not run)
+    """
+    cache = None
+    if cachedir:
+        from cache import ResultCache   # only needed if caching
+        cache = ResultCache(cachedir)
+    start = time.perf_counter()
+    fac = Facade(job.fname_in, job.fname_out, cache)
+    with contextlib.redirect_stdout(io.StringIO()):
+        fac.run(job.duration)
+    # no table of the daily model outputs, if retrieved from the cache:
+    return job, time.perf_counter() - start, fac.table is None
+
+
+def inputs_hash(text):
+    """Hash of the contents of a model input text file and its daily data.
+
+    Args:
+        text: contents of the model input text file
+
+    Returns:
+        The hash, as a hexadecimal string
+    """
+    h = hashlib.sha256(text.encode())
+    with open(json.loads(text)['dailydatafile'], 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def checkpoint_day(job):
+    """Last day saved in a job's checkpoint file (0 if none).
+
+    A checkpoint saved for another duration or other model inputs (such
+    as after the model input or daily data file is edited), or one whose
+    model output file is shorter than it was at the checkpoint, is
+    removed, and 0 is returned, so the job starts again from day 1.
+
+    Args:
+        job: Job object
+
+    Returns:
+        The last day saved, from which the job continues
+    """
+    ckpt = job.fname_out + '.ckpt'
+    try:
+        with open(ckpt, 'rt') as fin:
+            saved = json.loads(fin.read())
+        with open(job.fname_in, 'rt') as fin:
+            inihash = inputs_hash(fin.read())
+        day = saved['day']
+        if (saved['duration'] == job.duration and
+                saved['ini'] == inihash and 0 < day < job.duration and
+                os.path.getsize(job.fname_out) >= saved['size']):
+            return day
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    if os.path.exists(ckpt):
+        os.remove(ckpt)     # of another model run, so not continued
+    return 0
+
+
+def run_segment(job, first, last):
+    """Run the model of a job for a segment of days, from its checkpoint.
+
+    The model output file is written (from day 1) or continued (after the
+    checkpoint), the same as by Facade, and the model state at the last
+    day is saved to the checkpoint file, which is removed once the job's
+    last day is done.
+
+    Args:
+        job: Job object
+        first: first day of the segment (1, or the checkpoint day + 1)
+        last: last day of the segment
+
+    Returns:
+        Tuple of the job and the segment's run time (seconds)
+    """
+    from online import Online   # for its atomic file writes
+    start = time.perf_counter()
+    with open(job.fname_in, 'rt') as fin:
+        text = fin.read()
+    ini = json.loads(text)
+    model = SoilWater(ini)
+    dailydata = DailyData(ini['dailydatafile'])
+    fields = Facade.output_fields(model.numlayers)
+    fmtrow = '{:>15d}' + ',{:>15.3f}' * len(fields) + '\n'
+    ckpt = job.fname_out + '.ckpt'
+    if first == 1:
+        headers = ['day'] + fields
+        with open(job.fname_out, 'wb') as fout:
+            fout.write((('{:>15s},' * len(headers)).rstrip(',') +
+                        '\n').format(*headers).encode())
+            size = fout.tell()
+    else:
+        with open(ckpt, 'rt') as fin:
+            saved = json.loads(fin.read())
+        model.set_state(saved['state'])
+        size = saved['size']
+    with open(job.fname_out, 'r+b') as fout:
+        fout.seek(size)     # drop any rows after the checkpoint
+        fout.truncate()
+        for day in range(first, last + 1):
+            data = dailydata[day]
+            model.daily_water_balance(*data)
+            vals = Facade.daily_outputs(model, data[0])
+            fout.write(fmtrow.format(day, *vals).encode())
+        size = fout.tell()
+    if last < job.duration:
+        Online.write_atomic(ckpt, {'day': last, 'size': size,
+                                   'duration': job.duration,
+                                   'ini': inputs_hash(text),
+                                   'state': model.get_state()})
+    elif os.path.exists(ckpt):
+        os.remove(ckpt)
+    return job, time.perf_counter() - start
+
+
+def _run_task(task):
+    """Run a task (a whole job or a segment, in a worker process)."""
+    if task.first == 1 and task.last == task.job.duration:
+        return (task,) + run_job(task.job, task.cachedir)[1:]
+    return task, run_segment(task.job, task.first, task.last)[1], False
+
+
+def run_batch(jobs, nworkers=None, cachedir=None, costfile=None,
+              segsecs=60.0):
+    """Run all the jobs in parallel, largest first.
+
+    Args:
+        jobs: list of Job objects
+        nworkers: no. of worker processes. Default: no. of CPUs
+        cachedir: folder to cache the model results, if any
+        costfile: JSON file to keep the measured run times in, to
+                  predict the run times of later jobs (see CostModel).
+                  Default: None (learned only within this batch)
+        segsecs: jobs predicted to take longer than this (seconds) are
+                 run as a chain of segments of about this long each
+
+    Returns:
+        List of the run times (seconds) of the jobs, in the same order as
+        the given jobs
+    """
+    nworkers = nworkers or os.cpu_count()
+    costs = CostModel(costfile)
+    # every job is kept by its index, as the same job may be listed twice:
+    units = [job_units(job) for job in jobs]
+    ndays = []      # no. of days per segment of every job
+    for i, job in enumerate(jobs):
+        nsegs = math.ceil(costs.predict(units[i]) / segsecs)
+        ndays.append(math.ceil(job.duration / max(1, nsegs)))
+
+    def next_task(i, first):
+        # the job's (predicted) remaining work is its priority:
+        job = jobs[i]
+        last = min(job.duration, first + ndays[i] - 1)
+        if ndays[i] >= job.duration:
+            first, last = 1, job.duration
+        remaining = units[i] * (job.duration - first + 1) / job.duration
+        return (-remaining, next(order),
+                Task(i, job, first, last, cachedir))
+
+    order = itertools.count()   # ties are taken in the order of the jobs
+    tasks = []      # queue of tasks, largest first (a heap)
+    for i, job in enumerate(jobs):
+        start = checkpoint_day(job) + 1 if ndays[i] < job.duration \
+            else 1
+        heapq.heappush(tasks, next_task(i, start))
+
+    times = [0.0] * len(jobs)
+    done = queue.SimpleQueue()
+    running = 0
+    with mp.Pool(nworkers) as pool:
+        while tasks or running:
+            # keep every worker busy with the largest tasks left:
+            while tasks and running < nworkers:
+                task = heapq.heappop(tasks)[2]
+                pool.apply_async(_run_task, (task,), callback=done.put,
+                                 error_callback=done.put)
+                running += 1
+            result = done.get()
+            running -= 1
+            if isinstance(result, BaseException):
+                raise result
+            task, secs, cached = result
+            i, job = task.index, task.job
+            times[i] += secs
+            if not cached:  # a cache hit says nothing of the model's cost
+                costs.update(units[i] * (task.last - task.first + 1) /
+                             job.duration, secs)
+            if task.last < job.duration:
+                heapq.heappush(tasks, next_task(i, task.last + 1))
+            else:
+                print('{} -> {} ({:.2f} s)'.format(
+                    job.fname_in, job.fname_out, times[i]))
+    costs.save()
+    return times
@@ -0,0 +1,402 @@
+"""Bench module.
+
+Benchmark the time and memory use of the model's hot paths:
+    dailydata - reading (parsing) the daily data file, for several file
+                sizes (the bundled data file repeated)
+    initialize - creating the soil layers (SoilLayer.initialize_layer),
+                 for many soil layers of their own soil textures, with a
+                 cold (cleared) and a warm cache of the soil hydraulic
+                 properties (see pedotransfer.hydraulics)
+    balance - the daily water balance (SoilWater.daily_water_balance),
+              for several no. of soil layers and integration intervals
+    facade - a model run, including writing the model output file
+    plot - drawing the charts and saving them to an image file
+    startup - the start-up time of the headless run path (see startup.py),
+              and the forbidden modules (such as matplotlib) it imports
+
+The bundled model input and daily data files (ini.txt and data.txt) are
+used, where profiles with more soil layers are made by splitting the
+soil profile into thinner layers (same total depth).
+
+The benchmark results are saved as a JSON file, so the results of two
+versions of the code can be compared. A benchmark is flagged as a
+regression if it is slower (or uses more memory) than in the earlier
+results by more than a given threshold (percent). The start-up benchmark
+is also a regression if the headless run path imports any forbidden
+module.
+
+How to use:
+
+    python bench.py <flags>
+
+where <flags> are the following:
+    -o <JSON file to save the benchmark results in, optional>
+    -b <JSON file of earlier benchmark results to compare with, optional>
+    -t <time threshold, in percent, optional (default: 20)>
+    -m <memory threshold, in percent, optional (default: 20)>
+    -r <no. of repeats, where the fastest is used, optional (default: 3)>
+    -k <run only benchmarks whose names contain this text, optional>
+    -q <quick run, with fewer and smaller benchmarks, optional>
+
+Exits with error code 1 if any benchmark is a regression.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import contextlib
+import copy
+import getopt
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+from dailydata import DailyData
+from facade import Facade
+import pedotransfer
+from soilwater import SoilWater
+
+
+# benchmark fixtures, bundled with the model:
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+INIFILE = os.path.join(FOLDER, 'ini.txt')
+DATAFILE = os.path.join(FOLDER, 'data.txt')
+
+
+def read_ini():
+    """Model inputs of the bundled model input file."""
+    with open(INIFILE, 'rt') as fin:
+        ini = json.loads(fin.read())
+    ini['dailydatafile'] = DATAFILE
+    return ini
+
+
+def scaled_ini(nlayers, numintervals=None):
+    """Model inputs for a soil profile of a given no. of soil layers.
+
+    The soil profile of the bundled model input file is split into
+    thinner soil layers of equal thickness (same total depth), where
+    every thin layer takes the properties of the layer it lies in.
+
+    Args:
+        nlayers: no. of soil layers
+        numintervals: no. of integration intervals per day. Default: as
+                      given in the bundled model input file
+
+    Returns:
+        Dictionary of the model inputs
+    """
+    ini = read_ini()
+    layers = ini['layers'][:ini['numlayers']]
+    depth = sum(layer['thick'] for layer in layers)
+    thick = depth / nlayers
+    newlayers = []
+    top = 0.0
+    idx = 0
+    for i in range(nlayers):
+        mid = (i + 0.5) * thick
+        while idx < len(layers) - 1 and top + layers[idx]['thick'] < mid:
+            top += layers[idx]['thick']
+            idx += 1
+        layer = copy.deepcopy(layers[idx])
+        layer['thick'] = thick
+        newlayers.append(layer)
+    ini['numlayers'] = nlayers
+    ini['layers'] = newlayers
+    if numintervals is not None:
+        ini['numintervals'] = numintervals
+    return ini
+
+
+def measure(fn, setup=None, repeats=3):
+    """Time and peak memory use of a function.
+
+    The function is timed over several repeats (fastest is used), then
+    run once more to trace its memory use (tracing slows it down).
+
+    Args:
+        fn: function to benchmark, called with the value returned by
+            setup (if any)
+        setup: function called before every call of fn (not timed or
+               traced). Default: None (no setup).
+        repeats: no. of repeats, where the fastest is used
+
+    Returns:
+        Dictionary of the run time ('secs') and the peak memory use
+        ('peakkb', kilobytes)
+    """
+    best = None
+    for _ in range(repeats):
+        args = (setup(),) if setup else ()
+        start = time.perf_counter()
+        fn(*args)
+        secs = time.perf_counter() - start
+        best = secs if best is None else min(best, secs)
+    args = (setup(),) if setup else ()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'secs': best, 'peakkb': peak / 1024}
+
+
+def quiet(fn):
+    """Call a function without printing anything (such as progress)."""
+    def wrapper(*args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn(*args)
+    return wrapper
+
+
+def run_days(model, ndays):
+    """Run the daily water balance of a model for the given no. of days."""
+    dailydata = DailyData(DATAFILE)
+    for day in range(1, ndays + 1):
+        model.daily_water_balance(*dailydata[day])
+
+
+def cases(folder, quick=False):
+    """The benchmarks, as (name, fixture function) tuples.
+
+    The fixtures of a benchmark (such as scaled data files, or a model
+    run) are only made when the benchmark is run, by calling its fixture
+    function, which returns the function to benchmark and its setup
+    function (or None), as for measure.
+
+    Args:
+        folder: folder for temporary files (such as scaled data files)
+        quick: True for fewer and smaller benchmarks
+
+    Returns:
+        List of the benchmarks
+    """
+    bench = []
+
+    # reading the daily data file, for several file sizes:
+    def dailydata_fixture(nrows):
+        with open(DATAFILE, 'rt') as fin:
+            lines = [line for line in fin if line.strip()]
+        fname = os.path.join(folder, 'data{}.txt'.format(nrows))
+        with open(fname, 'wt') as fout:
+            for i in range(nrows):
+                fout.write(lines[i % len(lines)])
+        return lambda: DailyData(fname), None
+
+    for nrows in ([1000] if quick else [1000, 10000, 100000]):
+        bench.append(('dailydata_{}rows'.format(nrows),
+                      lambda nrows=nrows: dailydata_fixture(nrows)))
+
+    # creating the soil layers, for many soil layers, where every layer
+    #    is given its own soil texture (clay and sand offset by the layer
+    #    no.), and the cache of the soil hydraulic properties is either
+    #    cleared (cold) or filled (warm) before every repeat:
+    def initialize_fixture(nlayers, warm):
+        ini = scaled_ini(nlayers)
+        for i, layer in enumerate(ini['layers']):
+            texture = dict(layer['texture'])
+            texture['clay'] += 0.001 * i
+            texture['sand'] += 0.001 * i
+            layer['texture'] = texture
+
+        def setup():
+            pedotransfer.hydraulics.cache_clear()
+            if warm:
+                SoilWater(ini)
+            return ini
+        return SoilWater, setup
+
+    for nlayers in ([10, 100] if quick else [10, 100, 1000]):
+        for warm in [False, True]:
+            bench.append(('initialize_{}layers{}'.format(
+                nlayers, '_warm' if warm else ''),
+                lambda nlayers=nlayers, warm=warm:
+                initialize_fixture(nlayers, warm)))
+
+    # daily water balance, for no. of soil layers and intervals:
+    def balance_fixture(nlayers, nintervals, ndays=30):
+        ini = scaled_ini(nlayers, nintervals)
+        return lambda model: run_days(model, ndays), lambda: SoilWater(ini)
+
+    for nlayers in ([3, 10] if quick else [3, 10, 50]):
+        for nintervals in ([10] if quick else [10, 50]):
+            bench.append(('balance_{}layers_{}intervals'.format(
+                nlayers, nintervals),
+                lambda nlayers=nlayers, nintervals=nintervals:
+                balance_fixture(nlayers, nintervals)))
+
+    # a model run, including writing the model output file:
+    fname_out = os.path.join(folder, 'out.txt')
+    duration = 90 if quick else 365
+    bench.append(('facade_{}days'.format(duration),
+                  lambda: (quiet(lambda fac: fac.run(duration)),
+                           lambda: Facade(read_ini(), fname_out))))
+
+    # drawing the charts and saving them to an image file, of a model run
+    #    made once for all the charts:
+    ran = []
+
+    def plot_fixture(basic):
+        if not ran:
+            fac = Facade(read_ini(), os.path.join(folder, 'plotout.txt'))
+            quiet(fac.run)(90)
+            ran.append(fac)
+        fname = os.path.join(folder, 'chart.png')
+        return (lambda plot: plot.render(fname, basic),
+                lambda: new_plot(ran[0]))
+
+    for basic in [True, False]:
+        bench.append(('plot_' + ('basic' if basic else 'detailed'),
+                      lambda basic=basic: plot_fixture(basic)))
+    return bench
+
+
+def new_plot(fac):
+    """New Plot object for the model results of a model run."""
+    from plot import Plot   # charting modules only needed to plot
+    plot = Plot(fac.ini, fac.fname_out)
+    plot.results = fac.results
+    return plot
+
+
+def run_benchmarks(repeats=3, keyword=None, quick=False):
+    """Run all the benchmarks.
+
+    Args:
+        repeats: no. of repeats, where the fastest is used
+        keyword: run only the benchmarks whose names contain this text.
+                 Default: None (run all the benchmarks).
+        quick: True for fewer and smaller benchmarks
+
+    Returns:
+        Dictionary of the benchmark results, indexed by benchmark name
+    """
+    results = {}
+    folder = tempfile.mkdtemp()
+    try:
+        for name, fixture in cases(folder, quick):
+            if keyword and keyword not in name:
+                continue
+            fn, setup = fixture()   # only the selected fixtures are made
+            results[name] = measure(fn, setup, repeats)
+            print('{:<32s}{:>10.4f} s{:>12.1f} KB'.format(
+                name, results[name]['secs'], results[name]['peakkb']))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if not keyword or keyword in 'startup':
+        import startup
+        msec, forbidden = startup.check_startup(repeats)
+        results['startup'] = {'secs': msec / 1000, 'forbidden': forbidden}
+        print('{:<32s}{:>10.4f} s{}'.format(
+            'startup', msec / 1000, '  imports ' + ', '.join(forbidden)
+            if forbidden else ''))
+    return results
+
+
+def compare(results, baseline, timepct=20.0, mempct=20.0):
+    """Compare benchmark results with earlier results.
+
+    Args:
+        results: dictionary of the benchmark results
+        baseline: dictionary of the earlier benchmark results
+        timepct: a benchmark slower by more than this (percent) is a
+                 regression
+        mempct: a benchmark using more memory by more than this (percent)
+                is a regression
+
+    Returns:
+        List of the regressions, as (benchmark name, measure, earlier
+        value, value) tuples, where the measure 'forbidden' has the lists
+        of forbidden modules imported (a regression if any, whatever the
+        earlier results)
+    """
+    regressions = []
+    thresholds = {'secs': timepct, 'peakkb': mempct}
+    for name, values in sorted(results.items()):
+        if values.get('forbidden'):
+            regressions.append((name, 'forbidden',
+                                baseline.get(name, {}).get('forbidden', []),
+                                values['forbidden']))
+        for key, pct in thresholds.items():
+            old = baseline.get(name, {}).get(key)
+            new = values.get(key)
+            if old is None or new is None:
+                continue    # not benchmarked in both
+            if new > old * (1 + pct / 100):
+                regressions.append((name, key, old, new))
+    return regressions
+
+
+def main(argv):
+    """Main entry point for the benchmarks.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    try:
+        fname_out = fname_base = keyword = None
+        timepct = mempct = 20.0
+        repeats = 3
+        quick = False
+        opts, a = getopt.getopt(argv, "ho:b:t:m:r:k:q")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-o':           # benchmark results file flag
+                fname_out = arg
+            elif opt == '-b':           # earlier benchmark results flag
+                fname_base = arg
+            elif opt == '-t':           # time threshold flag
+                timepct = float(arg)
+            elif opt == '-m':           # memory threshold flag
+                mempct = float(arg)
+            elif opt == '-r':           # no. of repeats flag
+                repeats = int(arg)
+            elif opt == '-k':           # benchmark names flag
+                keyword = arg
+            elif opt == '-q':           # quick run flag
+                quick = True
+
+        results = run_benchmarks(repeats, keyword, quick)
+        if fname_out:
+            with open(fname_out, 'wt') as fout:
+                json.dump({'python': platform.python_version(),
+                           'platform': platform.platform(),
+                           'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'benchmarks': results}, fout, indent=2)
+
+        if fname_base:
+            with open(fname_base, 'rt') as fin:
+                baseline = json.load(fin)['benchmarks']
+            regressions = compare(results, baseline, timepct, mempct)
+            for name, key, old, new in regressions:
+                if key == 'forbidden':
+                    print('Regression: {} imports forbidden modules:'
+                          ' {}'.format(name, ', '.join(new)))
+                    continue
+                print('Regression: {} {} {:.4g} -> {:.4g} ({:+.0f}%)'.format(
+                    name, key, old, new, (new / old - 1) * 100))
+            if regressions:
+                return 1
+            print('No regressions.')
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
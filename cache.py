@@ -0,0 +1,172 @@
+"""Cache module.
+
+On-disk cache of model results, so that repeated model runs of the same
+scenario need not be simulated again. Each cache entry is addressed by a
+hash of everything that affects the model results: the model inputs, the
+contents of the daily data file, the simulation duration, any engine
+options, and the model version.
+
+The cache is bounded in size. When the size limit is exceeded, the least
+recently used entries are removed first.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from soilwater import __version__
+
+
+class ResultCache(object):
+    """ResultCache class.
+
+    Store and retrieve model results (and model output files) on disk.
+
+    Every cache entry has two files, named after the entry's key:
+        <key>.json - the model results
+        <key>.out - the model output file
+
+    ATTRIBUTES:
+        folder - folder where the cache entries are stored
+        maxbytes - maximum total size of all cache entries (bytes)
+
+    METHODS:
+        Statics:
+            make_key - hash of the model inputs and options
+
+        get - retrieve model results and output file from cache
+        put - store model results and output file into cache
+        evict - remove least recently used entries if cache is too big
+        clear - remove all cache entries
+    """
+
+    def __init__(self, folder, maxbytes=100 * 2 ** 20):
+        """Create the ResultCache object.
+
+        Args:
+            folder: folder where the cache entries are stored
+                    (created if it does not exist)
+            maxbytes: maximum total size of all cache entries (bytes).
+                      Default is 100 MB.
+        """
+        self.folder = folder
+        self.maxbytes = maxbytes
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def make_key(ini, duration, options=None):
+        """Hash of the model inputs and options.
+
+        Note:
+            The model inputs are normalized first, so that key order,
+            whitespace, unused soil layers, and the name (location) of
+            the daily data file do not change the key. The contents of
+            the daily data file are used instead.
+
+        Args:
+            ini: model inputs read from the model input text file
+            duration: no. of daily simulation days (days)
+            options: dictionary of any other options affecting the
+                     model results. Default: no options.
+
+        Returns:
+            The key, as a hexadecimal string
+        """
+        norm = dict(ini)
+        datafile = norm.pop('dailydatafile')
+        norm['layers'] = norm['layers'][:norm['numlayers']]
+        h = hashlib.sha256()
+        h.update(json.dumps([norm, duration, options or {}, __version__],
+                            sort_keys=True).encode())
+        with open(datafile, 'rb') as f:
+            for block in iter(lambda: f.read(2 ** 16), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _path(self, key, ext):
+        """Full path and name of a given cache entry file."""
+        return os.path.join(self.folder, key + ext)
+
+    def get(self, key, fname_out=None):
+        """Retrieve model results and output file from cache.
+
+        Args:
+            key: key of the cache entry
+            fname_out: copy the cached model output file to this file.
+                       Default: do not copy.
+
+        Returns:
+            Dictionary containing the model results, or None if the key
+            is not in the cache
+        """
+        fjson = self._path(key, '.json')
+        fout = self._path(key, '.out')
+        try:
+            with open(fjson, 'rt') as fin:
+                res = json.loads(fin.read())
+            if fname_out is not None:
+                shutil.copyfile(fout, fname_out)
+        except (OSError, ValueError):
+            return None     # not in cache (or entry is partly evicted)
+        # mark as the most recently used entry:
+        for fname in (fjson, fout):
+            os.utime(fname)
+        return res
+
+    def put(self, key, res, fname_out):
+        """Store model results and output file into cache.
+
+        Args:
+            key: key of the cache entry
+            res: dictionary containing the model results
+            fname_out: model output file
+
+        Returns:
+            None
+        """
+        # write to temporary files first, so other readers never see
+        #    a partly written entry:
+        for ext in ('.out', '.json'):
+            fd, tmp = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+            with os.fdopen(fd, 'wt') as fcache:
+                if ext == '.json':
+                    fcache.write(json.dumps(res))
+                else:
+                    with open(fname_out, 'rt') as fin:
+                        shutil.copyfileobj(fin, fcache)
+            os.replace(tmp, self._path(key, ext))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries if cache is too big."""
+        entries = {}    # total size and last use of every entry
+        for fname in os.listdir(self.folder):
+            key, ext = os.path.splitext(fname)
+            if ext not in ('.json', '.out'):
+                continue
+            st = os.stat(os.path.join(self.folder, fname))
+            size, mtime = entries.get(key, (0, 0.0))
+            entries[key] = (size + st.st_size, max(mtime, st.st_mtime))
+        total = sum(size for size, _ in entries.values())
+        # remove the oldest entries first:
+        for key in sorted(entries, key=lambda k: entries[k][1]):
+            if total <= self.maxbytes:
+                break
+            for ext in ('.json', '.out'):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass    # already removed
+            total -= entries[key][0]
+
+    def clear(self):
+        """Remove all cache entries."""
+        for fname in os.listdir(self.folder):
+            if os.path.splitext(fname)[1] in ('.json', '.out', '.tmp'):
+                os.remove(os.path.join(self.folder, fname))
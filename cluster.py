@@ -0,0 +1,410 @@
+r"""Cluster module.
+
+Distribute model runs over many hosts. A coordinator hands out model run
+tasks to worker processes (on the same or other hosts) over plain TCP
+sockets, and gathers all their model results into one store. Workers run
+the model exactly as a single model run would (via Facade), so the model
+results are the same everywhere.
+
+Workers send heartbeats to the coordinator while they are connected. If a
+worker stops sending heartbeats or its connection is lost, its task is
+given to another worker.
+
+Messages are JSON objects, one per line, with a "type" field:
+    worker to coordinator:
+        hello - {"type": "hello", "name": worker name}
+        heartbeat - {"type": "heartbeat"}
+        result - {"type": "result", "id": task id, "results": {...}}
+        error - {"type": "error", "id": task id, "error": message}
+    coordinator to worker:
+        task - {"type": "task", "id": task id, "task": {...}}
+        stop - {"type": "stop"}
+
+where a task is a JSON object:
+    {
+        "ini": {...} model inputs (as in the model input file), or
+        "inifile": "ini.txt" the model input text file (as seen by the
+                   worker, such as on a shared folder),
+        "dailydatafile": "data.txt" daily data file, optional
+                         (default: as given in the model inputs),
+        "duration": 90 no. of daily simulation days
+    }
+
+How to use:
+
+    python cluster.py <flags>
+
+where <flags> are the following:
+    -c <coordinator host address:port number>
+    -n <worker name, optional (default: host name and process ID)>
+
+starts a worker that keeps running tasks from the given coordinator until
+told to stop. The coordinator itself is started from Python, e.g.:
+
+    coord = Coordinator('0.0.0.0', 9000, fname_store='store.jsonl')
+    store = coord.run([{'inifile': 'ini.txt', 'duration': 90}, ...])
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import asyncio
+from collections import deque
+import contextlib
+import getopt
+import io
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from facade import Facade
+
+
+def _encode(msg):
+    """Encode a message as a line of JSON text (bytes)."""
+    return (json.dumps(msg) + '\n').encode()
+
+
+class Coordinator(object):
+    """Coordinator class.
+
+    Hand out model run tasks to the connected workers, one task at a
+    time per worker, and gather their model results.
+
+    ATTRIBUTES:
+        host - host address to listen on
+        port - port number to listen on
+        timeout - seconds without any message from a worker, after which
+                  the worker is assumed dead and its task reassigned
+        maxattempts - maximum no. of times a task is assigned to workers
+        fname_store - file to append model results to, one JSON object
+                      per line (None to keep the results only in memory)
+        tasks - all the tasks, indexed by task id
+        store - model results of finished tasks, indexed by task id
+        failures - error messages of failed tasks, indexed by task id
+
+    METHODS:
+        handle - handle all messages from a worker connection
+        dispatch - give the next pending task to every idle worker
+        monitor - reassign tasks of workers that stop sending heartbeats
+        serve - serve the workers until all tasks are done
+        run - run the given tasks and return their model results
+    """
+
+    def __init__(self, host='127.0.0.1', port=9000, timeout=10.0,
+                 maxattempts=3, fname_store=None):
+        """Create the Coordinator object.
+
+        Args:
+            host: host address to listen on
+            port: port number to listen on
+            timeout: seconds without any message from a worker, after
+                     which the worker is assumed dead
+            maxattempts: maximum no. of times a task is assigned
+            fname_store: file to append model results to
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.maxattempts = maxattempts
+        self.fname_store = fname_store
+        self.tasks = {}
+        self.store = {}
+        self.failures = {}
+        self.__pending = deque()    # ids of tasks not yet assigned
+        self.__attempts = {}        # no. of times each task was assigned
+        self.__workers = {}         # per worker: assigned task & last seen
+        self.__handlers = set()     # tasks handling worker connections
+        self.__done = None          # set when all tasks are done
+
+    def _finished(self):
+        """True if every task has either finished or failed."""
+        return len(self.store) + len(self.failures) == len(self.tasks)
+
+    def _requeue(self, writer):
+        """Put a worker's assigned task (if any) back into the queue."""
+        info = self.__workers.pop(writer, None)
+        if info is None or info['task'] is None:
+            return
+        taskid = info['task']
+        if taskid in self.store or taskid in self.failures:
+            return
+        if self.__attempts[taskid] >= self.maxattempts:
+            self.failures[taskid] = 'worker lost too many times'
+        else:
+            self.__pending.appendleft(taskid)   # retry it first
+
+    def dispatch(self):
+        """Give the next pending task to every idle worker."""
+        for writer, info in self.__workers.items():
+            if info['task'] is not None:
+                continue
+            while self.__pending:
+                taskid = self.__pending.popleft()
+                if taskid not in self.store and \
+                        taskid not in self.failures:
+                    break
+            else:
+                break   # no more pending tasks
+            info['task'] = taskid
+            self.__attempts[taskid] += 1
+            writer.write(_encode({'type': 'task', 'id': taskid,
+                                  'task': self.tasks[taskid]}))
+        if self._finished():
+            self.__done.set()
+
+    def _record(self, msg):
+        """Record the model results (or error) of a task."""
+        taskid = msg['id']
+        if taskid in self.store or taskid in self.failures:
+            return  # already finished by another worker
+        if msg['type'] == 'error':
+            self.failures[taskid] = msg['error']
+            return
+        self.store[taskid] = msg['results']
+        if self.fname_store is not None:
+            with open(self.fname_store, 'at') as fout:
+                fout.write(json.dumps({'id': taskid,
+                                       'task': self.tasks[taskid],
+                                       'results': msg['results']}))
+                fout.write('\n')
+
+    async def handle(self, reader, writer):
+        """Handle all messages from a worker connection.
+
+        Args:
+            reader: asyncio stream reader of the connection
+            writer: asyncio stream writer of the connection
+
+        Returns:
+            None
+        """
+        self.__workers[writer] = {'task': None, 'seen': time.monotonic()}
+        self.__handlers.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break   # worker closed the connection
+                msg = json.loads(line.decode())
+                info = self.__workers.get(writer)
+                if info is None:
+                    break   # worker was assumed dead, so drop it
+                info['seen'] = time.monotonic()
+                if msg['type'] in ('result', 'error'):
+                    self._record(msg)
+                    if info['task'] == msg['id']:
+                        info['task'] = None
+                self.dispatch()
+                await writer.drain()
+        except (ValueError, KeyError, ConnectionError):
+            pass    # malformed message or worker went away
+        finally:
+            self.__handlers.discard(asyncio.current_task())
+            self._requeue(writer)
+            self.dispatch()
+            writer.close()
+
+    async def monitor(self):
+        """Reassign the tasks of workers that stop sending heartbeats."""
+        while True:
+            await asyncio.sleep(self.timeout / 4)
+            now = time.monotonic()
+            for writer, info in list(self.__workers.items()):
+                if now - info['seen'] > self.timeout:
+                    self._requeue(writer)
+                    writer.close()
+            self.dispatch()
+
+    async def serve(self):
+        """Serve the workers until all tasks are done."""
+        self.__done = asyncio.Event()
+        server = await asyncio.start_server(self.handle, self.host,
+                                            self.port, limit=2 ** 30)
+        monitor = asyncio.ensure_future(self.monitor())
+        try:
+            async with server:
+                if not self._finished():
+                    await self.__done.wait()
+                # tell all the workers to stop:
+                for writer in list(self.__workers):
+                    writer.write(_encode({'type': 'stop'}))
+                    with contextlib.suppress(ConnectionError):
+                        await writer.drain()
+                    writer.close()
+                # wait for the workers to close their connections:
+                if self.__handlers:
+                    await asyncio.wait(self.__handlers,
+                                       timeout=self.timeout)
+        finally:
+            monitor.cancel()
+
+    def run(self, tasks):
+        """Run the given tasks and return their model results.
+
+        Blocks until every task has either finished or failed.
+
+        Args:
+            tasks: a list of tasks (see this module's docstring)
+
+        Returns:
+            Dictionary of the model results, indexed by the task's
+            position in the given list. Failed tasks are kept in the
+            failures attribute instead.
+        """
+        for task in tasks:
+            taskid = len(self.tasks)
+            self.tasks[taskid] = task
+            self.__attempts[taskid] = 0
+            self.__pending.append(taskid)
+        asyncio.run(self.serve())
+        return self.store
+
+
+class Worker(object):
+    """Worker class.
+
+    Connect to a coordinator, and run the model for every task given,
+    until told to stop or the connection is lost.
+
+    ATTRIBUTES:
+        host - host address of the coordinator
+        port - port number of the coordinator
+        name - name of this worker
+        interval - seconds between heartbeats
+
+    METHODS:
+        Statics:
+            run_task - run the model for a given task
+
+        serve - run tasks from the coordinator until told to stop
+    """
+
+    def __init__(self, host, port, name=None, interval=2.0):
+        """Create the Worker object.
+
+        Args:
+            host: host address of the coordinator
+            port: port number of the coordinator
+            name: name of this worker. Default: host name and process ID
+            interval: seconds between heartbeats
+        """
+        self.host = host
+        self.port = port
+        self.name = name or '{}:{}'.format(socket.gethostname(),
+                                           os.getpid())
+        self.interval = interval
+
+    @staticmethod
+    def run_task(task):
+        """Run the model for a given task.
+
+        Args:
+            task: the task (see this module's docstring)
+
+        Returns:
+            Dictionary containing the model results, same as Facade's
+        """
+        ini = task.get('ini')
+        if ini is None:
+            with open(task['inifile'], 'rt') as fin:
+                ini = json.loads(fin.read())
+        if 'dailydatafile' in task:
+            ini = dict(ini, dailydatafile=task['dailydatafile'])
+        fd, fname_out = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
+        try:
+            # run the model quietly (no progress bar):
+            with contextlib.redirect_stdout(io.StringIO()):
+                return Facade(ini, fname_out).run(task['duration'])
+        finally:
+            os.remove(fname_out)
+
+    def serve(self):
+        """Run tasks from the coordinator until told to stop."""
+        sock = socket.create_connection((self.host, self.port))
+        lock = threading.Lock()     # one message sent at a time
+        stopped = threading.Event()
+
+        def send(msg):
+            with lock:
+                sock.sendall(_encode(msg))
+
+        def heartbeat():
+            while not stopped.wait(self.interval):
+                try:
+                    send({'type': 'heartbeat'})
+                except OSError:
+                    break   # connection lost
+
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        try:
+            send({'type': 'hello', 'name': self.name})
+            beat.start()
+            for line in sock.makefile('rb'):
+                msg = json.loads(line.decode())
+                if msg['type'] == 'stop':
+                    break
+                try:
+                    res = Worker.run_task(msg['task'])
+                    send({'type': 'result', 'id': msg['id'],
+                          'results': res})
+                except Exception as e:
+                    send({'type': 'error', 'id': msg['id'],
+                          'error': repr(e)})
+        except (OSError, ValueError):
+            pass    # connection lost
+        finally:
+            stopped.set()
+            sock.close()
+
+
+def main(argv):
+    """Main entry point for a worker.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        address = name = None
+        opts, a = getopt.getopt(argv, "hc:n:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-c':           # coordinator address flag
+                address = arg
+            elif opt == '-n':           # worker name flag
+                name = arg
+
+        if address is None:
+            print('Flag -c is missing. Flag -n is optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        host, _, port = address.rpartition(':')
+        Worker(host, int(port), name).serve()
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+    except Exception:
+        print('Error encountered. Aborting.')
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(1)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,284 @@
+"""Compare module.
+
+Plot charts to compare the model results of many model runs (such as
+scenarios of soil texture or ensembles of the daily data) on the same
+axes. The model results of every run are drawn together, as one
+collection of lines per chart (rather than one line per run), and the
+spread across the runs can be shown as percentile bands (such as the 5th
+to 95th percentiles), computed for all days at once.
+
+Like the plot module, the lines are decimated for display to about the
+width of the charts (in pixels), for all runs at once, so charts of even
+a thousand runs can be zoomed and panned. Zooming into a chart redraws
+the zoomed part from the full (undecimated) model results.
+
+Requires matplotlib and numpy.
+
+Example:
+    from compare import Compare
+
+    cmp = Compare.from_outputs(['out1.txt', 'out2.txt', 'out3.txt'])
+    cmp.plot(['rootvwc', 'layer1_vwc'], bands=(5, 95))
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+import matplotlib.pyplot as plt
+import numpy as np
+
+import decimate
+from plot import Plot
+from results import LAYER_FIELD, load_results
+
+
+class Compare(object):
+    """Compare class.
+
+    Plot charts to compare the model results of many model runs.
+
+    Note:
+        All the model runs must have the same duration (no. of days).
+
+    ATTRIBUTES:
+        runs - model results of every model run (list of dictionaries)
+        labels - name of every model run
+        maxlabeled - max. no. of runs drawn in their own colors (and
+                     named in the legend); more runs are drawn in one
+                     (translucent) color
+
+    METHODS:
+        Class:
+            from_outputs - create a Compare object for the model results
+                           saved in model output files
+            from_ensemble - create a Compare object for the members of
+                            an ensemble (see the ensemble module)
+
+        field - values of a model output, for every run and day
+        percentiles - percentiles of a model output across the runs
+        npoints - no. of points to draw per run in a chart
+        plot_runs - plot a model output of every run, as one collection
+        plot_bands - plot the percentile bands of a model output
+        refresh_runs - redraw the runs for the visible x-axis range
+        draw - draw a chart for every given model output
+        plot - draw the charts and show them in a window
+        render - draw the charts and save them to an image file
+    """
+
+    maxlabeled = 9
+
+    def __init__(self, runs, labels=None):
+        """Create the Compare object.
+
+        Args:
+            runs: model results of every model run (list of dictionaries,
+                  such as given by Facade.run or results.load_results)
+            labels: name of every model run. Default: run1, run2, ...
+        """
+        self.runs = runs
+        self.labels = labels or ['run' + str(i + 1)
+                                 for i in range(len(runs))]
+        self.__fields = {}      # values of the model outputs, by name
+        self.__lines = {}       # line collection of runs in every chart
+
+    @classmethod
+    def from_outputs(cls, fnames):
+        """Create a Compare object for the model results of earlier runs.
+
+        Args:
+            fnames: model output files (see results.load_results)
+
+        Returns:
+            The Compare object, where the runs are named by their files
+        """
+        return cls([load_results(fname) for fname in fnames], fnames)
+
+    @classmethod
+    def from_ensemble(cls, ensemble):
+        """Create a Compare object for the members of a (run) ensemble.
+
+        Args:
+            ensemble: the Ensemble object, after it has been run
+
+        Returns:
+            The Compare object, where the runs are the ensemble members
+        """
+        nmembers = ensemble.results.shape[0]
+        cmp = cls([None] * nmembers,
+                  ['member' + str(i + 1) for i in range(nmembers)])
+        for i, name in enumerate(ensemble.fields):
+            cmp.__fields[name] = ensemble.results[:, :, i]
+        return cmp
+
+    def field(self, name):
+        """Values of a model output, for every run and day.
+
+        Args:
+            name: name of the model output, e.g., 'rootvwc' or
+                  'layer1_vwc' (see Facade.output_fields)
+
+        Returns:
+            Array of (runs x days)
+        """
+        if name not in self.__fields:
+            match = LAYER_FIELD.match(name)
+            if match is None:
+                vals = [res[name] for res in self.runs]
+            else:
+                idx = int(match.group(1)) - 1
+                vals = [res['layers'][idx][match.group(2)]
+                        for res in self.runs]
+            self.__fields[name] = np.array(vals, dtype=float)
+        return self.__fields[name]
+
+    def percentiles(self, name, pcts):
+        """Percentiles of a model output across the runs, for every day.
+
+        Args:
+            name: name of the model output, e.g., 'rootvwc'
+            pcts: list of percentiles (0 to 100), e.g., [5, 50, 95]
+
+        Returns:
+            Array of (percentiles x days)
+        """
+        return np.percentile(self.field(name), pcts, axis=0)
+
+    def npoints(self, ax):
+        """No. of points to draw per run, based on the chart width."""
+        width = ax.get_window_extent().width    # in pixels
+        return max(10, int(width))
+
+    def plot_runs(self, ax, name):
+        """Plot a model output of every run, as one collection of lines.
+
+        Args:
+            ax: axes object
+            name: name of the model output, e.g., 'rootvwc'
+
+        Returns:
+            The plotted lines (LineCollection object)
+        """
+        nruns = len(self.labels)
+        if nruns <= Compare.maxlabeled:
+            colors = [Plot.color(i) for i in range(nruns)]
+            lines = LineCollection([], colors=colors, lw=2)
+            for label, color in zip(self.labels, colors):
+                ax.plot([], [], lw=2, color=color, label=label)
+        else:
+            # too many runs to tell apart, so show their density instead:
+            alpha = min(1.0, max(0.02, 10.0 / nruns))
+            lines = LineCollection([], colors=Plot.color(2), lw=1,
+                                   alpha=alpha)
+            ax.plot([], [], lw=1, color=Plot.color(2),
+                    label='{} runs'.format(nruns))
+        ax.add_collection(lines)
+        self.__lines[ax] = (lines, name)
+        ax.callbacks.connect('xlim_changed', self.refresh_runs)
+        y = self.field(name)
+        ax.update_datalim([(1, np.nanmin(y)), (y.shape[1], np.nanmax(y))])
+        ax.autoscale_view()
+        self.refresh_runs(ax)
+        return lines
+
+    def plot_bands(self, ax, name, lower=5, upper=95):
+        """Plot a percentile band and the median of a model output.
+
+        Args:
+            ax: axes object
+            name: name of the model output, e.g., 'rootvwc'
+            lower: lower percentile of the band (0 to 100)
+            upper: upper percentile of the band (0 to 100)
+
+        Returns:
+            None
+        """
+        lo, median, hi = self.percentiles(name, [lower, 50, upper])
+        x = np.arange(1, len(median) + 1)
+        ax.fill_between(x, lo, hi, color=Plot.color(1), alpha=0.3,
+                        lw=0, label='{:g}-{:g}%'.format(lower, upper))
+        ax.plot(x, median, lw=2, color=Plot.color(1), label='median')
+
+    def refresh_runs(self, ax):
+        """Redraw the runs of a chart for its visible x-axis range.
+
+        Called whenever the chart's x-axis range changes (such as when
+        zooming or panning), so that zooming in shows the full data.
+
+        Args:
+            ax: axes object
+
+        Returns:
+            None
+        """
+        lines, name = self.__lines[ax]
+        y = self.field(name)
+        x0, x1 = sorted(ax.get_xlim())
+        # visible days (day 1 is at index 0), plus one more on each side:
+        lo = min(max(0, int(np.floor(x0)) - 2), y.shape[1] - 1)
+        hi = max(min(y.shape[1], int(np.ceil(x1)) + 1), lo + 1)
+        x = np.arange(lo + 1, hi + 1)
+        xd, yd = decimate.minmax_rows(x, y[:, lo:hi],
+                                      self.npoints(ax) // 2)
+        lines.set_segments(np.stack([xd, yd], axis=2))
+
+    def draw(self, fig, names, bands=None):
+        """Draw a chart for every given model output, one below another.
+
+        Args:
+            fig: the figure to draw in
+            names: names of the model outputs, e.g., ['rootvwc']
+            bands: lower and upper percentiles of the bands to show,
+                   e.g., (5, 95). Default: None (no bands).
+
+        Returns:
+            None
+        """
+        axs = []
+        for i, name in enumerate(names):
+            ax = fig.add_subplot(len(names), 1, i + 1,
+                                 sharex=axs[0] if axs else None)
+            self.plot_runs(ax, name)
+            if bands:
+                self.plot_bands(ax, name, *bands)
+            ax.set_ylabel(name)
+            axs.append(ax)
+        ndays = self.field(names[0]).shape[1]
+        for ax in axs[:-1]:
+            plt.setp(ax.get_xticklabels(), visible=False)
+        axs[-1].set_xlim(1, ndays)
+        axs[-1].set_xlabel('days')
+        axs[0].legend(loc='upper left',
+                      ncol=min(len(self.labels), Compare.maxlabeled) + 2)
+        Plot.turnon_grid(axs)
+
+    def plot(self, names, bands=None):
+        """Draw the charts (see draw) and show them in a window."""
+        fig = plt.gcf()
+        self.draw(fig, names, bands)
+        mng = plt.get_current_fig_manager()
+        mng.set_window_title('Pywaterbal (compare)')
+        plt.show()
+
+    def render(self, fname, names, bands=None, figsize=(19.2, 10.8),
+               dpi=100):
+        """Draw the charts (see draw) and save them to an image file.
+
+        Args:
+            fname: name of image file
+            names: names of the model outputs, e.g., ['rootvwc']
+            bands: lower and upper percentiles of the bands to show
+            figsize: width and height of the image (inches)
+            dpi: resolution of the image (dots per inch)
+
+        Returns:
+            The drawn figure
+        """
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        self.draw(fig, names, bands)
+        fig.savefig(fname)
+        return fig
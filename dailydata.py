@@ -4,11 +4,51 @@ Reads all data from a plain text file and stores them in a list which can
 then be indexed to be read back. List will be 'rewound' or 'reset' to the
 top of the list if the end of the list is reached.
 
+Daily data files read again and again (such as by the worker processes
+of the model server) are best read through load_dailydata, which keeps
+the last few files read, and reads a file again only once it changes.
+
 @author Christopher Teh Boon Sung
 
 """
 
 
+from collections import OrderedDict
+import os
+
+
+# max. no. of daily data files kept by load_dailydata
+MAXFILES = 16
+
+# daily data files read by load_dailydata, as (file stamp, DailyData
+#    object) tuples, indexed by file name, least recently used first
+_loaded = OrderedDict()
+
+
+def load_dailydata(fname):
+    """DailyData object of a file, read again only if the file changed.
+
+    Only the last MAXFILES files read are kept, and only the latest
+    contents of every file, so the memory used is bounded.
+
+    Args:
+        fname: name of plain text file containing the data
+
+    Returns:
+        The DailyData object (shared, so not to be changed)
+    """
+    fname = os.path.abspath(fname)
+    st = os.stat(fname)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _loaded.pop(fname, None)
+    if entry is None or entry[0] != stamp:
+        entry = (stamp, DailyData(fname))   # new, or changed since
+    _loaded[fname] = entry  # now the most recently used
+    if len(_loaded) > MAXFILES:
+        _loaded.popitem(last=False)
+    return entry[1]
+
+
 class DailyData(object):
     """DailyData class.
 
@@ -0,0 +1,171 @@
+"""Decimate module.
+
+Reduce (decimate) the number of points in a data series for display, so
+that long series (such as many years of daily data) can be drawn quickly,
+while still keeping the shape of the series. A chart can only show as
+many points as it has pixels, so there is little use in drawing more.
+
+Decimation methods:
+    minmax - keep the minimum and maximum points within every bin, so
+             that the envelope (all the peaks and troughs) of the series
+             is kept
+    lttb - largest triangle three buckets: keep the one point in every
+           bucket that forms the largest triangle with its neighbouring
+           points, so that the visual shape of the series is kept
+    binmax - keep only the maximum point within every bin (for bars)
+    minmax_rows - minmax for many series (rows) at once, all sharing the
+                  same x values
+
+Requires numpy.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import numpy as np
+
+
+def _blocks(n, nbins):
+    """Start index of every bin, where all bins are of equal size.
+
+    The last bin includes any remaining points.
+    """
+    return np.arange(nbins) * (n // nbins)
+
+
+def _reduceat(fn, y, starts):
+    """Index of the point picked by fn (argmin/argmax) within every bin."""
+    n = len(y)
+    k = n // len(starts)
+    nfull = len(starts) * k
+    idx = starts + fn(y[:nfull].reshape(len(starts), k), axis=1)
+    if nfull < n:
+        # the remaining points belong to the last bin:
+        last = nfull + fn(y[nfull:])
+        if fn is np.argmax:
+            better = y[last] > y[idx[-1]]
+        else:
+            better = y[last] < y[idx[-1]]
+        if better:
+            idx[-1] = last
+    return idx
+
+
+def minmax(x, y, nbins):
+    """Keep the minimum and maximum points within every bin.
+
+    Args:
+        x: series of x values
+        y: series of y values
+        nbins: number of bins (usually the chart width, in pixels)
+
+    Returns:
+        Tuple of the decimated x and y values (numpy arrays), where the
+        first and last points are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if nbins < 1 or n <= 2 * nbins:
+        return x, y     # too few points to decimate
+    starts = _blocks(n, nbins)
+    idx = np.concatenate([_reduceat(np.argmin, y, starts),
+                          _reduceat(np.argmax, y, starts), [0, n - 1]])
+    idx = np.unique(idx)    # also sorts the points in order
+    return x[idx], y[idx]
+
+
+def minmax_rows(x, y, nbins):
+    """Keep the minimum and maximum points within every bin, of every row.
+
+    Same as minmax, but for many series (such as many model runs) sharing
+    the same x values, decimated all at once. Every row keeps the same
+    no. of points, but not necessarily at the same x values.
+
+    Args:
+        x: series of x values
+        y: 2D array of y values, one series per row
+        nbins: number of bins (usually the chart width, in pixels)
+
+    Returns:
+        Tuple of the decimated x and y values (2D numpy arrays, one row
+        per series), where the first and last points are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    nrows, n = y.shape
+    if nbins < 1 or n <= 2 * nbins + 2:
+        return np.broadcast_to(x, y.shape), y   # too few to decimate
+    k = -(-n // nbins)      # bin size (the last bin may be padded)
+    padded = np.pad(y, ((0, 0), (0, nbins * k - n)), mode='edge')
+    bins = padded.reshape(nrows, nbins, k)
+    starts = np.arange(nbins) * k
+    imin = starts + np.argmin(bins, axis=2)
+    imax = starts + np.argmax(bins, axis=2)
+    # keep the points in order within every bin:
+    idx = np.empty((nrows, 2 * nbins + 2), dtype=int)
+    idx[:, 0] = 0
+    idx[:, 1:-1:2] = np.minimum(imin, imax)
+    idx[:, 2:-1:2] = np.maximum(imin, imax)
+    idx[:, -1] = n - 1
+    idx = np.minimum(idx, n - 1)    # padded points are the last point
+    return x[idx], np.take_along_axis(y, idx, axis=1)
+
+
+def binmax(x, y, nbins):
+    """Keep only the maximum point within every bin.
+
+    Args:
+        x: series of x values
+        y: series of y values
+        nbins: number of bins (usually the chart width, in pixels)
+
+    Returns:
+        Tuple of the decimated x and y values (numpy arrays)
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if nbins < 1 or n <= nbins:
+        return x, y     # too few points to decimate
+    idx = _reduceat(np.argmax, y, _blocks(n, nbins))
+    return x[idx], y[idx]
+
+
+def lttb(x, y, nout):
+    """Largest triangle three buckets decimation.
+
+    Args:
+        x: series of x values
+        y: series of y values
+        nout: number of points to keep (at least 3)
+
+    Returns:
+        Tuple of the decimated x and y values (numpy arrays), where the
+        first and last points are always kept
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if nout < 3 or n <= nout:
+        return x, y     # too few points to decimate
+    # bucket edges, excluding the first and last points:
+    edges = np.linspace(1, n - 1, nout - 1).astype(int)
+    idx = np.empty(nout, dtype=int)
+    idx[0] = 0
+    idx[-1] = n - 1
+    a = 0   # the point picked in the previous bucket
+    for i in range(nout - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # average point of the next bucket (the last point if none):
+        nlo = hi
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        xc = x[nlo:nhi].mean()
+        yc = y[nlo:nhi].mean()
+        # pick the point forming the largest triangle with a and c:
+        area = np.abs((x[a] - xc) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (yc - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
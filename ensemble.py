@@ -0,0 +1,265 @@
+"""Ensemble module.
+
+Run a Monte Carlo ensemble of the soil water model over several worker
+processes. The daily data file is read only once, and its values are
+placed in shared memory, so that every worker reads the same copy of the
+data (no re-reading, re-parsing, or pickling of the data per worker).
+
+Each ensemble member perturbs the rain, potential ET, and soil texture
+with its own reproducible random stream, so that a given member always
+gives the same results, regardless of the number of workers or the order
+the members are run. The daily results of all members are written by the
+workers directly into one shared results array.
+
+Requires Python 3.8 or higher and numpy.
+
+Example:
+    from ensemble import Ensemble
+
+    if __name__ == '__main__':
+        ens = Ensemble('ini.txt', 100, seed=1, rainsd=0.2, petsd=0.1)
+        ens.run(90)
+        rootvwc = ens.field('rootvwc')  # (members x days) array
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import copy
+import json
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from dailydata import DailyData
+from facade import Facade
+from soilwater import SoilWater
+
+
+class SharedArray(object):
+    """Shared array class.
+
+    A numpy array (of floats) whose values are stored in a shared memory
+    block, so that the array can be read or written by other processes
+    without copying.
+
+    ATTRIBUTES:
+        shape - shape of the array
+        shm - the shared memory block
+        array - the numpy array (a view of the shared memory block)
+
+    METHODS:
+        spec - name and shape of the array, to attach to the array
+               from another process
+        close - detach from the shared memory block
+        unlink - free the shared memory block (only by its creator)
+    """
+
+    def __init__(self, shape, name=None):
+        """Create or attach to the SharedArray object.
+
+        Args:
+            shape: shape of the array
+            name: name of an existing shared memory block to attach to.
+                  Default: create a new shared memory block.
+        """
+        self.shape = tuple(shape)
+        if name is None:
+            nbytes = max(1, int(np.prod(self.shape))) * 8
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.array = np.ndarray(self.shape, dtype=np.float64,
+                                buffer=self.shm.buf)
+
+    def spec(self):
+        """Name and shape, to attach to this array from another process."""
+        return self.shape, self.shm.name
+
+    def close(self):
+        """Detach from the shared memory block."""
+        self.array = None   # release the view before closing
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory block (only by its creator)."""
+        self.shm.unlink()
+
+
+# worker process globals, set only once for every worker process:
+#    ensemble - the Ensemble object
+#    duration - no. of daily simulation days (days)
+#    forcing - daily data (shared) array, one row per day
+#    results - model results (shared) array
+_worker = {}
+
+
+def _init_worker(ensemble, duration, forcingspec, resultspec):
+    """Attach the worker process to the shared arrays."""
+    _worker['ensemble'] = ensemble
+    _worker['duration'] = duration
+    _worker['forcing'] = SharedArray(*forcingspec)
+    _worker['results'] = SharedArray(*resultspec)
+
+
+def _run_member(member):
+    """Run the model for a given member (in a worker process)."""
+    ensemble = _worker['ensemble']
+    duration = _worker['duration']
+    forcing = _worker['forcing'].array
+    out = _worker['results'].array[member]
+    ini, rainmult, petmult = ensemble.perturbations(member, duration)
+    model = SoilWater(ini)
+    nrows = forcing.shape[0]
+    for i in range(duration):
+        # list is rewound to the top if its end is reached (as DailyData)
+        rain, lai, petcrop, petsoil = forcing[i % nrows].tolist()
+        rain *= rainmult[i]
+        petcrop *= petmult[i]
+        petsoil *= petmult[i]
+        model.daily_water_balance(rain, lai, petcrop, petsoil)
+        out[i] = Facade.daily_outputs(model, rain)
+    return member
+
+
+class Ensemble(object):
+    """Ensemble class.
+
+    Run a Monte Carlo ensemble of the soil water model in parallel,
+    where the daily data is shared by all worker processes.
+
+    Perturbations for each member (all drawn from the member's own
+    random stream):
+        rain - daily rain is multiplied by a lognormal random factor
+               (mean of 1, and standard deviation given by rainsd)
+        pet - daily potential transpiration and evaporation are both
+              multiplied by a lognormal random factor (mean of 1, and
+              standard deviation given by petsd)
+        texture - clay and sand (%) of every soil layer are shifted by a
+                  normal random amount (mean of 0, and standard deviation
+                  given by texturesd, in %)
+
+    ATTRIBUTES:
+        ini - model inputs read from the model input text file
+        nmembers - number of ensemble members
+        seed - seed for the random streams of all members
+        rainsd - perturbation size for rain (-)
+        petsd - perturbation size for potential ET (-)
+        texturesd - perturbation size for clay and sand (%)
+        fields - names of the daily model outputs
+        results - model results, an array of (members x days x fields)
+
+    METHODS:
+        perturbations - perturbed model inputs for a given member
+        run - run all the members in parallel
+        field - model results for a given output field
+    """
+
+    def __init__(self, fname_in, nmembers, seed=0, rainsd=0.0, petsd=0.0,
+                 texturesd=0.0):
+        """Create the Ensemble object.
+
+        Args:
+            fname_in: model input text file
+            nmembers: number of ensemble members
+            seed: seed for the random streams of all members
+            rainsd: perturbation size for rain (-)
+            petsd: perturbation size for potential ET (-)
+            texturesd: perturbation size for clay and sand (%)
+        """
+        with open(fname_in, 'rt') as fin:
+            self.ini = json.loads(fin.read())   # read everything in file
+        self.nmembers = nmembers
+        self.seed = seed
+        self.rainsd = rainsd
+        self.petsd = petsd
+        self.texturesd = texturesd
+        self.fields = Facade.output_fields(self.ini['numlayers'])
+        self.results = None
+
+    @staticmethod
+    def lognormal(rng, sd, size):
+        """Lognormal random factors with a mean of 1.
+
+        Args:
+            rng: numpy random generator
+            sd: standard deviation of the factors
+            size: number of factors
+
+        Returns:
+            Array of random factors (all 1 if sd is 0)
+        """
+        if sd <= 0:
+            return np.ones(size)
+        sigma2 = np.log(1 + sd ** 2)
+        return rng.lognormal(-0.5 * sigma2, np.sqrt(sigma2), size)
+
+    def perturbations(self, member, duration):
+        """Perturbed model inputs for a given member.
+
+        Args:
+            member: member number (starts at 0)
+            duration: no. of daily simulation days (days)
+
+        Returns:
+            Tuple of the perturbed model inputs (dictionary), and the
+            daily multipliers for rain and for potential ET (arrays)
+        """
+        # every member has its own (independent) random stream:
+        rng = np.random.default_rng([self.seed, member])
+        ini = copy.deepcopy(self.ini)
+        if self.texturesd > 0:
+            for layer in ini['layers'][:ini['numlayers']]:
+                tex = layer['texture']
+                dclay, dsand = rng.normal(0.0, self.texturesd, 2)
+                tex['clay'] = min(100.0, max(0.0, tex['clay'] + dclay))
+                tex['sand'] = min(100.0 - tex['clay'],
+                                  max(0.0, tex['sand'] + dsand))
+        rainmult = Ensemble.lognormal(rng, self.rainsd, duration)
+        petmult = Ensemble.lognormal(rng, self.petsd, duration)
+        return ini, rainmult.tolist(), petmult.tolist()
+
+    def run(self, duration, nworkers=None):
+        """Run all the members in parallel.
+
+        Args:
+            duration: no. of daily simulation days (days)
+            nworkers: no. of worker processes. Default: no. of CPUs
+
+        Returns:
+            Array of the model results (members x days x fields)
+        """
+        # read the daily data only once, then share it with the workers
+        dailydata = DailyData(self.ini['dailydatafile'])
+        nrows = len(dailydata.data) // dailydata.nset
+        forcing = SharedArray((nrows, dailydata.nset))
+        forcing.array[:] = np.reshape(dailydata.data,
+                                      (nrows, dailydata.nset))
+        del dailydata
+        shape = (self.nmembers, duration, len(self.fields))
+        results = SharedArray(shape)
+        try:
+            initargs = (self, duration, forcing.spec(), results.spec())
+            with mp.Pool(nworkers, _init_worker, initargs) as pool:
+                for _ in pool.imap_unordered(_run_member,
+                                             range(self.nmembers)):
+                    pass
+            self.results = results.array.copy()
+        finally:
+            for arr in (forcing, results):
+                arr.close()
+                arr.unlink()
+        return self.results
+
+    def field(self, name):
+        """Model results for a given output field.
+
+        Args:
+            name: name of output field, e.g., 'rootvwc' or 'layer1_vwc'
+
+        Returns:
+            Array of (members x days)
+        """
+        return self.results[:, :, self.fields.index(name)]
@@ -3,17 +3,30 @@
 Run the soil water model, store the model results in a dictionary,
 and print the results to an output file.
 
+The daily model outputs of a model run are also stored in one table of
+values, allocated once for the whole run (see Facade.table), so that the
+model outputs can be analyzed as a table without copying them (see the
+results module).
+
 @author Christopher Teh Boon Sung
 
 """
 
 
+from array import array
 import json
 
 from dailydata import DailyData
 from soilwater import SoilWater
 
 
+# model outputs stored and written for every simulation day:
+#    OUTPUTS - for the whole soil profile (root zone)
+#    OUTLAYERS - for every soil layer
+OUTPUTS = ['rain', 'rootdepth', 'rootvwc', 'rootwc']
+OUTLAYERS = ['vwc', 'wc', 't', 'e', 'influx', 'outflux', 'netflux']
+
+
 class Facade(object):
     """Facade class.
 
@@ -22,32 +35,57 @@ class Facade(object):
     print the results to an output file.
 
     ATTRIBUTES:
+        ini - model inputs read from the model input text file
         dailydata - data read from the model input file
         model - the soil water model
         fname_out - fullpath and name of output text file
+        cache - cache of model results (ResultCache object), if any
+        table - table of the daily model outputs of the last model run,
+                an array of 8-byte floats, one row per day, one column
+                per field (see output_fields), row after row; None if
+                the model results came from the cache, or are aggregated
         results - model results kept here
 
     METHODS:
         Statics:
             show_progress - keep track of model simulation
                             and show a progress bar
+            output_fields - names of the daily model outputs
+            daily_outputs - values of the daily model outputs
+            empty_results - new (empty) dictionary for model results
+            store_outputs - append the daily model outputs to results
+            table_results - model results from the columns of a table
 
         run - start the daily simulation of soil water
     """
 
-    def __init__(self, fname_in, fname_out):
+    def __init__(self, fname_in, fname_out, cache=None, dailydata=None):
         """Create the Facade object.
 
         Args:
-            fname_in: model input text file
+            fname_in: model input text file, or a dictionary of the
+                      model inputs already read from such a file
             fname_out: model output (results) text file
+            cache: cache of model results (ResultCache object).
+                   Default: no cache, so model is always run.
+            dailydata: daily data (DailyData object) already read from
+                       the daily data file of the model inputs. Default:
+                       None (read from the daily data file)
         """
-        with open(fname_in, 'rt') as fin:
-            ini = json.loads(fin.read())    # read everything in the file
+        if isinstance(fname_in, dict):
+            ini = fname_in
+        else:
+            with open(fname_in, 'rt') as fin:
+                ini = json.loads(fin.read())    # read everything in file
         # initialize attributes:
-        self.dailydata = DailyData(ini['dailydatafile'])
-        self.model = SoilWater(fname_in)
+        self.ini = ini
+        if dailydata is None:
+            dailydata = DailyData(ini['dailydatafile'])
+        self.dailydata = dailydata
+        self.model = SoilWater(ini)
         self.fname_out = fname_out
+        self.cache = cache
+        self.table = None
         self.results = None
 
     @staticmethod
@@ -63,37 +101,169 @@ class Facade(object):
                              int(round(f * 100))), end='')
             yield i
 
-    def run(self, duration):
+    @staticmethod
+    def output_fields(nlayers):
+        """Names of the model outputs for every simulation day.
+
+        Layer outputs are prefixed by their layer number, e.g., layer1_vwc.
+
+        Args:
+            nlayers: number of soil layers
+
+        Returns:
+            List of names, in the same order as the output file columns
+            (excluding the day number column)
+        """
+        fields = list(OUTPUTS)
+        for i in range(nlayers):
+            prefix = 'layer' + str(i + 1) + '_'
+            fields.extend([prefix + field for field in OUTLAYERS])
+        return fields
+
+    @staticmethod
+    def daily_outputs(model, rain):
+        """Values of the model outputs for the current simulation day.
+
+        Args:
+            model: the soil water model (SoilWater object)
+            rain: total amount of rain for the day (mm/day)
+
+        Returns:
+            List of floats, in the same order as given by output_fields
+        """
+        rootwater = model.rootwater
+        vals = [rain, model.rootdepth, rootwater.vwc, rootwater.wc]
+        for layer in model.layers:
+            # all water fluxes to be in mm/day
+            fluxes = layer.fluxes
+            vals.extend([layer.vwc, layer.wc, fluxes.t * 1000,
+                         fluxes.e * 1000, fluxes.influx * 1000,
+                         fluxes.outflux * 1000, fluxes.netflux * 1000])
+        return vals
+
+    @staticmethod
+    def empty_results(nlayers):
+        """New (empty) dictionary to store the model results.
+
+        Args:
+            nlayers: number of soil layers
+
+        Returns:
+            Dictionary with an empty list for each output, and with a
+            list of such dictionaries (one per soil layer) under 'layers'
+        """
+        res = {key: [] for key in OUTPUTS}
+        res['layers'] = [{key: [] for key in OUTLAYERS}
+                         for _ in range(nlayers)]
+        return res
+
+    @staticmethod
+    def store_outputs(res, vals):
+        """Append the daily model outputs to the model results.
+
+        Args:
+            res: dictionary containing the model results
+            vals: values of the daily model outputs (from daily_outputs)
+
+        Returns:
+            None
+        """
+        nfields = len(OUTPUTS)
+        for key, val in zip(OUTPUTS, vals):
+            res[key].append(val)
+        for j, d in enumerate(res['layers']):
+            start = nfields + j * len(OUTLAYERS)
+            for key, val in zip(OUTLAYERS, vals[start:]):
+                d[key].append(val)
+
+    @staticmethod
+    def table_results(table, nlayers):
+        """Model results from the columns of a table of values.
+
+        Args:
+            table: array ('d' type) of the daily model outputs, one row
+                   per day, one column per field (as given by
+                   output_fields), row after row
+            nlayers: number of soil layers
+
+        Returns:
+            Dictionary containing the model results, as given by
+            empty_results, filled with the columns of the table
+        """
+        nfields = len(OUTPUTS) + nlayers * len(OUTLAYERS)
+        view = memoryview(table)
+        res = {key: view[col::nfields].tolist()
+               for col, key in enumerate(OUTPUTS)}
+        res['layers'] = []
+        for j in range(nlayers):
+            start = len(OUTPUTS) + j * len(OUTLAYERS)
+            res['layers'].append({key: view[start + k::nfields].tolist()
+                                  for k, key in enumerate(OUTLAYERS)})
+        return res
+
+    def run(self, duration, usecache=True, monitor=None, aggregate=None):
         """Run the soil water model in daily time steps.
 
         Write the model output to the file and return the model results
         as a dictornary.
 
+        Note:
+            If the same model run is found in the cache, the model results
+            and output file are taken from the cache instead, so the model
+            (the model attribute) is not run.
+
         Args:
             duration: no. of daily simulation days (days)
+            usecache: False to bypass the cache (if any), so the model is
+                      always run, and its results are not cached
+            monitor: queue (such as queue.SimpleQueue) to put the daily
+                     model outputs in as (day, values) tuples, as the
+                     model is run, then None once the run is done (see
+                     the monitor module). Default: None (no monitor).
+            aggregate: Aggregator object, to store and write only the
+                       model outputs aggregated by period, rather than
+                       every day (see the aggregate module). The monitor
+                       (if any) still gets every day's model outputs.
+                       Default: None (no aggregation).
 
         Returns:
-            Dictionary containing the model results
+            Dictionary containing the model results (aggregated results,
+            if aggregate is given)
         """
+        cache = self.cache if usecache else None
+        if cache is not None:
+            cachekey = cache.make_key(self.ini, duration,
+                                      aggregate and aggregate.options())
+            res = cache.get(cachekey, self.fname_out)
+            if res is not None:
+                print('Model results retrieved from cache.')
+                self.table = None
+                self.results = res
+                if monitor is not None:
+                    monitor.put_nowait(None)
+                return res
+
         with open(self.fname_out, 'wt') as fout:
             nlayers = self.model.numlayers
-            # selected model parameters to be stored and written to file
-            outlayers = ['vwc', 'wc', 't', 'e', 'influx', 'outflux',
-                         'netflux']
-            res = {'rain': [], 'rootdepth': [], 'rootvwc': [],
-                   'rootwc': [],
-                   'layers': [{key: [] for key in outlayers}
-                              for _ in range(nlayers)]}
-
-            # the column headers in the output  file
-            headers = ['day', 'rain', 'rootdepth', 'rootvwc', 'rootwc']
-            fmt1 = '{:>15d}' + ',{:>15.3f}' * (len(headers) - 1)
-            fmt2 = ',{:>15.3f}' * len(outlayers)
+            table = None
+            if aggregate is None:
+                # the column headers in the output  file
+                headers = ['day'] + Facade.output_fields(nlayers)
+                nints = 1   # day no.
+                # selected model parameters to be stored and written,
+                #    in a table allocated once for the whole run
+                nfields = len(headers) - 1
+                table = array('d', bytes(8 * duration * nfields))
+            else:
+                # only the model outputs aggregated by period
+                aggregate.start(Facade.output_fields(nlayers))
+                res = aggregate.empty_results()
+                headers = aggregate.headers
+                nints = 4   # period no., first and last days, no. of days
+            fmtrow = (',{:>15d}' * nints).lstrip(',') + \
+                ',{:>15.3f}' * (len(headers) - nints)
 
             # print the headers to the output file
-            for i in range(nlayers):
-                prefix = 'layer' + str(i + 1) + '_'
-                headers.extend([prefix + field for field in outlayers])
             fmt = ('{:>15s},' * len(headers)).rstrip(',')
             fout.write(fmt.format(*headers))
             fout.write('\n')
@@ -104,39 +274,37 @@ class Facade(object):
             for i in Facade.show_progress(duration):
                 day = i + 1     # day number starts at 1, not 0
                 # run the model
-                self.model.daily_water_balance(*self.dailydata[day])
+                data = self.dailydata[day]
+                self.model.daily_water_balance(*data)
 
                 # retrieve the model results
-                rain = self.dailydata[day][0]
-                rootdepth = self.model.rootdepth
-                rootvwc = self.model.rootwater.vwc
-                rootwc = self.model.rootwater.wc
-                res['rain'].append(rain)
-                res['rootdepth'].append(rootdepth)
-                res['rootvwc'].append(rootvwc)
-                res['rootwc'].append(rootwc)
-                fout.write(fmt1.format(day, rain, rootdepth, rootvwc,
-                                       rootwc))
-                for j, layer in enumerate(self.model.layers):
-                    vwc = layer.vwc
-                    wc = layer.wc
-                    # all water fluxes to be in mm/day
-                    t = layer.fluxes.t * 1000
-                    e = layer.fluxes.e * 1000
-                    influx = layer.fluxes.influx * 1000
-                    outflux = layer.fluxes.outflux * 1000
-                    netflux = layer.fluxes.netflux * 1000
-                    d = res['layers'][j]
-                    d['vwc'].append(vwc)
-                    d['wc'].append(wc)
-                    d['t'].append(t)
-                    d['e'].append(e)
-                    d['influx'].append(influx)
-                    d['outflux'].append(outflux)
-                    d['netflux'].append(netflux)
-                    fout.write(fmt2.format(vwc, wc, t, e,
-                                           influx, outflux, netflux))
-                fout.write('\n')
+                vals = Facade.daily_outputs(self.model, data[0])
+                if aggregate is None:
+                    table[i * nfields:day * nfields] = array('d', vals)
+                    fout.write(fmtrow.format(day, *vals))
+                    fout.write('\n')
+                else:
+                    for row in aggregate.add(day, vals):
+                        aggregate.store_row(res, row)
+                        fout.write(fmtrow.format(*row))
+                        fout.write('\n')
+                if monitor is not None:
+                    monitor.put_nowait((day, vals))     # never waits
 
+            if aggregate is not None:
+                for row in aggregate.finish():  # the last period
+                    aggregate.store_row(res, row)
+                    fout.write(fmtrow.format(*row))
+                    fout.write('\n')
+
+            if table is not None:
+                res = Facade.table_results(table, nlayers)
+            self.table = table
             self.results = res      # store the model results
+            if monitor is not None:
+                monitor.put_nowait(None)    # no more model outputs
             print('\ndone.')
+
+        if cache is not None:
+            cache.put(cachekey, res, self.fname_out)
+        return res
@@ -0,0 +1,442 @@
+"""Grid module.
+
+Run the soil water model over a raster grid of soil columns (cells),
+such as from a soil map, where every cell has its own soil texture (and
+optionally soil layer thicknesses and daily data). The grid is split into
+square tiles, and the tiles are run in parallel, in a pool of worker
+processes.
+
+The grid inputs are numpy (.npy) files in a grid folder:
+    clay.npy, sand.npy, om.npy - soil texture (%), arrays of
+                                 (y x x x layers). Cells whose clay is
+                                 NaN (such as water bodies) are skipped.
+    thick.npy - soil layer thicknesses (m), an array of (layers), or of
+                (y x x x layers), optional (default: as given in the
+                model input file)
+    forcing.npy - daily data (rain, lai, petcrop, petsoil, as in the
+                  daily data file), an array of (days x 4) for all cells,
+                  or (days x y x x x 4) for every cell. Default: the
+                  daily data file given in the model input file.
+
+The model input file gives the rest of the model inputs (such as the no.
+of soil layers, integration intervals, and the initial water content).
+
+The model outputs are written into memory-mapped numpy (.npy) files, one
+per model output (see Facade.output_fields), in the 'out' subfolder of
+the grid folder, so the model results of the whole grid never have to
+fit in memory:
+    rain, rootdepth, rootvwc, rootwc - arrays of (days x y x x)
+    vwc, wc, t, e, influx, outflux, netflux - arrays of
+                                              (days x y x x x layers)
+
+The model outputs are saved as 32-bit floats, to halve their file sizes.
+The model outputs of every cell are written into the model output files
+as soon as the cell is run, so a worker only holds one cell's model
+outputs in memory, whatever the tile size and no. of days. Model output
+files of an earlier grid run of another no. of days, cells, or soil
+layers are not overwritten: the grid run stops with an error instead, so
+remove (or move) the 'out' and 'tiles' subfolders first.
+Every tile marks itself as done (or failed, with its error) in the
+'tiles' subfolder of the grid folder, so that running the grid again
+runs only the tiles not yet done, such as those that failed. A tile can
+also be run by itself.
+
+How to use:
+
+    python grid.py <flags>
+
+where <flags> are the following:
+    -i <model input text file>
+    -g <grid folder, with the grid inputs>
+    -n <number of daily time steps to run the model, in days, optional
+        (default: no. of days of daily data in forcing.npy)>
+    -s <tile size, in cells, optional (default: 32)>
+    -w <number of worker processes, optional (default: no. of CPUs)>
+    -t <tile to run by itself, as row,column of the tile, optional>
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import copy
+import getopt
+import json
+import multiprocessing as mp
+import os
+import sys
+import traceback
+
+import numpy as np
+
+from dailydata import DailyData
+from facade import Facade, OUTPUTS, OUTLAYERS
+from soilwater import SoilWater
+
+
+class Grid(object):
+    """Grid class.
+
+    Run the soil water model over a raster grid of soil columns, in
+    tiles, in parallel.
+
+    ATTRIBUTES:
+        ini - model inputs read from the model input text file
+        folder - grid folder, with the grid inputs
+        tilesize - width (and height) of every tile, in cells
+        shape - no. of rows and columns of cells in the grid
+        nlayers - no. of soil layers in every cell
+        duration - no. of daily simulation days (days)
+
+    METHODS:
+        inputs - grid input array (memory-mapped, read-only)
+        tiles - all the tiles in the grid
+        tile_bounds - rows and columns of cells in a given tile
+        tile_status - whether a given tile is done, failed, or not run
+        failed_tiles - tiles that failed in an earlier grid run
+        create_outputs - create the model output files (if none)
+        outputs - model output array (memory-mapped)
+        run_cell - run the model for one cell
+        run_tile - run the model for every cell in a given tile
+        run - run the model for every tile not yet done, in parallel
+    """
+
+    def __init__(self, fname_in, folder, duration=None, tilesize=32):
+        """Create the Grid object.
+
+        Args:
+            fname_in: model input text file
+            folder: grid folder, with the grid inputs
+            duration: no. of daily simulation days (days). Default: no.
+                      of days of daily data in forcing.npy
+            tilesize: width (and height) of every tile, in cells
+        """
+        with open(fname_in, 'rt') as fin:
+            self.ini = json.loads(fin.read())   # read everything in file
+        self.folder = folder
+        self.tilesize = tilesize
+        clay = self.inputs('clay')
+        self.shape = clay.shape[:2]
+        self.nlayers = clay.shape[2]
+        if duration is None:
+            duration = self.forcing().shape[0]
+        self.duration = duration
+        self.__arrays = {}      # opened input and output arrays
+
+    def __getstate__(self):
+        """Pickle without the opened arrays (for worker processes)."""
+        state = self.__dict__.copy()
+        state['_Grid__arrays'] = {}
+        return state
+
+    def inputs(self, name):
+        """Grid input array (memory-mapped, read-only), or None if none.
+
+        Args:
+            name: name of the grid input, e.g., 'clay'
+
+        Returns:
+            numpy array (memory-mapped)
+        """
+        fname = os.path.join(self.folder, name + '.npy')
+        if not os.path.exists(fname):
+            return None
+        return np.load(fname, mmap_mode='r')
+
+    def forcing(self):
+        """Daily data, an array of (days x 4) or (days x y x x x 4)."""
+        forcing = self.inputs('forcing')
+        if forcing is None:
+            # the same daily data (from file) for all cells:
+            dailydata = DailyData(self.ini['dailydatafile'])
+            forcing = np.array(list(dailydata), dtype=float)
+        return forcing
+
+    def tiles(self):
+        """All the tiles in the grid, as (row, column) of the tile."""
+        nrows = -(-self.shape[0] // self.tilesize)
+        ncols = -(-self.shape[1] // self.tilesize)
+        return [(row, col) for row in range(nrows) for col in range(ncols)]
+
+    def tile_bounds(self, tile):
+        """First and last (excluded) rows and columns of cells in a tile.
+
+        Args:
+            tile: (row, column) of the tile
+
+        Returns:
+            Tuple of the first row, last row, first column, last column
+        """
+        y0 = tile[0] * self.tilesize
+        x0 = tile[1] * self.tilesize
+        return (y0, min(y0 + self.tilesize, self.shape[0]),
+                x0, min(x0 + self.tilesize, self.shape[1]))
+
+    def _status_file(self, tile, status):
+        """Name of the file marking a tile's status ('done' or 'failed')."""
+        return os.path.join(self.folder, 'tiles',
+                            '{}_{}.{}'.format(tile[0], tile[1], status))
+
+    def tile_status(self, tile):
+        """Status of a given tile: 'done', 'failed', or None (not run)."""
+        for status in ['done', 'failed']:
+            if os.path.exists(self._status_file(tile, status)):
+                return status
+        return None
+
+    def failed_tiles(self):
+        """Tiles that failed in an earlier grid run."""
+        return [tile for tile in self.tiles()
+                if self.tile_status(tile) == 'failed']
+
+    def create_outputs(self):
+        """Create the model output files (filled with NaN), if none yet.
+
+        Returns:
+            None
+
+        Raises:
+            ValueError: if a model output file of an earlier grid run
+                        has another shape (no. of days, cells, or soil
+                        layers) or data type
+        """
+        os.makedirs(os.path.join(self.folder, 'out'), exist_ok=True)
+        os.makedirs(os.path.join(self.folder, 'tiles'), exist_ok=True)
+        shape = (self.duration,) + tuple(self.shape)
+        for name in OUTPUTS + OUTLAYERS:
+            fname = os.path.join(self.folder, 'out', name + '.npy')
+            dims = shape if name in OUTPUTS else shape + (self.nlayers,)
+            if os.path.exists(fname):
+                # keep the model outputs of earlier runs, if they match
+                arr = self.outputs(name)
+                if arr.shape != dims or arr.dtype != np.float32:
+                    raise ValueError(
+                        '{} has shape {}, not {}: remove the out and tiles'
+                        ' subfolders of the earlier grid run first.'.format(
+                            fname, arr.shape, dims))
+                del arr
+                continue
+            arr = np.lib.format.open_memmap(fname, mode='w+',
+                                            dtype=np.float32, shape=dims)
+            arr[:] = np.nan
+            arr.flush()
+            del arr
+
+    def outputs(self, name, mode='r'):
+        """Model output array (memory-mapped).
+
+        Args:
+            name: name of the model output, e.g., 'rootvwc' or 'vwc'
+            mode: 'r' to read only, or 'r+' to also write
+
+        Returns:
+            numpy array (memory-mapped)
+        """
+        fname = os.path.join(self.folder, 'out', name + '.npy')
+        return np.load(fname, mmap_mode=mode)
+
+    def _array(self, name, kind):
+        """Input or output array, opened only once (per process)."""
+        if (name, kind) not in self.__arrays:
+            if kind == 'out':
+                arr = self.outputs(name, 'r+')
+            elif name == 'forcing':
+                arr = self.forcing()
+            else:
+                arr = self.inputs(name)
+            self.__arrays[(name, kind)] = arr
+        return self.__arrays[(name, kind)]
+
+    def run_cell(self, y, x):
+        """Run the model for one cell.
+
+        Args:
+            y: row of the cell
+            x: column of the cell
+
+        Returns:
+            Array of the model outputs (days x fields), where the fields
+            are given by Facade.output_fields, or None if the cell has no
+            soil (clay is NaN)
+        """
+        clay = self._array('clay', 'in')[y, x]
+        if np.isnan(clay).any():
+            return None     # no soil in this cell
+        sand = self._array('sand', 'in')[y, x]
+        om = self._array('om', 'in')[y, x]
+        thick = self._array('thick', 'in')
+        if thick is not None and thick.ndim > 1:
+            thick = thick[y, x]
+        ini = copy.deepcopy(self.ini)
+        ini['numlayers'] = self.nlayers
+        layers = ini['layers']
+        for i in range(self.nlayers):
+            # the initial water content of the layer, as given in the
+            #    model input file (or of its last layer, if fewer):
+            layer = copy.deepcopy(layers[min(i, len(layers) - 1)])
+            layer['texture'] = {'clay': float(clay[i]),
+                                'sand': float(sand[i]),
+                                'om': float(om[i])}
+            if thick is not None:
+                layer['thick'] = float(thick[i])
+            if i < len(layers):
+                layers[i] = layer
+            else:
+                layers.append(layer)
+
+        forcing = self._array('forcing', 'in')
+        if forcing.ndim > 2:
+            forcing = forcing[:, y, x]
+        model = SoilWater(ini)
+        nrows = forcing.shape[0]
+        out = np.empty((self.duration, len(OUTPUTS) +
+                        self.nlayers * len(OUTLAYERS)))
+        for i in range(self.duration):
+            # rewound to the top if the end is reached (as DailyData)
+            rain, lai, petcrop, petsoil = forcing[i % nrows].tolist()
+            model.daily_water_balance(rain, lai, petcrop, petsoil)
+            out[i] = Facade.daily_outputs(model, rain)
+        return out
+
+    def run_tile(self, tile):
+        """Run the model for every cell in a given tile.
+
+        The model outputs of every cell are written into the model
+        output files as soon as the cell is run (so only one cell's model
+        outputs are held in memory), then the tile is marked as done. If
+        any cell fails, the tile is marked as failed instead (with the
+        error).
+
+        Args:
+            tile: (row, column) of the tile
+
+        Returns:
+            Tuple of the tile and the error (None if done)
+        """
+        for status in ['done', 'failed']:
+            if os.path.exists(self._status_file(tile, status)):
+                os.remove(self._status_file(tile, status))
+        try:
+            y0, y1, x0, x1 = self.tile_bounds(tile)
+            start = len(OUTPUTS)
+            nvals = start + self.nlayers * len(OUTLAYERS)
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    out = self.run_cell(y, x)
+                    if out is None:     # no soil in this cell
+                        out = np.full((self.duration, nvals), np.nan)
+                    # write the cell into every model output file:
+                    for j, name in enumerate(OUTPUTS):
+                        self._array(name, 'out')[:, y, x] = out[:, j]
+                    for j, name in enumerate(OUTLAYERS):
+                        self._array(name, 'out')[:, y, x] = \
+                            out[:, start + j::len(OUTLAYERS)]
+            for name in OUTPUTS + OUTLAYERS:
+                self._array(name, 'out').flush()
+        except Exception:
+            error = traceback.format_exc()
+            with open(self._status_file(tile, 'failed'), 'wt') as fout:
+                fout.write(error)
+            return tile, error
+        with open(self._status_file(tile, 'done'), 'wt'):
+            pass
+        return tile, None
+
+    def run(self, tiles=None, nworkers=None):
+        """Run every tile not yet done (or the given tiles), in parallel.
+
+        Args:
+            tiles: tiles to run, as (row, column) of every tile. Default:
+                   every tile not yet done (such as those that failed)
+            nworkers: no. of worker processes. Default: no. of CPUs
+
+        Returns:
+            List of the tiles that failed, as (tile, error) tuples
+        """
+        self.create_outputs()
+        if tiles is None:
+            tiles = [tile for tile in self.tiles()
+                     if self.tile_status(tile) != 'done']
+        failed = []
+        with mp.Pool(nworkers, _init_worker, (self,)) as pool:
+            for tile, error in pool.imap_unordered(_run_tile, tiles):
+                if error is None:
+                    print('tile {},{} done.'.format(*tile))
+                else:
+                    print('tile {},{} failed.'.format(*tile))
+                    failed.append((tile, error))
+        return failed
+
+
+# worker process globals, set only once for every worker process:
+#    grid - the Grid object
+_worker = {}
+
+
+def _init_worker(grid):
+    """Keep the Grid object for the worker process."""
+    _worker['grid'] = grid
+
+
+def _run_tile(tile):
+    """Run the model for a given tile (in a worker process)."""
+    return _worker['grid'].run_tile(tile)
+
+
+def main(argv):
+    """Main entry point for a grid run.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        inifile = folder = duration = nworkers = tiles = None
+        tilesize = 32
+        opts, a = getopt.getopt(argv, "hi:g:n:s:w:t:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-i':           # initialization file flag
+                inifile = arg
+            elif opt == '-g':           # grid folder flag
+                folder = arg
+            elif opt == '-n':           # duration of model run flag
+                duration = int(arg)
+            elif opt == '-s':           # tile size flag
+                tilesize = int(arg)
+            elif opt == '-w':           # no. of worker processes flag
+                nworkers = int(arg)
+            elif opt == '-t':           # tile flag
+                tiles = [tuple(int(val) for val in arg.split(','))]
+
+        if None in [inifile, folder]:
+            print('One or more flags are missing.'
+                  ' Flags -n, -s, -w, and -t are optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        failed = Grid(inifile, folder, duration, tilesize).run(tiles,
+                                                              nworkers)
+        if failed:
+            print('{} tile(s) failed. Run again to rerun them.'.format(
+                len(failed)))
+            return 1
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+    except Exception:
+        print('Error encountered. Aborting.')
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(1)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,198 @@
+"""Monitor module.
+
+Watch the model results in charts as the model is being run (live), for
+long model runs. The model is run in a background thread, which puts its
+daily model outputs into a queue without ever waiting. The charts take
+the model outputs from the queue, append them to preallocated buffers,
+and are redrawn at a limited frame rate. Only the chart lines are redrawn
+(blitting), rather than the whole charts, so that watching the charts
+slows down the model run by very little.
+
+Requires matplotlib (with an interactive backend) and numpy.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import queue
+import threading
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from facade import Facade, OUTPUTS, OUTLAYERS
+from plot import Plot
+
+
+class Monitor(object):
+    """Monitor class.
+
+    Run the soil water model, and show the water content of the root zone
+    and of every soil layer in charts, as the model is being run.
+
+    ATTRIBUTES:
+        facade - the model run (Facade object)
+        duration - no. of daily simulation days (days)
+        fps - max. no. of times the charts are redrawn per second
+        queue - daily model outputs from the model run, not yet charted
+        days - day numbers (x values) of the charts
+        rootvwc - buffer of the root zone water content (m3/m3)
+        vwc - buffer of the water content (m3/m3) of every soil layer
+        nday - no. of days of model outputs taken from the queue
+        done - True once the model run is done
+
+    METHODS:
+        consume - take the model outputs waiting in the queue
+        draw - draw the charts (without the data)
+        on_draw - keep the drawn charts as the background for blitting
+        draw_lines - draw only the chart lines
+        update - redraw the chart lines with the new model outputs
+        run - run the model, and show the charts as it is being run
+    """
+
+    def __init__(self, fname_in, fname_out, duration, fps=10):
+        """Create the Monitor object.
+
+        Args:
+            fname_in: model input text file
+            fname_out: model output (results) text file
+            duration: no. of daily simulation days (days)
+            fps: max. no. of times the charts are redrawn per second
+        """
+        self.facade = Facade(fname_in, fname_out)
+        self.duration = duration
+        self.fps = fps
+        self.queue = queue.SimpleQueue()
+        nlayers = self.facade.model.numlayers
+        self.days = np.arange(1, duration + 1)
+        self.rootvwc = np.full(duration, np.nan)
+        self.vwc = np.full((nlayers, duration), np.nan)
+        self.nday = 0
+        self.done = False
+        self.__fig = None
+        self.__lines = []           # chart lines and their buffers
+        self.__title = None         # chart title, showing the day
+        self.__background = None    # drawn charts, without the lines
+        self.__timer = None         # timer to redraw the chart lines
+
+    def consume(self):
+        """Take all the model outputs waiting in the queue (no waiting).
+
+        Returns:
+            No. of days of model outputs taken
+        """
+        iroot = OUTPUTS.index('rootvwc')
+        ivwc = slice(len(OUTPUTS) + OUTLAYERS.index('vwc'), None,
+                     len(OUTLAYERS))
+        ndays = 0
+        while not self.done:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.done = True    # model run is done
+                break
+            day, vals = item
+            self.rootvwc[day - 1] = vals[iroot]
+            self.vwc[:, day - 1] = vals[ivwc]
+            self.nday = day
+            ndays += 1
+        return ndays
+
+    def draw(self, fig):
+        """Draw the charts, but without the data (drawn by update).
+
+        Args:
+            fig: the figure to draw in
+
+        Returns:
+            None
+        """
+        self.__fig = fig
+        nlayers = len(self.vwc)
+        vwcsat = max(layer.swc.sat for layer in self.facade.model.layers)
+        ax1 = fig.add_subplot(2, 1, 1)
+        ax2 = fig.add_subplot(2, 1, 2, sharex=ax1)
+        line, = ax1.plot([], [], lw=3, ls='dashed', label='root zone',
+                         color=Plot.color(nlayers), animated=True)
+        self.__lines = [(line, self.rootvwc)]
+        for i, buf in enumerate(self.vwc):
+            line, = ax2.plot([], [], lw=2, label='layer' + str(i + 1),
+                             color=Plot.color(i), animated=True)
+            self.__lines.append((line, buf))
+        for ax in [ax1, ax2]:
+            # fixed axis limits, so the charts need not be redrawn:
+            ax.set_xlim(1, max(2, self.duration))
+            ax.set_ylim(0.0, vwcsat * 1.05)
+            ax.set_ylabel('VWC\n' + r'(m$^{3}$ m$^{-3}$)')
+            ax.legend(loc='upper left', ncol=nlayers + 1)
+            ax.grid(True)
+        ax2.set_xlabel('days')
+        self.__title = ax1.set_title('day 0 of ' + str(self.duration))
+        self.__title.set_animated(True)
+        # redrawing the whole charts (such as when the window is resized)
+        #    gives a new background:
+        fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    # noinspection PyUnusedLocal
+    def on_draw(self, event):
+        """Keep the drawn charts (without the lines) as the background."""
+        canvas = self.__fig.canvas
+        self.__background = canvas.copy_from_bbox(self.__fig.bbox)
+        self.draw_lines()
+
+    def draw_lines(self):
+        """Draw only the chart lines (and title) over the background."""
+        n = self.nday
+        for line, buf in self.__lines:
+            line.set_data(self.days[:n], buf[:n])
+            self.__fig.draw_artist(line)
+        self.__fig.draw_artist(self.__title)
+
+    def update(self):
+        """Redraw the chart lines with the new model outputs, if any.
+
+        Called at the given frame rate (fps), so the chart lines are not
+        redrawn more often than this, however fast the model is run.
+
+        Returns:
+            None
+        """
+        if self.consume() == 0 or self.__background is None:
+            if self.done and self.__timer is not None:
+                self.__timer.stop()     # no more model outputs
+            return
+        self.__title.set_text('day {} of {}'.format(self.nday,
+                                                     self.duration))
+        canvas = self.__fig.canvas
+        canvas.restore_region(self.__background)
+        self.draw_lines()
+        canvas.blit(self.__fig.bbox)
+        canvas.flush_events()
+
+    def run(self):
+        """Run the model, and show the charts as it is being run.
+
+        The model is run in a background thread, while the charts are
+        shown (in the main thread) until their window is closed.
+
+        Returns:
+            Dictionary containing the model results
+        """
+        fig = plt.gcf()
+        self.draw(fig)
+        thread = threading.Thread(target=self.facade.run,
+                                  args=(self.duration,),
+                                  kwargs={'monitor': self.queue},
+                                  daemon=True)
+        self.__timer = fig.canvas.new_timer(interval=1000 // self.fps)
+        self.__timer.add_callback(self.update)
+        self.__timer.start()
+        thread.start()
+        mng = plt.get_current_fig_manager()
+        mng.set_window_title('Pywaterbal (live)')
+        plt.show()
+        thread.join()   # model run continues after the window is closed
+        return self.facade.results
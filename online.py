@@ -0,0 +1,270 @@
+"""Online module.
+
+Advance many models (such as one per plantation block) by one day at a
+time, as new daily data arrive (such as from a weather station), without
+running any model again from its first day. The model state of every
+block (see SoilWater.get_state) is kept in a store folder, so every new
+day needs only one daily water balance per block:
+
+    <store folder>/
+        blocks.json - model inputs of every block
+        state.json - day and model state of every block
+        results/<block>.txt - model output file of every block (as
+                              written by Facade), one row added per day
+
+The state file is replaced atomically (written to a temporary file, then
+renamed), so it always holds the state of a whole day. It also records
+the size of every block's model output file at that day, so if a day is
+interrupted (or repeated), the rows written since are removed before the
+day is run again, and every day is added only once.
+
+Blocks of the same model inputs share one model, built only once: every
+block's model is a copy of it (see soilwater.new_model), then set to the
+block's model state.
+
+How to use:
+
+    python online.py <flags>
+
+where <flags> are the following:
+    -s <store folder>
+    -b <JSON file of the blocks to add, as an object of block names and
+        their model input text files, optional>
+    -f <daily data of the new day, either as rain,lai,petcrop,petsoil for
+        all blocks, or a text file with a line of
+        block,rain,lai,petcrop,petsoil for every block, optional>
+
+Example:
+    from online import Online
+
+    store = Online('store')
+    store.add_blocks({'A1': 'ini.txt', 'A2': 'ini2.txt'})
+    store.step((12.5, 0.2, 0.4, 5.3))   # same daily data for all blocks
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import getopt
+import json
+import os
+import sys
+import tempfile
+import traceback
+
+from facade import Facade
+from soilwater import new_model, SoilWater
+
+
+class Online(object):
+    """Online class.
+
+    Advance the models of many blocks by one day at a time, keeping
+    their model states in a store folder.
+
+    ATTRIBUTES:
+        folder - the store folder
+        blocks - model inputs of every block, indexed by block name
+        states - day, model state, and model output file size of every
+                 block, indexed by block name
+
+    METHODS:
+        Statics:
+            write_atomic - replace a JSON file atomically
+
+        results_file - model output file of a block
+        model - model of a block, set to the block's model state
+        add_blocks - add new blocks, starting at day 0
+        step - advance the blocks by one day
+        save - save the model states of all blocks
+    """
+
+    def __init__(self, folder):
+        """Create the Online object, and read the store (if any).
+
+        Args:
+            folder: the store folder (created if it does not exist)
+        """
+        self.folder = folder
+        os.makedirs(os.path.join(folder, 'results'), exist_ok=True)
+        self.blocks = self.__read('blocks.json')
+        self.states = self.__read('state.json')
+
+    def __read(self, fname):
+        """Contents of a JSON file in the store (empty if none yet)."""
+        path = os.path.join(self.folder, fname)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'rt') as fin:
+            return json.loads(fin.read())
+
+    @staticmethod
+    def write_atomic(fname, obj):
+        """Replace a JSON file atomically, so it is never partly written.
+
+        Args:
+            fname: name of the JSON file
+            obj: the object to write
+
+        Returns:
+            None
+        """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname) or '.',
+                                   suffix='.tmp')
+        with os.fdopen(fd, 'wt') as fout:
+            fout.write(json.dumps(obj, separators=(',', ':')))
+            fout.flush()
+            os.fsync(fout.fileno())
+        os.replace(tmp, fname)
+
+    def results_file(self, name):
+        """Model output file of a given block."""
+        return os.path.join(self.folder, 'results', name + '.txt')
+
+    def model(self, name):
+        """Model (SoilWater object) of a block, set to its model state."""
+        model = new_model(self.blocks[name])
+        model.set_state(self.states[name]['state'])
+        return model
+
+    def add_blocks(self, blocks):
+        """Add new blocks (or restart existing ones), starting at day 0.
+
+        Args:
+            blocks: dictionary of the block names, and their model inputs
+                    (dictionaries) or model input text files
+
+        Returns:
+            None
+        """
+        for name, ini in blocks.items():
+            if not isinstance(ini, dict):
+                with open(ini, 'rt') as fin:
+                    ini = json.loads(fin.read())
+            self.blocks[name] = ini
+            model = SoilWater(ini)
+            headers = ['day'] + Facade.output_fields(model.numlayers)
+            fmt = ('{:>15s},' * len(headers)).rstrip(',') + '\n'
+            with open(self.results_file(name), 'wb') as fout:
+                fout.write(fmt.format(*headers).encode())
+                size = fout.tell()
+            self.states[name] = {'day': 0, 'state': model.get_state(),
+                                 'size': size}
+        Online.write_atomic(os.path.join(self.folder, 'blocks.json'),
+                            self.blocks)
+        self.save()
+
+    def step(self, dailydata):
+        """Advance the blocks by one day, then save their model states.
+
+        Args:
+            dailydata: daily data of the new day (rain, lai, petcrop, and
+                       petsoil), either as one tuple for all blocks, or
+                       as a dictionary of such tuples, indexed by block
+                       name (only these blocks are advanced)
+
+        Returns:
+            Dictionary of the new day of every advanced block
+        """
+        if isinstance(dailydata, dict):
+            names = list(dailydata)
+        else:
+            names = list(self.blocks)
+            dailydata = dict.fromkeys(names, tuple(dailydata))
+        days = {}
+        for name in names:
+            data = dailydata[name]
+            model = self.model(name)
+            model.daily_water_balance(*data)
+            vals = Facade.daily_outputs(model, data[0])
+            rec = self.states[name]
+            day = rec['day'] + 1
+            fmtrow = '{:>15d}' + ',{:>15.3f}' * len(vals) + '\n'
+            with open(self.results_file(name), 'r+b') as fout:
+                fout.seek(rec['size'])  # drop rows of unsaved days
+                fout.truncate()
+                fout.write(fmtrow.format(day, *vals).encode())
+                size = fout.tell()
+            self.states[name] = {'day': day, 'state': model.get_state(),
+                                 'size': size}
+            days[name] = day
+        self.save()
+        return days
+
+    def save(self):
+        """Save the model states of all blocks (atomically)."""
+        Online.write_atomic(os.path.join(self.folder, 'state.json'),
+                            self.states)
+
+
+def read_dailydata(text):
+    """Daily data of the new day, from the commandline (see step).
+
+    Args:
+        text: either rain,lai,petcrop,petsoil for all blocks, or a text
+              file with a line of block,rain,lai,petcrop,petsoil for
+              every block
+
+    Returns:
+        The daily data, as a tuple or a dictionary of tuples
+    """
+    if not os.path.isfile(text):
+        return tuple(float(val) for val in text.split(','))
+    dailydata = {}
+    with open(text, 'rt') as fin:
+        for line in fin:
+            vals = [val.strip() for val in line.split(',')]
+            if len(vals) == 5:
+                dailydata[vals[0]] = tuple(float(val) for val in vals[1:])
+    return dailydata
+
+
+def main(argv):
+    """Main entry point for advancing the blocks.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        folder = blocksfile = dailydata = None
+        opts, a = getopt.getopt(argv, "hs:b:f:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-s':           # store folder flag
+                folder = arg
+            elif opt == '-b':           # blocks file flag
+                blocksfile = arg
+            elif opt == '-f':           # daily data flag
+                dailydata = arg
+
+        if folder is None:
+            print('Flag -s is missing. Flags -b and -f are optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        store = Online(folder)
+        if blocksfile:
+            with open(blocksfile, 'rt') as fin:
+                store.add_blocks(json.loads(fin.read()))
+            print('Blocks added: {}'.format(len(store.blocks)))
+        if dailydata:
+            days = store.step(read_dailydata(dailydata))
+            print('Blocks advanced: {}, to day {}'.format(
+                len(days), max(days.values()) if days else 0))
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,77 @@
+"""Pedotransfer module.
+
+Soil water characteristics and saturated hydraulic conductivity from the
+soil texture (clay, sand, and organic matter), using the equations of
+Saxton & Rawls (2008), calibrated for Malaysian soils.
+
+Soil maps (and soil profiles) repeat only a few soil textures, so the
+results are kept (memoized) by soil texture, and the equations are solved
+only once per soil texture (see SoilLayer.initialize_layer).
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from collections import namedtuple
+import functools
+import math
+
+
+# Soil hydraulic properties.
+#    sat: saturation point (m3/m3)
+#    fc: field capacity (m3/m3)
+#    pwp: permanent wilting point (m3/m3)
+#    psd: pore-size distribution index (-)
+#    porosity: soil porosity (m3/m3)
+#    airentry: air-entry value (kPa)
+#    ksat: saturated hydraulic conductivity (m/day)
+Hydraulics = namedtuple('Hydraulics',
+                        'sat fc pwp psd porosity airentry ksat')
+
+
+@functools.lru_cache(maxsize=4096)
+def hydraulics(clay, sand, om):
+    """Soil hydraulic properties of a given soil texture (memoized).
+
+    Args:
+        clay: clay (%)
+        sand: sand (%)
+        om: organic matter (%)
+
+    Returns:
+        Hydraulics object
+    """
+    s = sand / 100  # convert sand and clay from % to fraction, but om is %
+    c = clay / 100
+    # 1. permanent wilting, field capacity, then saturation points:
+    n1 = -0.024 * s + 0.487 * c + 0.006 * om
+    n2 = 0.005 * (s*om) - 0.013 * (c * om) + 0.068 * (s * c) + 0.031
+    theta1500t = n1 + n2
+    theta1500 = theta1500t + (0.14 * theta1500t - 0.02)
+    n1 = -0.251 * s + 0.195 * c + 0.011 * om
+    n2 = 0.006 * (s*om) - 0.027 * (c * om) + 0.452 * (s * c) + 0.299
+    theta33t = n1 + n2
+    theta33 = theta33t + (1.283*theta33t**2 - 0.374*theta33t - 0.015)
+    n1 = 0.278 * s + 0.034 * c + 0.022 * om
+    n2 = - 0.018 * (s*om) - 0.027 * (c*om) - 0.584 * (s * c) + 0.078
+    theta_s33t = n1 + n2
+    theta_s33 = theta_s33t + 0.636 * theta_s33t - 0.107
+    theta0 = theta33 + theta_s33 - 0.097 * s + 0.043
+    # 2. pore size distribution index (no unit):
+    b = math.log(1500) - math.log(33)
+    b /= math.log(theta33) - math.log(theta1500)
+    psd = 1 / b
+    # 3. air-entry suction (kPa):
+    awc = theta0 - theta33
+    n1 = -21.674 * s - 27.932 * c - 81.975 * awc + 71.121 * (s * awc)
+    n2 = 8.294 * (c * awc) + 14.05 * (s * c) + 27.161
+    aet = n1 + n2
+    ae = max(0.0, aet + (0.02 * aet ** 2 - 0.113 * aet - 0.7))
+    # 4. calibrations/adjust for Malaysian soils (all in m3/m3):
+    theta1500 = 1.528 * theta1500 * (1 - theta1500)  # PWP
+    theta33 = 1.605 * theta33 * (1 - theta33)  # FC
+    theta0 = 2.225 * theta0 * (1 - theta0)  # SAT (= porosity)
+    # 5. saturated hydraulic conductivity (convert mm/hour to m/day):
+    ksat = 1930 * awc ** (3 - psd) * 24 / 1000
+    return Hydraulics(theta0, theta33, theta1500, psd, theta0, ae, ksat)
@@ -1,10 +1,25 @@
 """Plot module.
 
 Plot charts to depict model results. The soil water model
-must be run first before any charts can be plotted.
+must be run first before any charts can be plotted, unless the
+model results are loaded from the model output file of an earlier
+model run (see the from_output function).
+
+Charts are either shown in a window, or saved to an image file without
+any window (for batch jobs; see the render module to save the charts of
+many model runs in parallel).
 
 Requires matplotlib version of at least 2.0.
 
+Profiles of many soil layers are best shown as depth-time heatmaps (see
+the draw_heatmap function), where every soil layer field is drawn as one
+image, so the drawing time does not grow with the no. of soil layers.
+
+Long data series are decimated (reduced) for display to about the width
+of the charts (in pixels), so that charts of many years of data can be
+drawn quickly. Zooming into a chart redraws the zoomed part from the full
+(undecimated) data.
+
 @author Christopher Teh Boon Sung
 
 """
@@ -12,10 +27,16 @@ Requires matplotlib version of at least 2.0.
 
 import webbrowser
 
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import PcolorImage
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Button
+import numpy as np
 
+import decimate
 from facade import Facade
+from results import check_layers, load_results
 
 
 class Plot(Facade):
@@ -25,11 +46,21 @@ class Plot(Facade):
     Uses matplotlib for plotting.
 
     Note:
-        Run soil water model first before any charts can be plotted.
+        Run soil water model first before any charts can be plotted,
+        or load the model results of an earlier model run.
 
     ATTRIBUTES:
+        decimation - decimation method for chart lines, either 'minmax'
+                     (keep the envelope) or 'lttb' (keep the shape)
+        oversample - no. of points drawn per pixel of chart width
+        heatmaps - soil layer fields drawn as depth-time heatmaps, as
+                   (field, label, color map, centered at zero) tuples
 
     METHODS:
+        Class:
+            from_output - create a Plot object for the model results
+                          saved by an earlier model run
+
         Statics:
             generate_xvalues - generate a series of equally spaced values
                                (only integers)
@@ -40,7 +71,21 @@ class Plot(Facade):
             set_common_ylimits - set same scale for the y-axis for
                                  selected charts
 
+        numlayers - no. of soil layers in the model results
+        npoints - no. of points to draw per series in a chart
+        decimate_series - decimate a data series for display
+        series_data - data series in the model results for a given key
+        plot_series - plot a (decimated) data series
+        plot_bars - plot a (decimated) data series as bars
+        refresh_series - redraw the series for the visible x-axis range
+        fit_ylimits - adjust y-axis limits to cover the full data range
+        fit_common_ylimits - set same scale for the y-axis for
+                             selected charts
+        add_total_rain - show the total rain in a chart
         plot_soil_layers - plot charts to show a given layer property
+        layer_edges - depths of the soil layer boundaries
+        layer_grid - values of a soil layer property, one row per layer
+        plot_heatmap_field - plot a soil layer property as a heatmap
         get_layers_legend_text - create a legend for each soil layer's
                                  physical properties
         set_layers_legend - display the soil layer properties legend
@@ -49,22 +94,76 @@ class Plot(Facade):
         open_outputfile - open the output text file
         set_button_dataview - show a button to open the model
                               output/results text file
+        draw_detailed - draw charts on soil water content and fluxes
+        draw_basic - draw charts focussing more on the soil water content
+        draw_heatmap - draw depth-time heatmaps of the soil layers
+        show - show the drawn charts in a window
         plot_detailed - plot charts on soil water content and fluxes
         plot_basic - plot charts focussing more on the soil water content
+        plot_heatmap - plot depth-time heatmaps of the soil layers
         plot - set True to call plot_basic function,
                or False for plot_detailed function
+        render - draw the charts and save them to an image file
+        update_charts - redraw the drawn charts with other model results
     """
 
-    def __init__(self, fname_in, fname_out):
+    decimation = 'minmax'
+    oversample = 2
+    heatmaps = [('vwc', 'VWC\n' + r'(m$^{3}$ m$^{-3}$)', 'viridis', False),
+                ('t', 'T\n' + r'(mm day$^{-1}$)', 'viridis', False),
+                ('netflux', 'net flux\n' + r'(mm day$^{-1}$)', 'RdBu', True),
+                ('e', 'E\n' + r'(mm day$^{-1}$)', 'viridis', False),
+                ('influx', 'influx\n' + r'(mm day$^{-1}$)', 'RdBu', True),
+                ('outflux', 'outflux\n' + r'(mm day$^{-1}$)', 'RdBu', True)]
+
+    def __init__(self, fname_in, fname_out, cache=None):
         """Create the Plot object.
 
         Args:
-            fname_in: model input text file
+            fname_in: model input text file, or None if there are no
+                      model inputs (so only saved model results can be
+                      plotted, without the soil layer properties legend)
             fname_out: model output (results) text file
+            cache: cache of model results (ResultCache object), if any
         """
-        # parent handles the initialization
-        Facade.__init__(self, fname_in, fname_out)
+        if fname_in is not None:
+            # parent handles the initialization
+            Facade.__init__(self, fname_in, fname_out, cache)
+        else:
+            self.ini = self.dailydata = self.model = None
+            self.fname_out = fname_out
+            self.cache = cache
+            self.table = None
+            self.results = None
         self.__button = None    # matplotlib Button to open output file
+        self.__series = {}      # full data of the series in every chart
+        self.__limits = []      # y-axis limits set, redone on new data
+        self.__texts = []       # total rain texts, updated on new data
+        self.__legend = None    # soil layer properties legend text
+        self.__images = []      # heatmaps, updated on new data
+
+    @classmethod
+    def from_output(cls, fname_out, fname_in=None):
+        """Create a Plot object for the model results of an earlier run.
+
+        The model is not run. Instead, the model results are loaded from
+        the model output file (see the results module).
+
+        Args:
+            fname_out: model output (results) text file, its .gz copy,
+                       or the binary compressed numpy file (.npz)
+            fname_in: model input text file of the earlier model run,
+                      for the soil layer properties legend. Default:
+                      None (no soil layer properties legend).
+
+        Returns:
+            The Plot object, with the loaded model results
+        """
+        plot = cls(fname_in, fname_out)
+        plot.results = load_results(fname_out)
+        if plot.model is not None:
+            check_layers(plot.results, plot.model.numlayers)
+        return plot
 
     @staticmethod
     def generate_xvalues(start, end, max_intervals=25):
@@ -141,16 +240,15 @@ class Plot(Facade):
             None.
         """
         if yvals is None:
-            lines = ax.get_lines()
-            yvals = []
-            for line in lines:
-                ydata = line.get_ydata()
-                yvals.extend(ydata)
-
-        min_yval = min(yvals)
-        max_yval = max(yvals)
+            yvals = [np.asarray(line.get_ydata(), dtype=float)
+                     for line in ax.get_lines()]
+            yvals = np.concatenate(yvals) if yvals else np.zeros(1)
+
+        yvals = np.asarray(yvals, dtype=float)
+        min_yval = np.nanmin(yvals)
+        max_yval = np.nanmax(yvals)
         min_yaxis, max_yaxis = ax.get_ylim()
-        locs = plt.yticks()[0]
+        locs = ax.get_yticks()
         scale = abs(abs(locs[1]) - abs(locs[0]))
         if abs(abs(max_yaxis) - abs(max_yval)) < 0.5 * scale:
             max_yaxis += scale
@@ -180,6 +278,177 @@ class Plot(Facade):
         for ax in axs:
             ax.set_ylim(miny, maxy)
 
+    def numlayers(self):
+        """No. of soil layers in the model results."""
+        return len(self.results['layers']) if self.results else 0
+
+    def npoints(self, ax):
+        """No. of points to draw per series, based on the chart width."""
+        width = ax.get_window_extent().width    # in pixels
+        return max(10, int(width * Plot.oversample))
+
+    def decimate_series(self, ax, x, y, kind):
+        """Decimate a data series for display in a given chart.
+
+        Args:
+            ax: axes object
+            x: series of x values (numpy array)
+            y: series of y values (numpy array)
+            kind: 'line' or 'bars'
+
+        Returns:
+            Tuple of the decimated x and y values
+        """
+        npts = self.npoints(ax)
+        if kind == 'bars':
+            return decimate.binmax(x, y, npts)
+        if Plot.decimation == 'lttb':
+            return decimate.lttb(x, y, npts)
+        return decimate.minmax(x, y, npts // 2)
+
+    def series_data(self, key):
+        """The data series in the model results for a given key.
+
+        Args:
+            key: tuple naming the data series, either (output,) such as
+                 ('rain',), or ('layers', layer index, field) such as
+                 ('layers', 0, 'vwc')
+
+        Returns:
+            The data series (list of floats)
+        """
+        if key[0] == 'layers':
+            return self.results['layers'][key[1]][key[2]]
+        return self.results[key[0]]
+
+    def _register(self, ax, artist, x, y, kind, key):
+        """Keep the full data of a series, to redraw it when zoomed."""
+        if ax not in self.__series:
+            self.__series[ax] = []
+            ax.callbacks.connect('xlim_changed', self.refresh_series)
+        self.__series[ax].append([artist, x, y, kind, key])
+
+    def plot_series(self, ax, x, y, key=None, **kwargs):
+        """Plot a data series, decimated for display.
+
+        Args:
+            ax: axes object
+            x: series of x values
+            y: series of y values
+            key: name of the data series in the model results (see
+                 series_data), so the chart can be reused for other model
+                 results. Default: None (chart cannot be reused).
+            kwargs: keyword arguments for matplotlib's plot function
+
+        Returns:
+            The plotted line (Line2D object)
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        xd, yd = self.decimate_series(ax, x, y, 'line')
+        line, = ax.plot(xd, yd, **kwargs)
+        self._register(ax, line, x, y, 'line', key)
+        return line
+
+    def plot_bars(self, ax, x, y, key=None, **kwargs):
+        """Plot a data series as bars, decimated for display.
+
+        Bars are drawn as vertical lines if there are more data points
+        than pixels, where each line shows the maximum within its pixel.
+
+        Args:
+            ax: axes object
+            x: series of x values
+            y: series of y values
+            key: name of the data series in the model results (see
+                 series_data). Default: None (chart cannot be reused).
+            kwargs: keyword arguments for matplotlib's bar function
+
+        Returns:
+            None
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if len(x) <= self.npoints(ax):
+            # few enough to draw every bar
+            bars = ax.bar(x, y, **kwargs)
+            self._register(ax, bars, x, y, 'allbars', key)
+            return
+        xd, yd = self.decimate_series(ax, x, y, 'bars')
+        lines = ax.vlines(xd, 0.0, yd, **kwargs)
+        self._register(ax, lines, x, y, 'bars', key)
+
+    def refresh_series(self, ax):
+        """Redraw the series of a chart for its visible x-axis range.
+
+        Called whenever the chart's x-axis range changes (such as when
+        zooming or panning), so that zooming in shows the full data.
+
+        Args:
+            ax: axes object
+
+        Returns:
+            None
+        """
+        x0, x1 = sorted(ax.get_xlim())
+        for artist, x, y, kind, key in self.__series.get(ax, []):
+            if kind == 'allbars':
+                continue    # every bar is already drawn
+            # visible points, plus one more on each side:
+            lo = max(0, np.searchsorted(x, x0) - 1)
+            hi = min(len(x), np.searchsorted(x, x1, side='right') + 1)
+            xd, yd = self.decimate_series(ax, x[lo:hi], y[lo:hi], kind)
+            if kind == 'bars':
+                artist.set_segments([[(xi, 0.0), (xi, yi)]
+                                     for xi, yi in zip(xd, yd)])
+            else:
+                artist.set_data(xd, yd)
+
+    def fit_ylimits(self, ax, key=None, miny=None):
+        """Adjust the y-axis limits to cover the full range of data.
+
+        Same as set_ylmt, but it is redone whenever the chart is reused
+        for other model results.
+
+        Args:
+            ax: axes object
+            key: name of the data series (see series_data) to cover.
+                 Default: cover all the lines in the chart.
+            miny: the minimum value of y-axis
+
+        Returns:
+            None
+        """
+        self.__limits.append((ax, key, miny))
+        yvals = self.series_data(key) if key is not None else None
+        Plot.set_ylmt(ax, yvals, miny)
+
+    def fit_common_ylimits(self, axs):
+        """Set same y-axis scale for given charts (see set_common_ylimits).
+
+        Same as set_common_ylimits, but it is redone whenever the chart
+        is reused for other model results.
+
+        Args:
+            axs: a list of axis objects to have the same y-axis scale
+        """
+        self.__limits.append((axs, None, None))
+        Plot.set_common_ylimits(axs)
+
+    def add_total_rain(self, ax):
+        """Show the total rain at the top left of a chart.
+
+        Args:
+            ax: axes object
+
+        Returns:
+            None
+        """
+        totrain = 'total rain = {:.1f} mm\n'.format(
+            np.sum(self.results['rain']))
+        txt = ax.text(1, ax.get_ylim()[1], totrain)
+        self.__texts.append((ax, txt))
+
     def plot_soil_layers(self, ax, x, field, include_layers=None):
         """Plot a given soil layer property.
 
@@ -194,14 +463,96 @@ class Plot(Facade):
             if not include_layers or i in include_layers:
                 y = layer[field]
                 txt = 'layer' + str(i + 1)
-                ax.plot(x, y, lw=2, label=txt, color=Plot.color(i))
+                self.plot_series(ax, x, y, ('layers', i, field), lw=2,
+                                 label=txt, color=Plot.color(i))
+
+    def layer_edges(self):
+        """Depths of the soil layer boundaries, from the soil surface.
+
+        The real depths (from the soil layer thicknesses) are used if the
+        model is known; otherwise (model results loaded from a file),
+        the soil layer numbers are used instead.
+
+        Returns:
+            Tuple of the boundary depths (numpy array, one more than the
+            no. of soil layers) and their y-axis label
+        """
+        if self.model is None:
+            return np.arange(self.numlayers() + 1) + 0.5, 'layer no.'
+        edges = [0.0] + [layer.accthick for layer in self.model.layers]
+        return np.array(edges), 'depth (m)'
+
+    def layer_grid(self, field):
+        """Values of a given soil layer property, one row per soil layer.
+
+        Args:
+            field: name of soil layer property (string)
+
+        Returns:
+            numpy array of the values (soil layers by days)
+        """
+        return np.array([layer[field] for layer in self.results['layers']],
+                        dtype=float)
+
+    def _set_heatmap(self, img, field, centered):
+        """Set the data and color limits of a heatmap."""
+        grid = self.layer_grid(field)
+        img.set_data(np.arange(grid.shape[1] + 1) + 0.5,
+                     self.layer_edges()[0], grid)
+        vmin = np.nanmin(grid)
+        vmax = np.nanmax(grid)
+        if centered:
+            # same color range on both sides of zero:
+            vmax = max(abs(vmin), abs(vmax)) or 1.0
+            vmin = -vmax
+        elif vmin == vmax:
+            vmax = vmin + 1.0
+        img.set_clim(vmin, vmax)
+
+    def plot_heatmap_field(self, ax, field, label, cmap, centered=False):
+        """Plot a given soil layer property as a depth-time heatmap.
+
+        The soil layer property is drawn as one image (rather than one
+        line per soil layer), where every row of the image is a soil layer
+        as thick as the real soil layer. The rooting depth is drawn over
+        the image, if the soil layer depths are known.
+
+        Args:
+            ax: axes object
+            field: name of soil layer property (string)
+            label: label of the color bar
+            cmap: name of matplotlib color map
+            centered: True to center the colors at zero (for fluxes)
+
+        Returns:
+            None
+        """
+        edges, ylabel = self.layer_edges()
+        nlen = len(self.results['rain'])
+        img = PcolorImage(ax, cmap=cmap)
+        self._set_heatmap(img, field, centered)
+        ax.add_image(img)
+        self.__images.append((img, field, centered))
+        ax.set_xlim(0.5, nlen + 0.5)
+        ax.set_ylim(edges[-1], edges[0])    # depth increases downwards
+        ax.figure.colorbar(img, ax=ax, label=label)
+        if self.model is not None:
+            x = np.arange(1, nlen + 1)
+            self.plot_series(ax, x, self.results['rootdepth'],
+                             ('rootdepth',), lw=2, ls='dashed',
+                             label='root zone', color=Plot.color(0))
+            ax.set_ylim(edges[-1], edges[0])
+        ax.set_ylabel(ylabel)
 
     # noinspection PyProtectedMember
     def get_layers_legend_text(self):
         """Create a legend for each soil layer's physical properties.
 
-        Returns the text information for the legend as a plain string.
+        Returns the text information for the legend as a plain string,
+        or None if there is no model (results loaded from a file).
         """
+        if self.model is None:
+            return None   # soil layer properties are not known
         nlayers = self.model.numlayers
         if nlayers < 1:
             return None   # need at least one layer to display info.
@@ -262,32 +613,46 @@ class Plot(Facade):
         # done, so return the whole text information
         return legendtxt
 
-    def set_layers_legend(self):
-        """Format and diplay the legend for soil layer properties."""
-        ax = plt.axes([0.52, 0.0, 0.4, 0.2])     # lower right corner
+    def set_layers_legend(self, fig=None):
+        """Format and diplay the legend for soil layer properties.
+
+        Args:
+            fig: the figure to display in. Default: the current figure
+        """
+        fig = fig or plt.gcf()
+        ax = fig.add_axes([0.52, 0.0, 0.4, 0.2])  # lower right corner
         ax.spines['left'].set_visible(False)     # turn off tick marks
         ax.spines['right'].set_visible(False)
         ax.spines['top'].set_visible(False)
         ax.spines['bottom'].set_visible(False)
         ax.set_facecolor(plt.rcParams['figure.facecolor'])  # seamless
-        ax.tick_params(axis='both', which='both', bottom='off',
-                       top='off', labelbottom='off', right='off',
-                       left='off', labelleft='off')
+        ax.tick_params(axis='both', which='both', bottom=False,
+                       top=False, labelbottom=False, right=False,
+                       left=False, labelleft=False)
         data = self.get_layers_legend_text()  # get the layer properties
+        if data is None:
+            return  # no soil layer properties to show
         # display legend (monospace font to properly align column texts)
-        ax.text(0, 0, data, fontname='Courier New', fontsize=9,
-                weight='bold',
-                horizontalalignment='left', verticalalignment='bottom')
+        self.__legend = ax.text(0, 0, data,
+                                fontfamily='monospace',
+                                fontsize=9, weight='bold',
+                                horizontalalignment='left',
+                                verticalalignment='bottom')
 
-    def set_charts_legend(self):
-        """Format and display the chart lines legend."""
-        ax = plt.axes([0, 0.96, 0.5, 0.04])   # upper right corner
+    def set_charts_legend(self, fig=None):
+        """Format and display the chart lines legend.
+
+        Args:
+            fig: the figure to display in. Default: the current figure
+        """
+        fig = fig or plt.gcf()
+        ax = fig.add_axes([0, 0.96, 0.5, 0.04])   # upper right corner
         ax.spines['left'].set_visible(False)  # no ticks
         ax.spines['right'].set_visible(False)
         ax.spines['top'].set_visible(False)
         ax.spines['bottom'].set_visible(False)
         # create fake charts, so we can get the legend text and lines:
-        nlayers = self.model.numlayers
+        nlayers = self.numlayers()
         for i in range(nlayers):
             txt = 'layer' + str(i + 1)
             ax.plot([0], [0], label=txt, lw=3, color=Plot.color(i))
@@ -296,9 +661,9 @@ class Plot(Facade):
                 color=Plot.color(nlayers))
         ax.set_facecolor(plt.rcParams['figure.facecolor'])   # seamless
         ax.legend(loc='upper left', ncol=nlayers + 1)
-        ax.tick_params(axis='both', which='both', bottom='off',
-                       top='off', labelbottom='off', right='off',
-                       left='off', labelleft='off')
+        ax.tick_params(axis='both', which='both', bottom=False,
+                       top=False, labelbottom=False, right=False,
+                       left=False, labelleft=False)
 
     def remove_ticks(self, axs):
         """Remove x-axis labels for selected axis objects.
@@ -329,9 +694,14 @@ class Plot(Facade):
         """Open the weather stats file using the OS's default program."""
         webbrowser.open(self.fname_out)  # NB: may not always work
 
-    def set_button_dataview(self):
-        """Show a button to open the model output/results text file."""
-        ax = plt.axes([0, 0, 0.1, 0.05])    # lower left corner
+    def set_button_dataview(self, fig=None):
+        """Show a button to open the model output/results text file.
+
+        Args:
+            fig: the figure to display in. Default: the current figure
+        """
+        fig = fig or plt.gcf()
+        ax = fig.add_axes([0, 0, 0.1, 0.05])    # lower left corner
         ax.spines['left'].set_visible(False)      # borderless button
         ax.spines['right'].set_visible(False)
         ax.spines['top'].set_visible(False)
@@ -341,17 +711,23 @@ class Plot(Facade):
         # set up the button event mouse click
         self.__button.on_clicked(self.open_outputfile)
 
-    def plot_detailed(self):
-        """Plot charts on soil water content but emphasize water fluxes.
+    def draw_detailed(self, fig):
+        """Draw charts on soil water content but emphasize water fluxes.
 
-        Unlike the plot_basic function, this function will plot the data
+        Unlike the draw_basic function, this function will draw the data
         from all soil layers, not just the first six layers.
 
         Note:
             This function must be used only after a model run
             to set the results attribute.
+
+        Args:
+            fig: the figure to draw in
+
+        Returns:
+            None
         """
-        nlayers = self.model.numlayers
+        nlayers = self.numlayers()
         out = self.results
         if nlayers < 1 or not out:
             return None   # if there are no layers or no model results
@@ -359,111 +735,109 @@ class Plot(Facade):
         ncol = 2
         nrow = 5
         nlen = len(out['rain'])
-        x = [i + 1 for i in range(nlen)]
+        x = np.arange(1, nlen + 1)
 
         # 1st column: plot the rainfall:
         y = out['rain']
-        ax1 = plt.subplot(nrow, ncol, 1)
-        ax1.bar(x, y, label='rain', color=Plot.color(0))
-        Plot.set_ylmt(ax1, y, 0.0)
+        ax1 = fig.add_subplot(nrow, ncol, 1)
+        self.plot_bars(ax1, x, y, ('rain',), label='rain',
+                       color=Plot.color(0))
+        self.fit_ylimits(ax1, ('rain',), 0.0)
         ax1.set_ylabel('rain\n(mm)')
-        totrain = 'total rain = {:.1f} mm\n'.format(sum(y))
-        ax1.text(x[0], ax1.get_ylim()[1], totrain)
+        self.add_total_rain(ax1)
 
         # 1st column: plot the volumetric water content (vwc):
-        ax2 = plt.subplot(nrow, ncol, 3, sharex=ax1)
+        ax2 = fig.add_subplot(nrow, ncol, 3, sharex=ax1)
         ax2.set_ylabel('VWC\n' + r'(m$^{3}$ m$^{-3}$)')
         self.plot_soil_layers(ax2, x, 'vwc')
         y = out['rootvwc']
-        ax2.plot(x, y, lw=3, label='root zone', ls='dashed',
-                 color=Plot.color(nlayers))
-        Plot.set_ylmt(ax2, miny=0.0)
+        self.plot_series(ax2, x, y, ('rootvwc',), lw=3, label='root zone',
+                         ls='dashed', color=Plot.color(nlayers))
+        self.fit_ylimits(ax2, miny=0.0)
 
         # 1st column: plot net fluxes:
-        ax3 = plt.subplot(nrow, ncol, 5, sharex=ax1)
+        ax3 = fig.add_subplot(nrow, ncol, 5, sharex=ax1)
         ax3.set_ylabel('net flux\n' + r'(mm day$^{-1}$)')
         self.plot_soil_layers(ax3, x, 'netflux')
-        Plot.set_ylmt(ax3)
+        self.fit_ylimits(ax3)
 
         # 1st column: plot influxes:
-        ax4 = plt.subplot(nrow, ncol, 7, sharex=ax1)
+        ax4 = fig.add_subplot(nrow, ncol, 7, sharex=ax1)
         ax4.set_ylabel('influx\n' + r'(mm day$^{-1}$)')
         self.plot_soil_layers(ax4, x, 'influx')
-        Plot.set_ylmt(ax4)
+        self.fit_ylimits(ax4)
 
         # 1st column: plot outfluxes:
-        ax5 = plt.subplot(nrow, ncol, 9, sharex=ax1)
+        ax5 = fig.add_subplot(nrow, ncol, 9, sharex=ax1)
         ax5.set_xlim([1, nlen])
         ax5.set_ylabel('outflux\n' + r'(mm day$^{-1}$)')
         self.plot_soil_layers(ax5, x, 'outflux')
-        Plot.set_ylmt(ax5)
+        self.fit_ylimits(ax5)
 
         # 2nd column: plot rainfall again (as reference)
         y = out['rain']
-        ax6 = plt.subplot(nrow, ncol, 2)
-        ax6.bar(x, y, label='rain', color=Plot.color(0))
-        Plot.set_ylmt(ax6, y, 0.0)
+        ax6 = fig.add_subplot(nrow, ncol, 2)
+        self.plot_bars(ax6, x, y, ('rain',), label='rain',
+                       color=Plot.color(0))
+        self.fit_ylimits(ax6, ('rain',), 0.0)
         ax6.set_ylabel('rain\n(mm)')
-        ax6.text(x[0], ax6.get_ylim()[1], totrain)
+        self.add_total_rain(ax6)
 
         # 2nd. column: plot the water content (wc):
-        ax7 = plt.subplot(nrow, ncol, 4, sharex=ax6)
+        ax7 = fig.add_subplot(nrow, ncol, 4, sharex=ax6)
         ax7.set_xlim([1, nlen])
         ax7.set_ylabel('water\n(mm)')
         self.plot_soil_layers(ax7, x, 'wc')
-        nlayers = self.model.numlayers
         y = out['rootwc']
-        ax7.plot(x, y, lw=3, label='root zone', ls='dashed',
-                 color=Plot.color(nlayers))
-        Plot.set_ylmt(ax7, miny=0.0)
+        self.plot_series(ax7, x, y, ('rootwc',), lw=3, label='root zone',
+                         ls='dashed', color=Plot.color(nlayers))
+        self.fit_ylimits(ax7, miny=0.0)
 
         # 2nd. column: plot the transpiration (t):
-        ax8 = plt.subplot(nrow, ncol, 6, sharex=ax6)
+        ax8 = fig.add_subplot(nrow, ncol, 6, sharex=ax6)
         ax8.set_xlim([1, nlen])
         ax8.set_ylabel('T\n' + r'(mm day$^{-1}$)')
         self.plot_soil_layers(ax8, x, 't')
-        Plot.set_ylmt(ax8, miny=0.0)
+        self.fit_ylimits(ax8, miny=0.0)
 
         # 2nd. column: plot the evaporation (e):
-        ax9 = plt.subplot(nrow, ncol, 8, sharex=ax6)
+        ax9 = fig.add_subplot(nrow, ncol, 8, sharex=ax6)
         ax9.set_xlim([1, nlen])
         ax9.set_ylabel('E\n' + r'(mm day$^{-1}$)')
         # evaporation only from layer 1, so exclude others
         self.plot_soil_layers(ax9, x, 'e', [0])
-        Plot.set_ylmt(ax9, miny=0.0)
+        self.fit_ylimits(ax9, miny=0.0)
 
         # display the legends:
-        self.set_layers_legend()    # soil properties legend
-        self.set_charts_legend()    # soil chart lines legend
-        self.set_button_dataview()  # button to view results text file
+        self.set_layers_legend(fig)     # soil properties legend
+        self.set_charts_legend(fig)     # soil chart lines legend
 
         # format the subplots:
-        self.set_common_ylimits([ax8, ax9])
-        self.set_common_ylimits([ax3, ax4, ax5])
+        self.fit_common_ylimits([ax8, ax9])
+        self.fit_common_ylimits([ax3, ax4, ax5])
         axsleft = [ax1, ax2, ax3, ax4, ax5]
         axsright = [ax6, ax7, ax8, ax9]
         self.remove_ticks(axsleft)      # first column charts
         self.remove_ticks(axsright)     # second column charts
         Plot.turnon_grid(axsleft + axsright)  # on grid for all charts
-        plt.gcf().canvas.set_window_title('Pywaterbal')
 
-        # now show all the subplots:
-        mng = plt.get_current_fig_manager()
-        mng.window.showMaximized()
-        plt.show()
-        self.__button = None
+    def draw_basic(self, fig):
+        """Draw charts focusing more on the soil water content.
 
-    def plot_basic(self):
-        """Plot charts focusing more on the soil water content.
-
-        Only data from the first six (6) soil layers will be plotted;
-        use plot_detailed function to plot all soil layers.
+        Only data from the first six (6) soil layers will be drawn;
+        use draw_detailed function to draw all soil layers.
 
         Note:
            This function must be used only after a model run to
            set the results attribute.
+
+        Args:
+            fig: the figure to draw in
+
+        Returns:
+            None
         """
-        nlayers = self.model.numlayers
+        nlayers = self.numlayers()
         out = self.results
         if nlayers < 1 or not out:
             return None   # if there are no layers or no model results
@@ -471,52 +845,54 @@ class Plot(Facade):
         ncol = 2
         nrow = 5
         nlen = len(out['rain'])
-        x = [i + 1 for i in range(nlen)]
+        x = np.arange(1, nlen + 1)
 
         axsleft = []
         axsright = []
         # 1st column: plot the rainfall:
         y = out['rain']
-        ax1 = plt.subplot(nrow, ncol, 1)
-        ax1.bar(x, y, label='rain', color=Plot.color(0))
-        Plot.set_ylmt(ax1, y, 0.0)
-        totrain = 'total rain = {:.1f} mm\n'.format(sum(y))
-        ax1.text(x[0], ax1.get_ylim()[1], totrain)
+        ax1 = fig.add_subplot(nrow, ncol, 1)
+        self.plot_bars(ax1, x, y, ('rain',), label='rain',
+                       color=Plot.color(0))
+        self.fit_ylimits(ax1, ('rain',), 0.0)
+        self.add_total_rain(ax1)
         ax1.set_ylabel('rain\n(mm)')
         axsleft.append(ax1)
 
         # 1st column: plot the volumetric water content for all layers:
-        ax2 = plt.subplot(nrow, ncol, 3, sharex=ax1)
+        ax2 = fig.add_subplot(nrow, ncol, 3, sharex=ax1)
         ax2.set_ylabel('VWC\n' + r'(m$^{3}$ m$^{-3}$)')
         self.plot_soil_layers(ax2, x, 'vwc')
         y = out['rootvwc']
-        ax2.plot(x, y, lw=3, label='root zone', ls='dashed',
-                 color=Plot.color(nlayers))
-        Plot.set_ylmt(ax2, miny=0.0)
+        self.plot_series(ax2, x, y, ('rootvwc',), lw=3, label='root zone',
+                         ls='dashed', color=Plot.color(nlayers))
+        self.fit_ylimits(ax2, miny=0.0)
         axsleft.append(ax2)
 
         # 2nd column: plot rainfall again (as reference)
         y = out['rain']
-        ax6 = plt.subplot(nrow, ncol, 2)
-        ax6.bar(x, y, label='rain', color=Plot.color(0))
-        Plot.set_ylmt(ax6, y, 0.0)
+        ax6 = fig.add_subplot(nrow, ncol, 2)
+        self.plot_bars(ax6, x, y, ('rain',), label='rain',
+                       color=Plot.color(0))
+        self.fit_ylimits(ax6, ('rain',), 0.0)
         ax6.set_ylabel('rain\n(mm)')
-        ax6.text(x[0], ax6.get_ylim()[1], totrain)
+        self.add_total_rain(ax6)
         axsright.append(ax6)
 
         for i, layer in enumerate(self.results['layers']):
             y = layer['vwc']
             txt = 'layer' + str(i + 1)
             if i < 3:
-                ax = plt.subplot(nrow, ncol, 2 * i + 5, sharex=ax1)
+                ax = fig.add_subplot(nrow, ncol, 2 * i + 5, sharex=ax1)
                 axsleft.append(ax)
             else:
-                ax = plt.subplot(nrow, ncol, 2 * i - 2, sharex=ax6)
+                ax = fig.add_subplot(nrow, ncol, 2 * i - 2, sharex=ax6)
                 axsright.append(ax)
 
             ax.set_ylabel(txt + ' VWC\n' + r'(m$^{3}$ m$^{-3}$)')
-            ax.plot(x, y, lw=2, label=txt, color=Plot.color(i))
-            Plot.set_ylmt(ax, miny=0.0)
+            self.plot_series(ax, x, y, ('layers', i, 'vwc'), lw=2,
+                             label=txt, color=Plot.color(i))
+            self.fit_ylimits(ax, miny=0.0)
 
         ax8 = ax9 = None
         if nlayers < 6:
@@ -525,41 +901,42 @@ class Plot(Facade):
                 loc = 6
             elif nlayers == 5:
                 loc = 8
-            ax7 = plt.subplot(nrow, ncol, loc, sharex=ax6)
+            ax7 = fig.add_subplot(nrow, ncol, loc, sharex=ax6)
             ax7.set_ylabel('VWC\n' + r'(m$^{3}$ m$^{-3}$)')
             y = out['rootvwc']
-            ax7.plot(x, y, lw=3, label='root zone',
-                     ls='dashed', color=Plot.color(nlayers))
-            Plot.set_ylmt(ax7, miny=0.0)
+            self.plot_series(ax7, x, y, ('rootvwc',), lw=3,
+                             label='root zone', ls='dashed',
+                             color=Plot.color(nlayers))
+            self.fit_ylimits(ax7, miny=0.0)
             axsright.append(ax7)
 
             if nlayers < 5:
                 loc = 6
                 if nlayers == 4:
                     loc = 8
-                ax8 = plt.subplot(nrow, ncol, loc, sharex=ax6)
+                ax8 = fig.add_subplot(nrow, ncol, loc, sharex=ax6)
                 ax8.set_xlim([1, nlen])
                 ax8.set_ylabel('water\n(mm)')
                 self.plot_soil_layers(ax8, x, 'wc')
                 y = out['rootwc']
-                ax8.plot(x, y, lw=3, label='root zone',
-                         ls='dashed', color=Plot.color(nlayers))
-                Plot.set_ylmt(ax8, miny=0.0)
+                self.plot_series(ax8, x, y, ('rootwc',), lw=3,
+                                 label='root zone', ls='dashed',
+                                 color=Plot.color(nlayers))
+                self.fit_ylimits(ax8, miny=0.0)
 
                 if nlayers < 4:
                     loc = 8
-                    ax9 = plt.subplot(nrow, ncol, loc, sharex=ax6)
+                    ax9 = fig.add_subplot(nrow, ncol, loc, sharex=ax6)
                     ax9.set_ylabel('net flux\n' + r'(mm day$^{-1}$)')
                     self.plot_soil_layers(ax9, x, 'netflux')
-                    Plot.set_ylmt(ax9)
+                    self.fit_ylimits(ax9)
 
         # display the legends:
-        self.set_layers_legend()    # soil properties legend
-        self.set_charts_legend()    # soil chart lines legend
-        self.set_button_dataview()  # button to view results text file
+        self.set_layers_legend(fig)     # soil properties legend
+        self.set_charts_legend(fig)     # soil chart lines legend
 
         # format the subplots:
-        self.set_common_ylimits([ax2] + axsleft[1:] + axsright[1:])
+        self.fit_common_ylimits([ax2] + axsleft[1:] + axsright[1:])
         if ax8:
             axsright.append(ax8)
         if ax9:
@@ -568,14 +945,102 @@ class Plot(Facade):
         self.remove_ticks(axsleft)    # first column charts
         self.remove_ticks(axsright)   # second column charts
         Plot.turnon_grid(axsleft + axsright)    # on grid for all charts
-        plt.gcf().canvas.set_window_title('Pywaterbal')
 
-        # now show all the subplots:
+    def draw_heatmap(self, fig):
+        """Draw depth-time heatmaps of the soil layer properties.
+
+        Every soil layer property is drawn as one image, so unlike the
+        draw_basic and draw_detailed functions, any no. of soil layers can
+        be drawn (and quickly).
+
+        Note:
+           This function must be used only after a model run to
+           set the results attribute.
+
+        Args:
+            fig: the figure to draw in
+
+        Returns:
+            None
+        """
+        nlayers = self.numlayers()
+        out = self.results
+        if nlayers < 1 or not out:
+            return None   # if there are no layers or no model results
+
+        ncol = 2
+        nrow = len(Plot.heatmaps) // ncol
+        axsleft = []
+        axsright = []
+        for i, (field, label, cmap, centered) in enumerate(Plot.heatmaps):
+            axs = axsleft if i % ncol == 0 else axsright
+            sharex = axs[0] if axs else None
+            ax = fig.add_subplot(nrow, ncol, i + 1, sharex=sharex)
+            self.plot_heatmap_field(ax, field, label, cmap, centered)
+            axs.append(ax)
+
+        self.remove_ticks(axsleft)    # first column charts
+        self.remove_ticks(axsright)   # second column charts
+
+    def show(self, fig):
+        """Show the drawn charts in a (maximized) window.
+
+        Args:
+            fig: the figure to show
+
+        Returns:
+            None
+        """
+        self.set_button_dataview(fig)  # button to view results text file
         mng = plt.get_current_fig_manager()
-        mng.window.showMaximized()
+        mng.set_window_title('Pywaterbal')
+        # now show all the subplots:
+        try:
+            mng.window.showMaximized()
+        except AttributeError:
+            pass    # not all backends can maximize a window
         plt.show()
         self.__button = None
 
+    def plot_detailed(self):
+        """Plot charts on soil water content but emphasize water fluxes.
+
+        Unlike the plot_basic function, this function will plot the data
+        from all soil layers, not just the first six layers.
+
+        Note:
+            This function must be used only after a model run
+            to set the results attribute.
+        """
+        fig = plt.gcf()
+        self.draw_detailed(fig)
+        self.show(fig)
+
+    def plot_basic(self):
+        """Plot charts focusing more on the soil water content.
+
+        Only data from the first six (6) soil layers will be plotted;
+        use plot_detailed function to plot all soil layers.
+
+        Note:
+           This function must be used only after a model run to
+           set the results attribute.
+        """
+        fig = plt.gcf()
+        self.draw_basic(fig)
+        self.show(fig)
+
+    def plot_heatmap(self):
+        """Plot depth-time heatmaps of the soil layer properties.
+
+        Note:
+           This function must be used only after a model run to
+           set the results attribute.
+        """
+        fig = plt.gcf()
+        self.draw_heatmap(fig)
+        self.show(fig)
+
     def plot(self, basic=True):
         """Call either plot_basic or plot_detailed function for plotting.
 
@@ -597,3 +1062,78 @@ class Plot(Facade):
             self.plot_basic()
         else:
             self.plot_detailed()
+
+    def render(self, fname, basic=True, figsize=(19.2, 10.8), dpi=100):
+        """Draw the charts and save them to an image file (no window).
+
+        Uses the non-interactive Agg backend, so no display is needed.
+        The image format (such as PNG, SVG, or PDF) is given by the
+        file name extension.
+
+        Args:
+            fname: name of image file
+            basic: True to draw basic charts, or False for detailed ones
+            figsize: width and height of the image (inches)
+            dpi: resolution of the image (dots per inch)
+
+        Returns:
+            The drawn figure, which can be reused (see update_charts)
+        """
+        fig = Figure(figsize=figsize, dpi=dpi)
+        FigureCanvasAgg(fig)
+        if basic:
+            self.draw_basic(fig)
+        else:
+            self.draw_detailed(fig)
+        fig.savefig(fname)
+        return fig
+
+    def update_charts(self, results, model=None):
+        """Redraw the already drawn charts with other model results.
+
+        Much faster than drawing the charts again, as the layout of the
+        charts (axes, labels, legends, and ticks) is reused. The other
+        model results must have the same no. of soil layers and days.
+
+        Args:
+            results: dictionary containing the other model results
+            model: the other soil water model (for its soil layer
+                   properties). Default: keep the current model.
+
+        Returns:
+            None
+        """
+        self.results = results
+        if model is not None:
+            self.model = model
+        for ax, entries in self.__series.items():
+            ax.set_autoscaley_on(True)
+            ax.relim()
+            for entry in entries:
+                artist, x, y, kind, key = entry
+                y = np.asarray(self.series_data(key), dtype=float)
+                entry[2] = y
+                if kind == 'allbars':
+                    for rect, height in zip(artist, y):
+                        rect.set_height(height)
+                    ax.update_datalim([(x[0], 0.0), (x[-1], y.max())])
+                elif kind == 'bars':
+                    ax.update_datalim([(x[0], 0.0), (x[-1], y.max())])
+            self.refresh_series(ax)
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        # redo the y-axis limits, then the rest that depends on them:
+        for ax, key, miny in self.__limits:
+            if isinstance(ax, list):
+                Plot.set_common_ylimits(ax)
+            else:
+                yvals = self.series_data(key) if key is not None else None
+                Plot.set_ylmt(ax, yvals, miny)
+        for img, field, centered in self.__images:
+            self._set_heatmap(img, field, centered)
+        totrain = 'total rain = {:.1f} mm\n'.format(np.sum(results['rain']))
+        for ax, txt in self.__texts:
+            txt.set_text(totrain)
+            txt.set_position((1, ax.get_ylim()[1]))
+        if self.__legend is not None and self.model is not None:
+            self.__legend.set_text(self.get_layers_legend_text())
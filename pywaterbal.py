@@ -4,29 +4,86 @@ Soil water model.
 
 How to use:
 
-    python pywaterbal.py <flags>
+    python pywaterbal.py <command> <flags>
 
-where <flags> are the following:
+where <command> is one of the following:
+    run - run the model (no charts)
+    plot - run the model, then plot charts to show the model results
+    batch - run many model runs in parallel, as listed in a batch file
+    compare - plot the model results of many earlier model runs together
+
+and <flags> for the run and plot commands are the following:
     -i <model input text file>
     -o <model output/results text file>
     -n <number of daily time steps to run the model, in days>
-    -p <plot charts to show the model results, optional>
+    -p <type of charts to plot, optional (plot command only)>
+    -c <folder to cache the model results, optional>
+    -a <period to aggregate the model outputs by: week, month, season, or
+        a no. of days, optional (run command only)>
+    -d <date of day 1 as YYYY-MM-DD, for -a month or season, optional
+        (default: 2001-01-01)>
+
+and <flags> for the batch command are the following:
+    -b <batch file, listing the model runs (see batch.py)>
+    -w <number of worker processes, optional (default: no. of CPUs)>
+    -c <folder to cache the model results, optional>
+    -f <image format to save charts in, e.g., png, svg or pdf, optional>
+    -p <type of charts to save, optional (used only with -f)>
+    -l <JSON file to learn the run times of jobs in, optional>
+    -s <max. predicted run time of a job, in seconds, before it is run
+        in checkpointed segments, optional (default: 60)>
+
+and <flags> for the compare command are the following, followed by the
+model output/results text files of the model runs to compare:
+    -f <model outputs to plot, comma-separated, optional (default: rootvwc)>
+    -b <lower and upper percentiles of bands, e.g., 5,95, optional>
+
+The -p flag is optional and must either be 'b' for basic chart plotting,
+or 'h' for depth-time heatmaps of the soil layers (for the plot command
+only; best for many soil layers), or 'l' for live charts of the soil
+water content, shown while the model is being run (for the plot command
+only; best for long model runs). For detailed chart plotting, use any
+single letter other than 'b', 'h', or 'l'. Default is basic chart
+plotting.
+
+The -c flag is optional. If given, model results are cached in the given
+folder, so that repeating the same model run (same model inputs, daily
+data, and duration) retrieves its results from the cache instead.
+
+If the -n flag is left out for the plot command, the model is not run.
+Instead, the model results saved in the model output file (-o flag) by
+an earlier model run are plotted. The -i flag is then optional, and if
+given, it is used only to show the soil layer properties.
+
+The -a flag is optional. If given, only the model outputs aggregated by
+period are stored and written to the model output file, one row per
+period: water fluxes (rain, t, e, influx, outflux, and netflux) are
+summed, and the other outputs (such as vwc) are given as their mean,
+min., and max. over the period (see aggregate.py).
+
+The -f flag is optional. If given, the charts of every model run in the
+batch are saved (without showing any windows) next to its model output
+file, in the given image format, e.g., out.txt gives out.png. The -c flag
+is then ignored.
 
-The -p flag is optional and must either be 'b' for basic chart plotting.
-For detailed chart plotting, use any single letter other than'b'.
+Only the plot and compare commands import the charting (matplotlib)
+modules, so the run and batch commands start quickly.
 
 Example:
-    python pywaterbal -i 'c:\pywaterbal\ini.txt'
-                      -o 'c:\pywaterbal\out.txt'
-                      -n 90
-                      -pb or -pd
+    python pywaterbal plot -i 'c:\pywaterbal\ini.txt'
+                           -o 'c:\pywaterbal\out.txt'
+                           -n 90
+                           -pb or -pd
 
 means the model input is 'ini.txt' and output file is 'out.txt',
 and both these files are stored in 'c:\pywaterbal\' folder. The model is
 to be run for 90 simulation days, and after the model run, the simulation
-results will be plotted. The 'basic' chart plots will be produced if 
+results will be plotted. The 'basic' chart plots will be produced if
 '-pb' is specified, else '-pd' for more detailed charts.
 
+For backward compatibility, the command may be left out, in which case
+the model is run, then plotted only if the -p flag is given.
+
 @author Christopher Teh Boon Sung
 
 """
@@ -36,7 +93,169 @@ import getopt
 import sys
 import traceback
 
-from plot import Plot
+
+COMMANDS = ['run', 'plot', 'batch', 'compare']
+
+
+def plot_charts(ui, plottype):
+    """Plot the charts of the given type.
+
+    Args:
+        ui: the Plot object, with its model results
+        plottype: 'b' for basic charts, 'h' for heatmaps, or else
+                  detailed charts
+
+    Returns:
+        None
+    """
+    if plottype.lower() == 'h':
+        ui.plot_heatmap()
+    else:
+        ui.plot(True if plottype.lower() == 'b' else False)
+
+
+def run_model(cmd, opts):
+    """Run the model (and plot the charts for the plot command).
+
+    Args:
+        cmd: the command, either 'run' or 'plot', or None if the command
+             was left out (plot only if the -p flag is given)
+        opts: the parsed commandline options
+
+    Returns:
+        None
+    """
+    inifile = outfile = duration = cachedir = period = startdate = None
+    plottype = 'b' if cmd == 'plot' else None
+    for opt, arg in opts:
+        if opt == '-i':             # initialization file flag
+            inifile = arg
+        elif opt == '-o':           # output file flag
+            outfile = arg
+        elif opt == '-n':           # duration of model run flag
+            duration = int(arg)
+        elif opt == '-p':           # chart plotting flag
+            plottype = arg
+        elif opt == '-c':           # results cache folder flag
+            cachedir = arg
+        elif opt == '-a':           # aggregation period flag
+            period = arg
+        elif opt == '-d':           # date of day 1 flag
+            startdate = arg
+
+    if cmd == 'run' and plottype:
+        print('Flag -p is only for the plot command.')
+        print(__doc__)
+        sys.exit(2)
+
+    if period is not None and plottype:
+        print('Flag -a is only for the run command.')
+        print(__doc__)
+        sys.exit(2)
+
+    if cmd == 'plot' and duration is None and outfile is not None:
+        # plot the saved model results of an earlier model run:
+        from plot import Plot
+        plot_charts(Plot.from_output(outfile, inifile), plottype)
+        return
+
+    if None in [inifile, outfile, duration]:
+        print('One or more flags are missing.'
+              ' Flags -p, -c, -a, and -d are optional.')
+        print(__doc__)
+        sys.exit(2)
+
+    cache = None
+    if cachedir:
+        from cache import ResultCache
+        cache = ResultCache(cachedir)
+
+    if plottype and plottype.lower() == 'l':
+        from monitor import Monitor     # live charts, model not cached
+        Monitor(inifile, outfile, duration).run()
+    elif plottype:
+        from plot import Plot   # charting modules only needed to plot
+        ui = Plot(inifile, outfile, cache)
+        ui.run(duration)
+        plot_charts(ui, plottype)
+    else:
+        from facade import Facade
+        aggregate = None
+        if period is not None:
+            from aggregate import Aggregator, parse_date
+            aggregate = Aggregator(period, startdate and
+                                   parse_date(startdate))
+        Facade(inifile, outfile, cache).run(duration, aggregate=aggregate)
+
+
+def run_batch(opts):
+    """Run many model runs in parallel, as listed in a batch file.
+
+    Args:
+        opts: the parsed commandline options
+
+    Returns:
+        None
+    """
+    batchfile = nworkers = cachedir = fmt = costfile = None
+    segsecs = 60.0
+    plottype = 'b'
+    for opt, arg in opts:
+        if opt == '-b':             # batch file flag
+            batchfile = arg
+        elif opt == '-w':           # no. of worker processes flag
+            nworkers = int(arg)
+        elif opt == '-c':           # results cache folder flag
+            cachedir = arg
+        elif opt == '-f':           # chart image format flag
+            fmt = arg
+        elif opt == '-p':           # chart plotting flag
+            plottype = arg
+        elif opt == '-l':           # learned run times file flag
+            costfile = arg
+        elif opt == '-s':           # segment run time flag
+            segsecs = float(arg)
+
+    if batchfile is None:
+        print('Flag -b is missing. Flags -w, -c, -f, -p, -l, and -s are'
+              ' optional.')
+        print(__doc__)
+        sys.exit(2)
+
+    import batch
+    jobs = batch.read_jobs(batchfile)
+    if fmt:
+        import render   # charting modules only needed to save charts
+        render.render_batch(jobs, fmt, plottype.lower() == 'b', nworkers)
+    else:
+        batch.run_batch(jobs, nworkers, cachedir, costfile, segsecs)
+
+
+def run_compare(opts, fnames):
+    """Plot the model results of many earlier model runs together.
+
+    Args:
+        opts: the parsed commandline options
+        fnames: model output/results text files of the model runs
+
+    Returns:
+        None
+    """
+    names = ['rootvwc']
+    bands = None
+    for opt, arg in opts:
+        if opt == '-f':             # model outputs flag
+            names = [name.strip() for name in arg.split(',')]
+        elif opt == '-b':           # percentile bands flag
+            bands = [float(val) for val in arg.split(',')]
+
+    if not fnames:
+        print('No model output files given. Flags -f and -b are optional.')
+        print(__doc__)
+        sys.exit(2)
+
+    from compare import Compare
+    Compare.from_outputs(fnames).plot(names, bands)
 
 
 def main(argv):
@@ -52,31 +271,26 @@ def main(argv):
         sys.exit(2)
 
     try:
+        # the command (if none, then run, and plot only if -p is given):
+        cmd = None
+        if argv[0] in COMMANDS:
+            cmd = argv[0]
+            argv = argv[1:]
+
         # set the accepted flags, and parse the options and arguments:
-        inifile = outfile = duration = plottype = None
-        opts, a = getopt.getopt(argv, "hi:o:n:p:")
-        for opt, arg in opts:
-            if opt == '-h':             # help flag
-                print(__doc__)
-                sys.exit()
-            elif opt == '-i':           # initialization file flag
-                inifile = arg
-            elif opt == '-o':           # output file flag
-                outfile = arg
-            elif opt == '-n':           # duration of model run flag
-                duration = int(arg)
-            elif opt == '-p':           # chart plotting flag
-                plottype = arg
-
-        if None in [inifile, outfile, duration]:
-            print('One or more flags are missing. Flag -p is optional.')
+        flags = {'batch': "hb:w:c:f:p:l:s:", 'compare': "hf:b:"}.get(
+            cmd, "hi:o:n:p:c:a:d:")
+        opts, a = getopt.getopt(argv, flags)
+        if ('-h', '') in opts:          # help flag
             print(__doc__)
-            sys.exit(2)
+            sys.exit()
 
-        ui = Plot(inifile, outfile)
-        ui.run(duration)
-        if plottype:
-            ui.plot(True if plottype.lower() == 'b' else False)
+        if cmd == 'batch':
+            run_batch(opts)
+        elif cmd == 'compare':
+            run_compare(opts, a)
+        else:
+            run_model(cmd, opts)
 
     except getopt.GetoptError:
         traceback.print_exc(file=sys.stdout)
@@ -0,0 +1,116 @@
+"""Render module.
+
+Save the charts of many model runs (jobs) to image files, in parallel,
+without showing any windows (no display is needed). The jobs are the same
+as those for a batch run (see the batch module), where the charts of
+every job are saved next to its model output file, e.g., out1.txt gives
+out1.png.
+
+Every worker process keeps the charts it has drawn, and reuses them as
+templates for later jobs with the same type of charts, no. of soil
+layers, and duration. Only the data and their axis limits are then
+redrawn, rather than the whole layout of the charts. Every worker also
+keeps the daily data files it has read last (see
+dailydata.load_dailydata), so jobs sharing a daily data file read it
+only once.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+
+from dailydata import load_dailydata
+from facade import Facade
+from plot import Plot
+
+
+# charts drawn by this (worker) process, as (Plot object, figure) tuples,
+#    indexed by the type of charts, no. of soil layers, and duration:
+_templates = {}
+
+
+def chart_name(fname_out, fmt):
+    """Name of the image file for a given model output file.
+
+    Args:
+        fname_out: model output (results) text file
+        fmt: image format (file name extension), e.g., 'png'
+
+    Returns:
+        Name of the image file
+    """
+    return os.path.splitext(fname_out)[0] + '.' + fmt
+
+
+def render_job(job, fmt='png', basic=True):
+    """Run the model for a given job, then save its charts.
+
+    Args:
+        job: Job object (see the batch module)
+        fmt: image format (file name extension), e.g., 'png' or 'svg'
+        basic: True for basic charts, or False for detailed charts
+
+    Returns:
+        Tuple of the job and its run time (seconds)
+    """
+    start = time.perf_counter()
+    fname_chart = chart_name(job.fname_out, fmt)
+    with open(job.fname_in, 'rt') as fin:
+        ini = json.loads(fin.read())
+    with contextlib.redirect_stdout(io.StringIO()):
+        fac = Facade(ini, job.fname_out,
+                     dailydata=load_dailydata(ini['dailydatafile']))
+        fac.run(job.duration)
+    key = (basic, fac.model.numlayers, job.duration)
+    if key in _templates:
+        # reuse the charts drawn before, and redraw only the data:
+        plot, fig = _templates[key]
+        plot.fname_out = job.fname_out
+        plot.update_charts(fac.results, fac.model)
+        fig.savefig(fname_chart)
+    else:
+        # a Plot of the job's model and results, without reading them again
+        plot = Plot(None, job.fname_out)
+        plot.ini = fac.ini
+        plot.dailydata = fac.dailydata
+        plot.model = fac.model
+        plot.table = fac.table
+        plot.results = fac.results
+        fig = plot.render(fname_chart, basic)
+        _templates[key] = (plot, fig)
+    return job, time.perf_counter() - start
+
+
+def _render_job(args):
+    """Unpack the arguments for render_job (in a worker process)."""
+    return render_job(*args)
+
+
+def render_batch(jobs, fmt='png', basic=True, nworkers=None):
+    """Run all the jobs and save their charts, in parallel.
+
+    Args:
+        jobs: list of Job objects (see the batch module)
+        fmt: image format (file name extension), e.g., 'png' or 'svg'
+        basic: True for basic charts, or False for detailed charts
+        nworkers: no. of worker processes. Default: no. of CPUs
+
+    Returns:
+        List of the run times (seconds) of the jobs, in the same order as
+        the given jobs
+    """
+    times = {}
+    with mp.Pool(nworkers) as pool:
+        args = [(job, fmt, basic) for job in jobs]
+        for job, secs in pool.imap_unordered(_render_job, args):
+            times[job] = secs
+            print('{} -> {} ({:.2f} s)'.format(
+                job.fname_in, chart_name(job.fname_out, fmt), secs))
+    return [times[job] for job in jobs]
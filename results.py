@@ -0,0 +1,274 @@
+"""Results module.
+
+Save and load the model results, so that the results of earlier model
+runs can be used (such as for plotting) without running the model again.
+The model results are rebuilt from either the model output text file
+(written by Facade), its gzip-compressed copy (.gz), or a binary
+compressed numpy file (.npz, written by save_results). The columns of the
+files are read in bulk, and the no. of soil layers and the model outputs
+are taken from the column headers.
+
+For analysis, the model results are also given as one table of values
+(days x fields, see to_table and load_table). The table of a model run
+can be the one Facade filled as the model was run (Facade.table, not
+copied), and it is viewed, without copying, as:
+    as_records - a numpy structured array, one named field per column
+    as_layers - a (days x layers x fields) array of the soil layer outputs
+    as_dataframe - a pandas DataFrame (requires pandas)
+or iterated over lazily, one value at a time, in long (tidy) form (see
+iter_tidy).
+
+Requires numpy.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import gzip
+import re
+
+import numpy as np
+
+from facade import Facade, OUTPUTS, OUTLAYERS
+
+
+# column header of a soil layer output, e.g., layer12_vwc
+LAYER_FIELD = re.compile(r'^layer(\d+)_(\w+)$')
+
+
+def from_table(fields, data):
+    """Rebuild the model results from a table of values.
+
+    Args:
+        fields: names of the table columns (as given by
+                Facade.output_fields), excluding the day number
+        data: array of values, one row per day, one column per field
+
+    Returns:
+        Dictionary containing the model results, same as Facade's
+    """
+    res = {}
+    layers = {}
+    for col, name in enumerate(fields):
+        match = LAYER_FIELD.match(name)
+        if match is None:
+            res[name] = data[:, col].tolist()
+        else:
+            idx = int(match.group(1)) - 1
+            layers.setdefault(idx, {})[match.group(2)] = \
+                data[:, col].tolist()
+    res['layers'] = [layers[idx] for idx in sorted(layers)]
+    return res
+
+
+def to_table(res, table=None):
+    """Table of values of the model results.
+
+    Note:
+        If the table of the model run is given (see Facade.table), the
+        array is a view of that table (not a copy), so changing one
+        changes the other. Otherwise, the lists of the model results are
+        copied into a new array.
+
+    Args:
+        res: dictionary containing the model results
+        table: table of the daily model outputs of the same model run
+               (Facade.table), if any. Default: None (no table)
+
+    Returns:
+        Tuple of the names of the table columns and the array of values
+        (one row per day, one column per field)
+    """
+    if table is not None:
+        fields = Facade.output_fields(len(res['layers']))
+        data = np.frombuffer(table, dtype=float)
+        return fields, data.reshape(-1, len(fields))
+    fields = [key for key in OUTPUTS if key in res]
+    cols = [res[key] for key in fields]
+    for i, layer in enumerate(res['layers']):
+        for key in OUTLAYERS:
+            if key in layer:
+                fields.append('layer' + str(i + 1) + '_' + key)
+                cols.append(layer[key])
+    return fields, np.column_stack(cols)
+
+
+def save_results(res, fname):
+    """Save the model results to a binary compressed numpy file (.npz).
+
+    Args:
+        res: dictionary containing the model results
+        fname: name of the file
+
+    Returns:
+        None
+    """
+    fields, data = to_table(res)
+    days = np.arange(1, data.shape[0] + 1)
+    np.savez_compressed(fname, fields=np.array(fields), day=days,
+                        data=data)
+
+
+def load_table(fname):
+    """Load the model results from a file, as a table of values.
+
+    Args:
+        fname: name of the model output text file (or its .gz copy),
+               or of the binary compressed numpy file (.npz)
+
+    Returns:
+        Tuple of the names of the table columns, where the first is
+        'day', and the array of values (one row per day, one column per
+        field)
+    """
+    if fname.endswith('.npz'):
+        with np.load(fname) as npz:
+            fields = ['day'] + [str(name) for name in npz['fields']]
+            return fields, np.column_stack([npz['day'], npz['data']])
+
+    opener = gzip.open if fname.endswith('.gz') else open
+    with opener(fname, 'rt') as fin:
+        headers = [item.strip() for item in fin.readline().split(',')]
+        data = np.loadtxt(fin, delimiter=',', ndmin=2)
+    return headers, data
+
+
+def load_results(fname):
+    """Load the model results from a file.
+
+    Args:
+        fname: name of the model output text file (or its .gz copy),
+               or of the binary compressed numpy file (.npz)
+
+    Returns:
+        Dictionary containing the model results, same as Facade's
+    """
+    fields, data = load_table(fname)
+    # the first column is the day number:
+    return from_table(fields[1:], data[:, 1:])
+
+
+def as_records(fields, data):
+    """Table of values as a numpy structured array, one field per column.
+
+    Note:
+        The structured array is a view of the table (not a copy), if the
+        table is a C-contiguous array of floats (as given by to_table
+        and load_table), so changing one changes the other.
+
+    Args:
+        fields: names of the table columns
+        data: array of values, one row per day, one column per field
+
+    Returns:
+        Structured array of one record per day, e.g., rec['layer1_vwc']
+    """
+    data = np.ascontiguousarray(data, dtype=float)
+    dtype = np.dtype([(name, float) for name in fields])
+    return data.view(dtype).reshape(data.shape[0])
+
+
+def as_layers(fields, data):
+    """Soil layer outputs of a table of values, as a 3D array.
+
+    Note:
+        The 3D array is a view of the table (not a copy), if the soil
+        layer columns are next to each other, layer by layer, with the
+        same outputs in the same order for every layer (as given by
+        to_table and load_table).
+
+    Args:
+        fields: names of the table columns
+        data: array of values, one row per day, one column per field
+
+    Returns:
+        Tuple of the names of the soil layer outputs (e.g., vwc), and the
+        array of (days x layers x outputs)
+    """
+    cols = {}
+    names = []      # in the order of the first soil layer's columns
+    for col, name in enumerate(fields):
+        match = LAYER_FIELD.match(name)
+        if match is not None:
+            cols[int(match.group(1)), match.group(2)] = col
+            if match.group(1) == '1':
+                names.append(match.group(2))
+    nlayers = len(cols) // max(1, len(names))
+    idx = np.array([[cols[i + 1, key] for key in names]
+                    for i in range(nlayers)], dtype=int).reshape(
+                        nlayers, len(names))
+    first = idx.min() if idx.size else 0
+    if np.array_equal(idx.ravel(), np.arange(first, first + idx.size)):
+        block = data[:, first:first + idx.size]    # view, no copy
+        return names, block.reshape(data.shape[0], nlayers, len(names))
+    return names, data[:, idx]
+
+
+def as_dataframe(fields, data):
+    """Table of values as a pandas DataFrame (requires pandas).
+
+    Note:
+        The DataFrame shares the table's memory (no copy), if the table
+        is an array of floats, so changing one changes the other.
+
+    Args:
+        fields: names of the table columns
+        data: array of values, one row per day, one column per field
+
+    Returns:
+        DataFrame of one row per day, one column per field, indexed by
+        day (from 1) if the table has no 'day' column
+    """
+    import pandas as pd     # only needed for DataFrames
+    index = None
+    if 'day' not in fields:
+        index = pd.RangeIndex(1, data.shape[0] + 1, name='day')
+    return pd.DataFrame(data, index=index, columns=list(fields),
+                        copy=False)
+
+
+def iter_tidy(fields, data):
+    """Table of values in long (tidy) form, one value at a time.
+
+    The values are made as they are iterated over (lazily), so the long
+    form of even a large table takes no extra memory.
+
+    Args:
+        fields: names of the table columns
+        data: array of values, one row per day, one column per field
+
+    Yields:
+        Tuple of the day, soil layer no. (0 for outputs of the whole soil
+        profile, or from 1 for soil layer outputs), the name of the
+        output (e.g., vwc), and its value, for every day and column
+    """
+    keys = []
+    for name in fields:
+        match = LAYER_FIELD.match(name)
+        if match is None:
+            keys.append((0, name))
+        else:
+            keys.append((int(match.group(1)), match.group(2)))
+    daycol = fields.index('day') if 'day' in fields else None
+    for row, vals in enumerate(data):
+        vals = vals.tolist()
+        day = int(vals[daycol]) if daycol is not None else row + 1
+        for col, (layer, key) in enumerate(keys):
+            if col != daycol:
+                yield day, layer, key, vals[col]
+
+
+def check_layers(res, nlayers):
+    """Raise an error if the model results have the wrong no. of layers.
+
+    Args:
+        res: dictionary containing the model results
+        nlayers: the expected no. of soil layers
+
+    Returns:
+        None
+    """
+    if len(res['layers']) != nlayers:
+        raise ValueError('Model results have {} soil layers, but the model'
+                         ' has {}.'.format(len(res['layers']), nlayers))
@@ -0,0 +1,307 @@
+"""Scenario module.
+
+Branch (fork) a model run into many what-if continuations, such as
+adding irrigation or changing the potential ET after a given day. The
+days shared by the continuations are simulated only once: the model is
+copied at the branch point, and every copy continues the simulation with
+its own changes to the daily data. The model runs are organized as a
+scenario tree, where every node continues from the end of its parent.
+
+Branches at the same level of the tree are independent of one another,
+so they can be run in parallel (in worker processes).
+
+Example:
+    from scenario import ForcingChange, ScenarioTree
+
+    if __name__ == '__main__':
+        tree = ScenarioTree('ini.txt', 60)      # first 60 days shared
+        tree.root.branch('dry', 30, ForcingChange(rainscale=0.5))
+        tree.root.branch('irrigated', 30, ForcingChange(rainadd=5.0))
+        tree.run(nworkers=2)
+        for node in tree.leaves():
+            print(node.name, node.path_results()['rootvwc'][-1])
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from concurrent.futures import ProcessPoolExecutor
+import copy
+import json
+
+from dailydata import DailyData
+from facade import Facade, OUTPUTS, OUTLAYERS
+from soilwater import SoilWater
+
+
+class ForcingChange(object):
+    """ForcingChange class.
+
+    Changes made to the daily data (rain, lai, petcrop, petsoil) of a
+    scenario branch. Every change below can be given either as a single
+    value (same for all days) or as a list of values, one per day of the
+    branch (where the first value is for the first day of the branch).
+
+    ATTRIBUTES:
+        rainadd - water added to the rain, e.g., irrigation (mm/day)
+        rainscale - multiplier for rain (-)
+        petscale - multiplier for both petcrop and petsoil (-)
+        lai - leaf area index (m2 leaf/m2 ground) to replace the given
+              lai, or None to keep the given lai
+
+    METHODS:
+        Statics:
+            value - value of a change for a given day of the branch
+
+        apply - change the daily data for a given day of the branch
+    """
+
+    def __init__(self, rainadd=0.0, rainscale=1.0, petscale=1.0, lai=None):
+        """Create the ForcingChange object."""
+        self.rainadd = rainadd
+        self.rainscale = rainscale
+        self.petscale = petscale
+        self.lai = lai
+
+    @staticmethod
+    def value(change, idx):
+        """Value of a change for a given day of the branch.
+
+        Args:
+            change: single value or list of values (one per day)
+            idx: day of the branch (starts at 0)
+
+        Returns:
+            The value (float), or None if change is None
+        """
+        if isinstance(change, (list, tuple)):
+            return change[idx]
+        return change
+
+    def apply(self, idx, rain, lai, petcrop, petsoil):
+        """Change the daily data for a given day of the branch.
+
+        Args:
+            idx: day of the branch (starts at 0)
+            rain: total amount of rain (mm/day)
+            lai: leaf area index (m2 leaf/m2 ground)
+            petcrop: potential water loss from the crop (mm/day)
+            petsoil: potential water loss from the soil (mm/day)
+
+        Returns:
+            List of the changed rain, lai, petcrop, and petsoil
+        """
+        val = ForcingChange.value
+        rain = rain * val(self.rainscale, idx) + val(self.rainadd, idx)
+        newlai = val(self.lai, idx)
+        if newlai is not None:
+            lai = newlai
+        petscale = val(self.petscale, idx)
+        return [rain, lai, petcrop * petscale, petsoil * petscale]
+
+
+def _run_branch(model, dailydata, change):
+    """Continue the model run for the given daily data.
+
+    Args:
+        model: the soil water model (SoilWater object), as at the
+               start of the branch. It is changed by the model run.
+        dailydata: list of daily data (rain, lai, petcrop, petsoil),
+                   one for each day of the branch
+        change: ForcingChange object, or None for no changes
+
+    Returns:
+        Tuple of the model (as at the end of the branch) and the model
+        results of the branch
+    """
+    res = Facade.empty_results(model.numlayers)
+    for idx, data in enumerate(dailydata):
+        if change is not None:
+            data = change.apply(idx, *data)
+        model.daily_water_balance(*data)
+        Facade.store_outputs(res, Facade.daily_outputs(model, data[0]))
+    return model, res
+
+
+class ScenarioNode(object):
+    """ScenarioNode class.
+
+    A model run in the scenario tree, which continues the simulation
+    from the end of its parent's model run.
+
+    ATTRIBUTES:
+        name - name of the scenario
+        parent - the parent node (None for the root node)
+        startday - first simulation day of this node (day 1 is the
+                   first day of the root node)
+        ndays - no. of daily simulation days of this node (days)
+        change - changes made to the daily data (ForcingChange object),
+                 or None for no changes
+        children - the branches (ScenarioNode objects) of this node
+        model - the soil water model as at the end of this node's run
+                (None if not run yet)
+        results - model results of this node's days only
+                  (None if not run yet)
+
+    METHODS:
+        branch - add a new branch continuing from the end of this node
+        path - all the nodes from the root node to this node
+        path_results - model results from the first day of the root node
+                       to the last day of this node
+    """
+
+    def __init__(self, name, ndays, change=None, parent=None):
+        """Create the ScenarioNode object.
+
+        Args:
+            name: name of the scenario
+            ndays: no. of daily simulation days of this node (days)
+            change: changes made to the daily data (ForcingChange
+                    object). Default: no changes.
+            parent: the parent node. Default: None (the root node)
+        """
+        self.name = name
+        self.parent = parent
+        self.startday = 1 if parent is None else parent.endday + 1
+        self.ndays = ndays
+        self.change = change
+        self.children = []
+        self.model = None
+        self.results = None
+
+    @property
+    def endday(self):
+        """Last simulation day of this node."""
+        return self.startday + self.ndays - 1
+
+    def branch(self, name, ndays, change=None):
+        """Add a new branch continuing from the end of this node.
+
+        Args:
+            name: name of the branch scenario
+            ndays: no. of daily simulation days of the branch (days)
+            change: changes made to the daily data of the branch
+                    (ForcingChange object). Default: no changes.
+
+        Returns:
+            The new branch (ScenarioNode object)
+        """
+        node = ScenarioNode(name, ndays, change, self)
+        self.children.append(node)
+        return node
+
+    def path(self):
+        """All the nodes from the root node to this node (inclusive)."""
+        nodes = []
+        node = self
+        while node is not None:
+            nodes.append(node)
+            node = node.parent
+        return nodes[::-1]
+
+    def path_results(self):
+        """Model results from the start of root node to end of this node.
+
+        Returns:
+            Dictionary containing the model results, same as Facade's
+        """
+        nodes = self.path()
+        res = Facade.empty_results(len(nodes[0].results['layers']))
+        for node in nodes:
+            for key in OUTPUTS:
+                res[key].extend(node.results[key])
+            for d, nd in zip(res['layers'], node.results['layers']):
+                for key in OUTLAYERS:
+                    d[key].extend(nd[key])
+        return res
+
+
+class ScenarioTree(object):
+    """ScenarioTree class.
+
+    Run a tree of scenarios, where every branch continues from a copy of
+    its parent's model, as at the end of the parent's model run.
+
+    ATTRIBUTES:
+        ini - model inputs read from the model input text file
+        dailydata - data read from the daily data file
+        root - the root node (ScenarioNode object), the shared start
+               of all scenarios
+
+    METHODS:
+        nodes - all the nodes in the tree
+        leaves - all the nodes without any branches
+        run - run all the nodes not yet run
+    """
+
+    def __init__(self, fname_in, ndays, change=None):
+        """Create the ScenarioTree object.
+
+        Args:
+            fname_in: model input text file
+            ndays: no. of daily simulation days of the root node (days)
+            change: changes made to the daily data of the root node
+                    (ForcingChange object). Default: no changes.
+        """
+        with open(fname_in, 'rt') as fin:
+            self.ini = json.loads(fin.read())   # read everything in file
+        self.dailydata = DailyData(self.ini['dailydatafile'])
+        self.root = ScenarioNode('root', ndays, change)
+
+    def nodes(self):
+        """All the nodes in the tree, parents always before children."""
+        nodes = [self.root]
+        for node in nodes:
+            nodes.extend(node.children)   # grows while iterating
+        return nodes
+
+    def leaves(self):
+        """All the nodes without any branches."""
+        return [node for node in self.nodes() if not node.children]
+
+    def run(self, nworkers=1):
+        """Run all the nodes not yet run.
+
+        Nodes are run level by level, so that every node starts only
+        after its parent's model run is done. A node that was run before
+        is not run again, so new branches can be added to a tree that was
+        already run, and only the new branches will be run.
+
+        Args:
+            nworkers: no. of worker processes to run the nodes in the
+                      same level. Default: 1 (no worker processes)
+
+        Returns:
+            None
+        """
+        pool = ProcessPoolExecutor(nworkers) if nworkers > 1 else None
+        try:
+            while True:
+                # nodes whose parents are done (or the root node):
+                pending = [node for node in self.nodes()
+                           if node.results is None and
+                           (node.parent is None or
+                            node.parent.results is not None)]
+                if not pending:
+                    break
+                tasks = []
+                for node in pending:
+                    if node.parent is None:
+                        model = SoilWater(self.ini)
+                    else:
+                        # each branch gets its own copy of parent's model
+                        model = copy.deepcopy(node.parent.model)
+                    data = [self.dailydata[day] for day in
+                            range(node.startday, node.endday + 1)]
+                    tasks.append((model, data, node.change))
+                if pool is not None:
+                    outs = pool.map(_run_branch, *zip(*tasks))
+                else:
+                    outs = [_run_branch(*task) for task in tasks]
+                for node, (model, res) in zip(pending, outs):
+                    node.model = model
+                    node.results = res
+        finally:
+            if pool is not None:
+                pool.shutdown()
@@ -0,0 +1,335 @@
+r"""Server module.
+
+Serve model runs over HTTP, so that repeated model runs (such as from a
+dashboard) need not start a new Python interpreter every time. The
+server uses asyncio for its network I/O, and keeps a pool of warm worker
+processes to run the model. Every worker has the model modules already
+imported, and it keeps the soil profiles (models built from their model
+inputs, see soilwater.new_model) and daily data files (see
+dailydata.load_dailydata) it has seen last, so they are not built or
+read again.
+
+How to use:
+
+    python server.py <flags>
+
+where <flags> are the following:
+    -a <host address to listen on, optional (default: 127.0.0.1)>
+    -p <port number to listen on, optional (default: 8080)>
+    -w <number of worker processes, optional (default: no. of CPUs)>
+    -r <data folder, the only folder (and its subfolders) whose files
+        the requests may read, optional (default: current folder)>
+
+Requests:
+    GET /health - check if the server is up
+    POST /run - run the model, where the request body is a JSON object:
+        {
+            "ini": {...} model inputs (as in the model input file), or
+            "inifile": "ini.txt" the model input text file,
+            "dailydata": [[rain, lai, petcrop, petsoil], ...] daily data,
+                         optional (default: from daily data file),
+            "dailydatafile": "data.txt" daily data file, optional
+                             (default: as given in the model inputs),
+                             where all the files are relative to the
+                             data folder, and must be in it,
+            "duration": 90 no. of daily simulation days,
+            "outputs": ["rootvwc", "layer1_vwc"] names of the model
+                       outputs, optional (default: all outputs),
+            "format": "json" or "binary", optional (default: "json")
+        }
+
+Responses to POST /run:
+    json - a JSON object: {"fields": [names], "values": {name: [...]}}
+    binary - a (days x fields) array of little-endian 8-byte floats,
+             where the X-Fields header lists the field names and the
+             X-Shape header gives the no. of days and fields
+
+Invalid requests get a 400 response with a generic error message; the
+details are only logged by the server.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import array
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import getopt
+import json
+import os
+import sys
+import traceback
+
+from dailydata import load_dailydata
+from facade import Facade
+from soilwater import new_model
+
+
+def _init_worker():
+    """Warm up the worker process (modules are imported by now)."""
+    return os.getpid()
+
+
+def _data_path(root, fname):
+    """Full path of a requested file, which must be in the data folder.
+
+    Args:
+        root: the data folder (absolute and resolved)
+        fname: the requested file, relative to the data folder
+
+    Returns:
+        Full path of the requested file
+
+    Raises:
+        PermissionError: if the requested file is outside the data folder
+    """
+    path = os.path.realpath(os.path.join(root, fname))
+    if os.path.commonpath([root, path]) != root:
+        raise PermissionError('outside the data folder: ' + fname)
+    return path
+
+
+def _run_request(req, root):
+    """Run the model for a given request (in a worker process).
+
+    Args:
+        req: dictionary of the request (see this module's docstring)
+        root: the data folder (absolute and resolved), where all the
+              requested files must be
+
+    Returns:
+        Tuple of the response content type, extra headers, and body
+    """
+    ini = req.get('ini')
+    if ini is None:
+        with open(_data_path(root, req['inifile']), 'rt') as fin:
+            ini = json.loads(fin.read())
+    model = new_model(ini)
+    duration = int(req['duration'])
+    dailydata = req.get('dailydata')
+    if dailydata is None:
+        fname = req.get('dailydatafile', ini['dailydatafile'])
+        dailydata = load_dailydata(_data_path(root, fname))
+        dailydata = [dailydata[day] for day in range(1, duration + 1)]
+
+    fields = Facade.output_fields(model.numlayers)
+    outputs = req.get('outputs') or fields
+    cols = [fields.index(name) for name in outputs]
+    rows = []
+    for i in range(duration):
+        data = dailydata[i]
+        model.daily_water_balance(*data)
+        vals = Facade.daily_outputs(model, data[0])
+        rows.append([vals[col] for col in cols])
+
+    if req.get('format', 'json') == 'binary':
+        values = array.array('d', [val for row in rows for val in row])
+        if sys.byteorder != 'little':
+            values.byteswap()
+        headers = {'X-Fields': ','.join(outputs),
+                   'X-Shape': '{},{}'.format(duration, len(outputs))}
+        return 'application/octet-stream', headers, values.tobytes()
+    values = {name: [row[j] for row in rows]
+              for j, name in enumerate(outputs)}
+    body = json.dumps({'fields': outputs, 'values': values}).encode()
+    return 'application/json', {}, body
+
+
+class Server(object):
+    """Server class.
+
+    Accept model run requests over HTTP, and run the model in a pool of
+    warm worker processes.
+
+    ATTRIBUTES:
+        host - host address to listen on
+        port - port number to listen on
+        nworkers - number of worker processes
+        root - the data folder, where all the requested files must be
+        pool - the pool of worker processes
+
+    METHODS:
+        Statics:
+            response - the HTTP response message
+
+        handle - handle all the requests from a client connection
+        dispatch - run a given request and return the response
+        serve - start the server and keep serving until cancelled
+    """
+
+    def __init__(self, host='127.0.0.1', port=8080, nworkers=None,
+                 root='.'):
+        """Create the Server object.
+
+        Args:
+            host: host address to listen on
+            port: port number to listen on
+            nworkers: number of worker processes. Default: no. of CPUs
+            root: the data folder, where all the requested files must be.
+                  Default: the current folder
+        """
+        self.host = host
+        self.port = port
+        self.nworkers = nworkers or os.cpu_count() or 1
+        self.root = os.path.realpath(root)
+        self.pool = None
+
+    @staticmethod
+    def response(status, body, ctype='application/json', headers=None,
+                 keepalive=True):
+        """The HTTP response message.
+
+        Args:
+            status: status code and reason, e.g., '200 OK'
+            body: body of the response (bytes)
+            ctype: content type of the body
+            headers: dictionary of extra headers, if any
+            keepalive: False to close the connection after the response
+
+        Returns:
+            The response message (bytes)
+        """
+        lines = ['HTTP/1.1 ' + status,
+                 'Content-Type: ' + ctype,
+                 'Content-Length: ' + str(len(body)),
+                 'Connection: ' + ('keep-alive' if keepalive else 'close')]
+        for key, val in (headers or {}).items():
+            lines.append(key + ': ' + val)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+    async def dispatch(self, method, path, body):
+        """Run a given request and return the response.
+
+        Args:
+            method: HTTP method, e.g., 'GET' or 'POST'
+            path: the requested path, e.g., '/run'
+            body: body of the request (bytes)
+
+        Returns:
+            Tuple of the status, content type, extra headers, and body
+        """
+        if method == 'GET' and path == '/health':
+            return '200 OK', 'application/json', {}, b'{"status": "ok"}'
+        if method != 'POST' or path != '/run':
+            return '404 Not Found', 'application/json', {}, \
+                b'{"error": "unknown request"}'
+        try:
+            req = json.loads(body.decode())
+        except ValueError:
+            return '400 Bad Request', 'application/json', {}, \
+                b'{"error": "invalid JSON"}'
+        loop = asyncio.get_running_loop()
+        try:
+            ctype, headers, out = await loop.run_in_executor(
+                self.pool, _run_request, req, self.root)
+        except (KeyError, IndexError, ValueError, TypeError,
+                OSError) as e:
+            # details (which may hold file contents) are only logged
+            print('Bad request: {!r}'.format(e))
+            return '400 Bad Request', 'application/json', {}, \
+                b'{"error": "invalid request"}'
+        return '200 OK', ctype, headers, out
+
+    async def handle(self, reader, writer):
+        """Handle all the requests from a client connection.
+
+        Args:
+            reader: asyncio stream reader of the connection
+            writer: asyncio stream writer of the connection
+
+        Returns:
+            None
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break   # client closed the connection
+                method, path, version = line.decode().split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, val = line.decode().partition(':')
+                    headers[key.strip().lower()] = val.strip()
+                nlen = int(headers.get('content-length', 0))
+                body = await reader.readexactly(nlen) if nlen else b''
+                keepalive = (headers.get('connection', '').lower() !=
+                             'close' and version == 'HTTP/1.1')
+                try:
+                    status, ctype, extra, out = await self.dispatch(
+                        method, path, body)
+                except Exception:
+                    traceback.print_exc(file=sys.stdout)
+                    status, ctype, extra, out = \
+                        '500 Internal Server Error', 'application/json', \
+                        {}, b'{"error": "server error"}'
+                writer.write(Server.response(status, out, ctype, extra,
+                                             keepalive))
+                await writer.drain()
+                if not keepalive:
+                    break
+        except (ValueError, ConnectionError,
+                asyncio.IncompleteReadError):
+            pass    # malformed request or client went away
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Start the server and keep serving until cancelled."""
+        self.pool = ProcessPoolExecutor(self.nworkers)
+        try:
+            # start all the workers now, rather than on the first requests
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self.pool,
+                                                        _init_worker)
+                                   for _ in range(self.nworkers)])
+            server = await asyncio.start_server(self.handle, self.host,
+                                                self.port)
+            print('Serving on http://{}:{} ...'.format(self.host,
+                                                       self.port))
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown()
+
+
+def main(argv):
+    """Main entry point for the server.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    try:
+        host = '127.0.0.1'
+        port = 8080
+        nworkers = None
+        root = '.'
+        opts, a = getopt.getopt(argv, "ha:p:w:r:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-a':           # host address flag
+                host = arg
+            elif opt == '-p':           # port number flag
+                port = int(arg)
+            elif opt == '-w':           # no. of worker processes flag
+                nworkers = int(arg)
+            elif opt == '-r':           # data folder flag
+                root = arg
+        asyncio.run(Server(host, port, nworkers, root).serve())
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+    except KeyboardInterrupt:
+        pass    # server stopped by user
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
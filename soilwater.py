@@ -7,10 +7,16 @@ Includes groundwater (assumes constant water table depth).
 
 """
 
-from collections import namedtuple
+import bisect
+from collections import namedtuple, OrderedDict
 import json
 import math
+import pickle
 
+import pedotransfer
+
+
+__version__ = '0.0.1'   # model version (changes to model results)
 
 # Soil water characteristics.
 #    sat: saturation point
@@ -50,6 +56,18 @@ ActualET = namedtuple('ActualET', 'crop soil')
 #    netflux: difference between water entry and water exit
 Fluxes = namedtuple('Fluxes', 't e influx outflux netflux')
 
+# max. no. of soil profiles kept by new_model
+MAXPROFILES = 64
+
+# soil profiles built by new_model, as pickled models (not yet run),
+#    indexed by their model inputs, least recently used first
+_profiles = OrderedDict()
+
+# Step plan: water balance values that do not change within a day.
+#    rainin: net rainfall entering the first soil layer (m/day)
+#    tweights: fraction of the transpiration taken from each soil layer
+StepPlan = namedtuple('StepPlan', 'rainin tweights')
+
 
 class SoilLayer(object):
     """Soil layer properties class.
@@ -108,8 +126,6 @@ class SoilLayer(object):
         content wil be set at FC.
     """
 
-    __accdepth = 0.0    # internal use: used to determine a layer's depth
-
     def __init__(self):
         """Initialize the SoilLayer object."""
         self.thick = 0.0
@@ -126,6 +142,11 @@ class SoilLayer(object):
         self.fluxes = Fluxes(0.0, 0.0, 0.0, 0.0, 0.0)
         self.prev = None
         self.next = None
+        # constants for the matric head and hydraulic conductivity
+        #    (see update_heads_k):
+        self.__hmwet = (0.0, 0.0)   # (33 - air entry, sat - fc)
+        self.__hmdry = (0.0, 0.0)   # (a, b) of the matric suction curve
+        self.__kexp = 0.0           # exponent of the unsaturated k
 
     def initialize_layer(self, prevlayer, nextlayer):
         """Initialize all attributes.
@@ -149,46 +170,22 @@ class SoilLayer(object):
         prevaccthick = self.prev.accthick if self.prev else 0.0
         self.accthick = self.thick + prevaccthick
         prevthick = self.prev.thick if self.prev else 0.0
-        d = 0.5 * (prevthick + self.thick)
-        self.depth = SoilLayer.__accdepth + d
-        SoilLayer.__accdepth += d
-
-        # 2. set soil water characteristics (Saxton & Rawls, 2008):
-        c, s, om = self.texture
-        s /= 100  # convert sand and clay from % to fraction, but om is %
-        c /= 100
-        # 2a. permanent wilting, field capacity, then saturation points:
-        n1 = -0.024 * s + 0.487 * c + 0.006 * om
-        n2 = 0.005 * (s*om) - 0.013 * (c * om) + 0.068 * (s * c) + 0.031
-        theta1500t = n1 + n2
-        theta1500 = theta1500t + (0.14 * theta1500t - 0.02)
-        n1 = -0.251 * s + 0.195 * c + 0.011 * om
-        n2 = 0.006 * (s*om) - 0.027 * (c * om) + 0.452 * (s * c) + 0.299
-        theta33t = n1 + n2
-        theta33 = theta33t + (1.283*theta33t**2 - 0.374*theta33t - 0.015)
-        n1 = 0.278 * s + 0.034 * c + 0.022 * om
-        n2 = - 0.018 * (s*om) - 0.027 * (c*om) - 0.584 * (s * c) + 0.078
-        theta_s33t = n1 + n2
-        theta_s33 = theta_s33t + 0.636 * theta_s33t - 0.107
-        theta0 = theta33 + theta_s33 - 0.097 * s + 0.043
-        # 2b. pore size distribution index (no unit):
-        b = math.log(1500) - math.log(33)
-        b /= math.log(theta33) - math.log(theta1500)
-        psd = 1 / b
-        # 2c. air-entry suction (kPa):
-        awc = theta0 - theta33
-        n1 = -21.674 * s - 27.932 * c - 81.975 * awc + 71.121 * (s * awc)
-        n2 = 8.294 * (c * awc) + 14.05 * (s * c) + 27.161
-        aet = n1 + n2
-        ae = max(0.0, aet + (0.02 * aet ** 2 - 0.113 * aet - 0.7))
-        # 2d. store calculated soil water characteristics (all in m3/m3)
-        # calibrations/adjust for Malaysian soils:
-        theta1500 = 1.528 * theta1500 * (1 - theta1500)  # PWP
-        theta33 = 1.605 * theta33 * (1 - theta33)  # FC
-        theta0 = 2.225 * theta0 * (1 - theta0)  # SAT (= porosity)
-        self.swc = SWC(theta0, theta33, theta1500, psd, theta0, ae)
-        # 3. saturated hydraulic conductivity (convert mm/hour to m/day):
-        self.ksat = 1930 * awc ** (3 - psd) * 24 / 1000
+        prevdepth = self.prev.depth if self.prev else 0.0
+        self.depth = prevdepth + 0.5 * (prevthick + self.thick)
+
+        # 2. set soil water characteristics (Saxton & Rawls, 2008), then
+        # 3. saturated hydraulic conductivity (m/day), solved only once
+        #    for every soil texture (see the pedotransfer module):
+        hyd = pedotransfer.hydraulics(*self.texture)
+        self.swc = SWC(hyd.sat, hyd.fc, hyd.pwp, hyd.psd, hyd.porosity,
+                       hyd.airentry)
+        self.ksat = hyd.ksat
+        # 3a. constants for the matric head and hydraulic conductivity,
+        #     so they are not recalculated at every update_heads_k call:
+        self.__hmwet = (33 - self.swc.airentry, self.swc.sat - self.swc.fc)
+        b = 1 / self.swc.psd
+        self.__hmdry = (math.exp(3.496508 + b * math.log(self.swc.fc)), b)
+        self.__kexp = 3 + 2 / self.swc.psd
 
         # 4. check for special code:
         if self.vwc < 0:
@@ -224,11 +221,11 @@ class SoilLayer(object):
         # matric suction, convert from kPa to m by dividing by 10
         if vwc >= fc:
             df = vwc - fc
-            hm = 33 - (33 - self.swc.airentry) * df / (self.swc.sat - fc)
+            hmae, satfc = self.__hmwet
+            hm = 33 - hmae * df / satfc
             hm /= 10
         else:
-            b = 1 / self.swc.psd
-            a = math.exp(3.496508 + b * math.log(fc))
+            a, b = self.__hmdry
             hm = (a * max(0.05, vwc) ** (-b)) / 10
         # matric head (m)
         self.matric = max(0.0, hm)
@@ -240,7 +237,7 @@ class SoilLayer(object):
         hm = self.matric  # matric head (m)
         ratio = self.vwc / self.swc.sat
         if hm > ae:
-            self.k = self.ksat * ratio ** (3 + 2 / self.swc.psd)
+            self.k = self.ksat * ratio ** self.__kexp
         else:
             self.k = self.ksat
 
@@ -269,13 +266,26 @@ class SoilWater(object):
             hydraulic_conductivity - hydraulic conductivity (m/day)
             hydraulic_gradient - hydraulic gradient (m)
 
+        update_layers - replace the water content (and ksat) of layers
+        get_state - model state carried from one day to the next
+        set_state - restore the model state (from get_state)
+        start_trace - record every sub-interval step (see tracer.py)
+        stop_trace - stop recording the sub-interval steps
         daily_water_balance - solve for the water content in each layer
     """
 
     def __init__(self, fname_in):
-        """Initialize the SoilWater object."""
-        with open(fname_in, 'rt') as fin:
-            ini = json.loads(fin.read())    # read everything in the file
+        """Initialize the SoilWater object.
+
+        Args:
+            fname_in: model input text file, or a dictionary of the
+                      model inputs already read from such a file
+        """
+        if isinstance(fname_in, dict):
+            ini = fname_in
+        else:
+            with open(fname_in, 'rt') as fin:
+                ini = json.loads(fin.read())    # read everything in file
 
         self.numintervals = ini['numintervals']  # integration intervals
         self.rootdepth = ini['rootdepth']  # rooting depth (m)
@@ -302,6 +312,33 @@ class SoilWater(object):
             nextlayer = self.layers[i+1] if i<self.numlayers-1 else None
             self.layers[i].initialize_layer(prevlayer, nextlayer)
 
+        # cumulative (thickness-weighted) sums of the soil water
+        #    characteristics, which never change, so that the root zone
+        #    sums are found without going through every soil layer:
+        self.__accthick = [layer.accthick for layer in self.layers]
+        self.__cumsat = [0.0]
+        self.__cumfc = [0.0]
+        self.__cumpwp = [0.0]
+        for layer in self.layers:
+            self.__cumsat.append(self.__cumsat[-1] +
+                                 layer.swc.sat * layer.thick)
+            self.__cumfc.append(self.__cumfc[-1] + layer.swc.fc * layer.thick)
+            self.__cumpwp.append(self.__cumpwp[-1] +
+                                 layer.swc.pwp * layer.thick)
+
+        # soil layer values that never change, but are used in every
+        #    sub-interval step (see _calc_water_fluxes):
+        self.__dz = [cur.depth - cur.prev.depth if cur.prev else 0.0
+                     for cur in self.layers]    # between layer centers
+        self.__drylmt = [layer.thick * 0.005 for layer in self.layers]
+        self.__satlmt = [layer.thick * layer.swc.sat
+                         for layer in self.layers]
+        last = self.layers[-1]
+        self.__logksat = math.log(last.ksat)
+        # total head of a saturated water table below the last layer:
+        self.__tablehead = (33 - (33 - last.swc.airentry)) / 10 + \
+            last.accthick
+
         # speedier calculations: proxy to store intermediate water fluxes
         self.__pf = [{field: 0.0 for field in Fluxes._fields}
                      for _ in range(self.numlayers)]
@@ -313,6 +350,8 @@ class SoilWater(object):
         self.waterstresses = self._reduce_et()
         self.netrain = 0.0  # net rainfall (mm/day)
         self.aet = ActualET(0.0, 0.0)  # actual water loss by ET (mm/day)
+        self.__plan = self._step_plan()     # values fixed within a day
+        self.__tracer = None    # records sub-interval steps, if tracing
 
     @staticmethod
     def net_rainfall(rain, lai):
@@ -337,16 +376,23 @@ class SoilWater(object):
 
     def _rootzone_water(self):
         """Water content in the rooting zone (m3/m3)."""
-        wc = wcsat = wcfc = wcpwp = 0.0
-        # only consider those soil layers in where the roots reside:
-        for layer in self.layers:
+        # soil layers wholly within the root zone (binary search):
+        nfull = bisect.bisect_right(self.__accthick, self.rootdepth)
+        wc = 0.0
+        for layer in self.layers[:nfull]:
+            wc += layer.vwc * layer.thick
+        wcsat = self.__cumsat[nfull]
+        wcfc = self.__cumfc[nfull]
+        wcpwp = self.__cumpwp[nfull]
+        # the soil layer partly within the root zone, if any:
+        if nfull < self.numlayers:
+            layer = self.layers[nfull]
             diff = layer.thick - max(0.0, layer.accthick-self.rootdepth)
-            if diff <= 0:
-                break  # found all the layers holding the roots, so exit
-            wc += layer.vwc * diff
-            wcsat += layer.swc.sat * diff
-            wcfc += layer.swc.fc * diff
-            wcpwp += layer.swc.pwp * diff
+            if diff > 0:
+                wc += layer.vwc * diff
+                wcsat += layer.swc.sat * diff
+                wcfc += layer.swc.fc * diff
+                wcpwp += layer.swc.pwp * diff
         vwc = wc / self.rootdepth  # convert from m water to m3/m3
         vwcsat = wcsat / self.rootdepth
         vwcfc = wcfc / self.rootdepth
@@ -392,12 +438,32 @@ class SoilWater(object):
         """Influx of water from the water table (m/day)."""
         # water table assumed just beneath the last soil layer:
         last = self.layers[-1]
-        k = (last.ksat - last.k) / (math.log(last.ksat)-math.log(last.k))
-        hm = (33 - (33 - last.swc.airentry)) / 10   # saturated table
-        hg = last.accthick
-        tothead = hm + hg
+        k = (last.ksat - last.k) / (self.__logksat - math.log(last.k))
+        tothead = self.__tablehead  # saturated table
         return k * (tothead - last.tothead) / (last.thick * 0.5)
 
+    def _step_plan(self):
+        """Water balance values that do not change within a day.
+
+        Depend only on the rooting depth and net rainfall of the day, so
+        they are found once a day rather than in every sub-interval step.
+
+        Returns:
+            StepPlan object
+        """
+        # share of transpiration by each layer, from its rooted depth:
+        tweights = []
+        prvpsi = 0.0
+        for layer in self.layers:
+            cj = min(1.0, layer.accthick / self.rootdepth)
+            curpsi = 1.8 * cj - 0.8 * cj ** 2
+            tweights.append(curpsi - prvpsi)
+            prvpsi = curpsi
+        # first layer influx is at most its saturated conductivity:
+        netrain = self.netrain / 1000     # net rainfall (m)
+        rainin = min(netrain, self.layers[0].ksat)
+        return StepPlan(rainin, tweights)
+
     def _calc_water_fluxes(self, cummfluxes, petcrop, petsoil):
         """Calculate the various water fluxes (m/day) for all layers.
 
@@ -417,8 +483,9 @@ class SoilWater(object):
         self.waterstresses = self._reduce_et()
         self.aet = self._actual_et(petcrop, petsoil)
 
+        plan = self.__plan  # values fixed within the day
+
         # 1. calculates the influx
-        prvpsi = 0.0
         for idx in range(self.numlayers):
             cur = self.layers[idx]  # current soil layer
             prv = cur.prev  # previous soil layer (None for first layer)
@@ -429,10 +496,7 @@ class SoilWater(object):
             # actual evaporation E (only from first layer) and
             #    transpiration T loss (all in m/day):
             ei = 0.0 if prv is not None else self.aet.soil / 1000  # E
-            cj = min(1.0, cur.accthick / self.rootdepth)
-            curpsi = 1.8 * cj - 0.8 * cj ** 2
-            ti = self.aet.crop * (curpsi - prvpsi) / 1000     # T
-            prvpsi = curpsi
+            ti = self.aet.crop * plan.tweights[idx] / 1000     # T
 
             # influx into current layer:
             if prv is not None:
@@ -440,13 +504,12 @@ class SoilWater(object):
                 n = math.log(cur.k) - math.log(prv.k)
                 # logarithmic mean of k:
                 k = (cur.k - prv.k) / n if n != 0.0 else cur.k
-                grad = (cur.tothead-prv.tothead) / (cur.depth-prv.depth)
+                grad = (cur.tothead - prv.tothead) / self.__dz[idx]
                 curinflux = k * grad - ti
             else:
                 # first layer influx is simply the net rainfall
                 #    after losses from E and T
-                netrain = self.netrain / 1000     # net rainfall (m)
-                curinflux = min(netrain, cur.ksat) - ei - ti
+                curinflux = plan.rainin - ei - ti
 
             # store the intermediary fluxes:
             self.__pf[idx]['t'] = ti
@@ -473,8 +536,8 @@ class SoilWater(object):
             # ensure a soil layer cannot be too dry (<0.005 m3/m3)
             #    or exceed soil saturation
             nextwc = influx + wc - outflux
-            drylmt = cur.thick * 0.005
-            satlmt = cur.thick * cur.swc.sat
+            drylmt = self.__drylmt[idx]
+            satlmt = self.__satlmt[idx]
             if nextwc < drylmt:
                 outflux = influx + wc - drylmt
             elif nextwc > satlmt:
@@ -500,6 +563,99 @@ class SoilWater(object):
                 n1 = self.__pf[idx][field] / self.numintervals
                 cummfluxes[idx][field] += n1
 
+    def update_layers(self, vwcs, ksats=None):
+        """Replace the water content (and ksat) of every soil layer.
+
+        Used to correct the model state, such as from soil moisture
+        sensors (see the assimilate module). The new water contents are
+        capped to the same range as in the water balance, and the water
+        in the root zone (rootwater) is found again from them.
+
+        Args:
+            vwcs: vol. water content of every soil layer (m3/m3)
+            ksats: saturated hydraulic conductivity of every soil layer
+                   (m/day). Default: None (unchanged)
+
+        Returns:
+            None
+        """
+        for i, layer in enumerate(self.layers):
+            if ksats is not None:
+                layer.ksat = ksats[i]
+            layer.vwc = max(0.005, min(layer.swc.sat, vwcs[i]))  # m3/m3
+            layer.wc = layer.vwc * layer.thick * 1000  # mm
+            layer.update_heads_k()
+        self.__logksat = math.log(self.layers[-1].ksat)
+        self._rootzone_water()
+        self.rootwater = RootZone(*[self.__prz[field]
+                                    for field in RootZone._fields])
+
+    def get_state(self):
+        """Model state carried from one day to the next.
+
+        The model state, with the model inputs, is all that is needed to
+        continue a model run from the day it was taken (see set_state),
+        such as to advance a model by one day at a time (see online.py).
+
+        Returns:
+            Dictionary of the rooting depth (m), and the vol. water
+            content (m3/m3) and saturated hydraulic conductivity (m/day)
+            of every soil layer (JSON serializable)
+        """
+        return {'rootdepth': self.rootdepth,
+                'vwc': [layer.vwc for layer in self.layers],
+                'ksat': [layer.ksat for layer in self.layers]}
+
+    def set_state(self, state):
+        """Restore the model state (from get_state).
+
+        Args:
+            state: dictionary of the model state, taken from a model of
+                   the same model inputs
+
+        Returns:
+            None
+        """
+        self.rootdepth = state['rootdepth']
+        self.update_layers(state['vwc'], state['ksat'])
+
+    def _traced_water_fluxes(self, cummfluxes, petcrop, petsoil):
+        """Calculate the water fluxes (see _calc_water_fluxes), then
+        record the sub-interval step in the tracer."""
+        wcs = [layer.vwc * layer.thick for layer in self.layers]
+        SoilWater._calc_water_fluxes(self, cummfluxes, petcrop, petsoil)
+        # a clamped layer ends at its dry (1) or saturation (2) limit:
+        clamps = []
+        for idx, pf in enumerate(self.__pf):
+            nextwc = pf['influx'] + wcs[idx] - pf['outflux']
+            if math.isclose(nextwc, self.__drylmt[idx], rel_tol=1e-9):
+                clamps.append(1)
+            elif math.isclose(nextwc, self.__satlmt[idx], rel_tol=1e-9):
+                clamps.append(2)
+            else:
+                clamps.append(0)
+        self.__tracer.record(self.__pf, self.layers, clamps)
+
+    def start_trace(self, tracer):
+        """Record every sub-interval step in a tracer.
+
+        The recording step is swapped in for this model alone, so models
+        that are not traced run exactly as before, at no extra cost.
+
+        Args:
+            tracer: the Tracer object (see tracer.py)
+
+        Returns:
+            None
+        """
+        self.__tracer = tracer
+        self._calc_water_fluxes = self._traced_water_fluxes
+
+    def stop_trace(self):
+        """Stop recording the sub-interval steps."""
+        self.__dict__.pop('_calc_water_fluxes', None)
+        self.__tracer = None
+
     def daily_water_balance(self, rain, lai, petcrop, petsoil):
         """Solve for the water content in each soil layer.
 
@@ -515,6 +671,7 @@ class SoilWater(object):
         # update the values that will not change within a day
         self.netrain = SoilWater.net_rainfall(rain, lai)
         self.rootdepth = self._rooting_depth()
+        self.__plan = self._step_plan()
 
         # to store the intermediary water fluxes during calculations
         cummfluxes = [{field: 0.0 for field in Fluxes._fields}
@@ -531,3 +688,27 @@ class SoilWater(object):
         for i, layer in enumerate(self.layers):
             layer.fluxes = Fluxes(*[cummfluxes[i][field]
                                     for field in Fluxes._fields])
+
+
+def new_model(ini):
+    """New model (SoilWater object, not yet run) for the given inputs.
+
+    The soil profile of every model inputs is built only once: later
+    models are copies of it (unpickled, which is faster than building
+    a model from its model inputs). Only the last MAXPROFILES soil
+    profiles are kept, so the memory used is bounded.
+
+    Args:
+        ini: dictionary of the model inputs
+
+    Returns:
+        The new model
+    """
+    key = json.dumps(ini, sort_keys=True)
+    profile = _profiles.pop(key, None)
+    if profile is None:
+        profile = pickle.dumps(SoilWater(ini), -1)
+    _profiles[key] = profile    # now the most recently used
+    if len(_profiles) > MAXPROFILES:
+        _profiles.popitem(last=False)
+    return pickle.loads(profile)
@@ -0,0 +1,121 @@
+"""Startup module.
+
+Check the start-up (module import) time of the headless model run path
+against a time budget, using Python's -X importtime option. Modules that
+must never be imported by the headless run path (such as matplotlib) are
+flagged as well.
+
+How to use:
+
+    python startup.py <flags>
+
+where <flags> are the following:
+    -b <time budget, in milliseconds, optional (default: 100)>
+    -r <no. of repeats, where the fastest is used, optional (default: 5)>
+
+Exits with error code 1 if the budget is exceeded or a forbidden module
+is imported.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import getopt
+import os
+import subprocess
+import sys
+import traceback
+
+
+# modules imported by the headless run path ("pywaterbal.py run ...")
+HEADLESS = ['pywaterbal', 'facade']
+
+# modules that the headless run path must not import
+FORBIDDEN = ['matplotlib', 'numpy']
+
+
+def import_times(modules):
+    """Import times of the given modules (in a new interpreter).
+
+    Args:
+        modules: list of module names to import
+
+    Returns:
+        Dictionary of the cumulative import time (microseconds) of every
+        module imported, indexed by module name
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    code = 'import ' + ', '.join(modules)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=folder, stderr=subprocess.PIPE,
+                          universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        # line is: "import time: <self> | <cumulative> | <module name>"
+        if not line.startswith('import time:'):
+            continue
+        items = line[len('import time:'):].split('|')
+        if not items[1].strip().isdigit():
+            continue    # the header line
+        times[items[2].strip()] = int(items[1])
+    return times
+
+
+def check_startup(repeats=5):
+    """Check the start-up time of the headless run path.
+
+    Args:
+        repeats: no. of repeats, where the fastest is used
+
+    Returns:
+        Tuple of the start-up time (milliseconds) and the list of
+        forbidden modules imported (empty list if none)
+    """
+    best = None
+    forbidden = []
+    for _ in range(repeats):
+        times = import_times(HEADLESS)
+        total = sum(times[name] for name in HEADLESS) / 1000
+        best = total if best is None else min(best, total)
+        forbidden = [name for name in times
+                     if name.split('.')[0] in FORBIDDEN]
+    return best, sorted(set(name.split('.')[0] for name in forbidden))
+
+
+def main(argv):
+    """Main entry point for the start-up check.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    try:
+        budget = 100.0
+        repeats = 5
+        opts, a = getopt.getopt(argv, "hb:r:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-b':           # time budget flag
+                budget = float(arg)
+            elif opt == '-r':           # no. of repeats flag
+                repeats = int(arg)
+
+        msec, forbidden = check_startup(repeats)
+        print('Start-up time: {:.1f} ms (budget: {:.1f} ms)'.format(msec,
+                                                                  budget))
+        if forbidden:
+            print('Forbidden modules imported: ' + ', '.join(forbidden))
+        if msec > budget or forbidden:
+            return 1
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
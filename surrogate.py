@@ -0,0 +1,564 @@
+"""Surrogate module.
+
+Screen very many candidate scenarios (soil texture, soil layer thickness,
+and rain and potential ET) with a fast emulator of the soil water model,
+so that only the most promising candidates are run by the full model.
+
+The emulator is trained on a design of full model runs: the scenarios
+are spread over the ranges of the scenario inputs by Latin hypercube
+sampling, and every scenario is run by the full model (in parallel). The
+emulator is a polynomial chaos expansion: every model output is fitted
+(by least squares) as a sum of products of Legendre polynomials of the
+scenario inputs (scaled to -1 to 1), up to a given total degree. Part of
+the design is held back to report the emulator's validation error (RMSE
+and R2) before the emulator is refitted on the whole design.
+
+Scenario inputs (see SPACE, for their default ranges):
+    clay, sand, om - clay, sand, and organic matter (%) of every layer
+    thick - multiplier of the thickness of every soil layer (-)
+    rain - multiplier of the daily rain (-)
+    pet - multiplier of the daily potential transpiration and
+          evaporation (-)
+
+Emulated model outputs (see OUTPUTS):
+    rootvwc - mean vol. water content of the root zone (m3/m3)
+    drainage - total water leaving the last soil layer (mm)
+    stressdays - no. of days with crop water stress (days with a
+                 reduction in transpiration, see SoilWater.waterstresses)
+
+Requires numpy.
+
+How to use:
+
+    python surrogate.py <flags>
+
+where <flags> are the following:
+    -i <model input text file>
+    -n <number of daily time steps to run the model, in days, optional
+        (default: 365)>
+    -d <no. of full model runs to train the emulator on, optional
+        (default: 300)>
+    -g <max. total degree of the polynomials, optional (default: 3);
+        lowered if the design has fewer than twice as many runs (less
+        the held back ones) as the polynomials have terms>
+    -c <no. of candidates to screen, optional (default: 1000000)>
+    -k <no. of best candidates to run by the full model, optional
+        (default: 10)>
+    -o <model output to rank the candidates by, optional (default:
+        stressdays)>
+    -m <either min or max, to rank by the lowest or highest values,
+        optional (default: min)>
+    -w <number of worker processes, optional (default: no. of CPUs)>
+    -s <random seed, optional (default: 0)>
+    -r <min. validation R2 of the model output to rank the candidates by,
+        optional (default: 0.5)>
+
+The candidates are not screened if the emulator's validation R2 of the
+model output to rank them by is below the -r value (exits with error
+code 1), as the ranking would then be little better than a random draw.
+Otherwise, the best candidates are run by the full model, together with
+as many random candidates, to check that the screen beats a random draw
+(exits with error code 1 if the best candidates are not better, on
+average, by the full model).
+
+Example:
+    from surrogate import Surrogate
+
+    if __name__ == '__main__':
+        sur = Surrogate('ini.txt', 365)
+        sur.train(300)
+        print(sur.errors)   # validation error of every model output
+        x, pred = sur.screen(10 ** 6, 'stressdays', 10)
+        actual, randoms = sur.check_screen(x)
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+import copy
+import getopt
+import itertools
+import json
+import math
+import multiprocessing as mp
+import sys
+import traceback
+
+import numpy as np
+
+from dailydata import DailyData
+from soilwater import SoilWater
+
+
+# scenario inputs and their default ranges (min., max.):
+SPACE = {'clay': (10.0, 50.0), 'sand': (10.0, 50.0), 'om': (0.5, 4.0),
+         'thick': (0.5, 2.0), 'rain': (0.5, 1.5), 'pet': (0.7, 1.3)}
+# emulated model outputs:
+OUTPUTS = ['rootvwc', 'drainage', 'stressdays']
+# min. validation R2 of the model output the candidates are ranked by:
+MIN_R2 = 0.5
+
+
+def latin_hypercube(n, ndims, rng):
+    """Latin hypercube sample of n points in the unit hypercube.
+
+    Args:
+        n: no. of points
+        ndims: no. of dimensions
+        rng: numpy random generator
+
+    Returns:
+        Array of (points x dimensions), of values from 0 to 1, where
+        every dimension has one point in each of its n equal strata
+    """
+    strata = np.argsort(rng.random((ndims, n)), axis=1).T
+    return (strata + rng.random((n, ndims))) / n
+
+
+def scenario(ini, params):
+    """Model inputs and daily data multipliers of a scenario.
+
+    Args:
+        ini: dictionary of the model inputs
+        params: dictionary of the scenario inputs (see SPACE)
+
+    Returns:
+        Tuple of the model inputs of the scenario (dictionary), and the
+        multipliers of rain and of potential ET
+    """
+    new = copy.deepcopy(ini)
+    for layer in new['layers'][:new['numlayers']]:
+        layer['thick'] *= params['thick']
+        layer['texture'] = {'clay': params['clay'], 'sand': params['sand'],
+                            'om': params['om']}
+    return new, params['rain'], params['pet']
+
+
+def run_scenario(ini, dailydata, duration, params):
+    """Run the full model for a scenario.
+
+    Args:
+        ini: dictionary of the model inputs
+        dailydata: daily data (DailyData object)
+        duration: no. of daily simulation days (days)
+        params: dictionary of the scenario inputs (see SPACE)
+
+    Returns:
+        List of the model outputs, in the same order as OUTPUTS
+    """
+    ini, rainmult, petmult = scenario(ini, params)
+    model = SoilWater(ini)
+    rootvwc = drainage = 0.0
+    stressdays = 0
+    for day in range(1, duration + 1):
+        rain, lai, petcrop, petsoil = dailydata[day]
+        model.daily_water_balance(rain * rainmult, lai, petcrop * petmult,
+                                  petsoil * petmult)
+        rootvwc += model.rootwater.vwc
+        drainage += model.layers[-1].fluxes.outflux * 1000   # mm
+        if model.waterstresses.crop < 1:
+            stressdays += 1
+    return [rootvwc / duration, drainage, stressdays]
+
+
+# worker process state (see _init_worker):
+_worker = {}
+
+
+def _init_worker(ini, duration):
+    """Keep the model inputs and read the daily data (once per worker)."""
+    _worker['ini'] = ini
+    _worker['duration'] = duration
+    _worker['dailydata'] = DailyData(ini['dailydatafile'])
+
+
+def _run_scenario(params):
+    """Run the full model for a scenario (in a worker process)."""
+    return run_scenario(_worker['ini'], _worker['dailydata'],
+                        _worker['duration'], params)
+
+
+class Emulator(object):
+    """Emulator class.
+
+    Polynomial chaos expansion of model outputs: a sum of products of
+    Legendre polynomials of the (scaled) inputs, fitted by least squares.
+
+    ATTRIBUTES:
+        bounds - min. and max. of every input, an array of (inputs x 2)
+        degree - max. total degree of the polynomials
+        terms - degree of every input in every term, an array of
+                (terms x inputs)
+        coefs - coefficients of every term and output, an array of
+                (terms x outputs)
+        limits - min. and max. of every fitted model output, to which
+                 the emulated model outputs are capped when they are
+                 reported (the emulator is not trusted beyond the model
+                 outputs it was fitted to)
+
+    METHODS:
+        basis - values of every term, for every point
+        fit - fit the coefficients to the model outputs
+        predict - emulated model outputs
+    """
+
+    def __init__(self, bounds, degree=3):
+        """Create the Emulator object.
+
+        Args:
+            bounds: min. and max. of every input (list of pairs)
+            degree: max. total degree of the polynomials
+        """
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.degree = degree
+        ndims = len(self.bounds)
+        self.terms = np.array([idx for idx in itertools.product(
+            range(degree + 1), repeat=ndims) if sum(idx) <= degree])
+        self.coefs = None
+        self.limits = None
+
+    def basis(self, x):
+        """Values of every term, for every point.
+
+        Args:
+            x: inputs, an array of (points x inputs)
+
+        Returns:
+            Array of (points x terms)
+        """
+        lo, hi = self.bounds[:, 0], self.bounds[:, 1]
+        z = 2 * (np.asarray(x, dtype=float) - lo) / (hi - lo) - 1
+        vander = [np.polynomial.legendre.legvander(z[:, j], self.degree)
+                  for j in range(z.shape[1])]
+        out = np.ones((z.shape[0], len(self.terms)))
+        for j, v in enumerate(vander):
+            out *= v[:, self.terms[:, j]]
+        return out
+
+    def fit(self, x, y):
+        """Fit the coefficients to the model outputs (least squares).
+
+        Args:
+            x: inputs, an array of (points x inputs)
+            y: model outputs, an array of (points x outputs)
+
+        Returns:
+            None
+        """
+        y = np.asarray(y, dtype=float)
+        self.coefs = np.linalg.lstsq(self.basis(x), y, rcond=None)[0]
+        self.limits = (y.min(axis=0), y.max(axis=0))
+
+    def predict(self, x, chunk=100000, cap=True):
+        """Emulated model outputs (in chunks of points, to bound memory).
+
+        Args:
+            x: inputs, an array of (points x inputs)
+            chunk: max. no. of points emulated at a time
+            cap: True to cap the emulated model outputs to the range of
+                 the fitted model outputs (to report them), or False to
+                 keep them as emulated (to rank points by them, as capped
+                 values would tie)
+
+        Returns:
+            Array of (points x outputs)
+        """
+        x = np.asarray(x, dtype=float)
+        out = np.empty((x.shape[0], self.coefs.shape[1]))
+        for i in range(0, x.shape[0], chunk):
+            out[i:i + chunk] = self.basis(x[i:i + chunk]) @ self.coefs
+        if cap:
+            np.clip(out, *self.limits, out=out)
+        return out
+
+
+class Surrogate(object):
+    """Surrogate class.
+
+    Train an emulator of the soil water model on a design of full model
+    runs, then screen many candidate scenarios with it.
+
+    ATTRIBUTES:
+        ini - model inputs read from the model input text file
+        duration - no. of daily simulation days (days)
+        space - scenario inputs and their ranges (see SPACE)
+        nworkers - no. of worker processes for the full model runs
+        seed - seed of the random generator
+        emulator - the trained emulator (Emulator object)
+        errors - validation error (RMSE and R2) of every model output
+        x, y - scenario inputs and model outputs of the design
+
+    METHODS:
+        Statics:
+            validation_errors - RMSE and R2 of emulated model outputs
+
+        params - scenario inputs of a point, as a dictionary
+        run_full - run the full model for many scenarios (in parallel)
+        train - train the emulator, and find its validation error
+        random_candidates - random scenarios over the scenario inputs
+        screen - best candidates of many random scenarios, by emulation
+        check_screen - full model runs of the best and random candidates
+    """
+
+    def __init__(self, fname_in, duration=365, space=None, nworkers=None,
+                 seed=0):
+        """Create the Surrogate object.
+
+        Args:
+            fname_in: model input text file
+            duration: no. of daily simulation days (days)
+            space: scenario inputs and their ranges (dictionary of
+                   (min., max.) pairs). Default: SPACE
+            nworkers: no. of worker processes. Default: no. of CPUs
+            seed: seed of the random generator
+        """
+        with open(fname_in, 'rt') as fin:
+            self.ini = json.loads(fin.read())   # read everything in file
+        self.duration = duration
+        self.space = dict(space or SPACE)
+        self.nworkers = nworkers
+        self.seed = seed
+        self.emulator = None
+        self.errors = None
+        self.x = self.y = None
+        self.__rng = np.random.default_rng(seed)
+
+    def params(self, point):
+        """Scenario inputs of a point, as a dictionary."""
+        return dict(zip(self.space, point))
+
+    def run_full(self, x):
+        """Run the full model for many scenarios, in parallel.
+
+        Args:
+            x: scenario inputs, an array of (scenarios x inputs), in the
+               same order as space
+
+        Returns:
+            Array of the model outputs (scenarios x OUTPUTS)
+        """
+        initargs = (self.ini, self.duration)
+        with mp.Pool(self.nworkers, _init_worker, initargs) as pool:
+            rows = pool.map(_run_scenario,
+                            [self.params(point) for point in x.tolist()])
+        return np.array(rows, dtype=float)
+
+    @staticmethod
+    def validation_errors(actual, predicted):
+        """RMSE and R2 of emulated model outputs.
+
+        Args:
+            actual: model outputs of the full model (points x OUTPUTS)
+            predicted: emulated model outputs (points x OUTPUTS)
+
+        Returns:
+            Dictionary of the (RMSE, R2) of every model output
+        """
+        sse = ((actual - predicted) ** 2).sum(axis=0)
+        sst = ((actual - actual.mean(axis=0)) ** 2).sum(axis=0)
+        rmse = np.sqrt(sse / actual.shape[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+        return {name: (float(rmse[i]), float(r2[i]))
+                for i, name in enumerate(OUTPUTS)}
+
+    def train(self, ndesign=300, degree=3, holdout=0.2):
+        """Train the emulator, and find its validation error.
+
+        Args:
+            ndesign: no. of full model runs (design points)
+            degree: max. total degree of the polynomials, lowered until
+                    the fitted design points are at least twice the no.
+                    of terms, as with fewer points the polynomials swing
+                    wildly between (and beyond) them
+            holdout: fraction of the design points held back to find the
+                     validation error
+
+        Returns:
+            Dictionary of the validation error (RMSE, R2) of every model
+            output (also kept in the errors attribute)
+        """
+        bounds = list(self.space.values())
+        lo, hi = np.array(bounds).T
+        self.x = lo + latin_hypercube(ndesign, len(bounds),
+                                      self.__rng) * (hi - lo)
+        self.y = self.run_full(self.x)
+        nval = int(round(holdout * ndesign))
+        while degree > 1 and 2 * math.comb(len(bounds) + degree,
+                                           degree) > ndesign - nval:
+            degree -= 1
+        self.emulator = Emulator(bounds, degree)
+        order = self.__rng.permutation(ndesign)
+        val, fit = order[:nval], order[nval:]
+        self.emulator.fit(self.x[fit], self.y[fit])
+        self.errors = Surrogate.validation_errors(
+            self.y[val], self.emulator.predict(self.x[val]))
+        self.emulator.fit(self.x, self.y)   # refit on every design point
+        return self.errors
+
+    def random_candidates(self, n):
+        """Random scenarios, an array of (n x inputs), over space."""
+        lo, hi = np.array(list(self.space.values())).T
+        return lo + self.__rng.random((n, len(lo))) * (hi - lo)
+
+    def screen(self, ncandidates, output, k=10, largest=False,
+               chunk=100000, minr2=MIN_R2):
+        """Best candidates of many random scenarios, by emulation.
+
+        The candidates are ranked by their emulated model outputs before
+        these are capped (see Emulator.predict), so candidates beyond the
+        range of the design are still told apart.
+
+        Args:
+            ncandidates: no. of random candidate scenarios
+            output: model output to rank the candidates by (see OUTPUTS)
+            k: no. of best candidates
+            largest: True to rank by the highest values, else lowest
+            chunk: max. no. of candidates emulated at a time
+            minr2: min. validation R2 of the output (see train) for the
+                   candidates to be screened. Default: MIN_R2
+
+        Returns:
+            Tuple of the scenario inputs of the best candidates (array of
+            k x inputs), and their emulated model outputs, capped (array
+            of k x OUTPUTS), best first
+
+        Raises:
+            ValueError: if the validation R2 of the output is below minr2
+                        (or unknown, as the output never changed)
+        """
+        col = OUTPUTS.index(output)
+        r2 = self.errors[output][1]
+        if not r2 >= minr2:     # also if R2 is NaN
+            raise ValueError(
+                'Validation R2 of {} is {:.3f}, below {:.3f}, so the'
+                ' candidates are not screened. Train the emulator on more'
+                ' full model runs.'.format(output, r2, minr2))
+        sign = -1.0 if largest else 1.0
+        bestx = np.empty((0, len(self.space)))
+        besty = np.empty((0, len(OUTPUTS)))
+        for start in range(0, ncandidates, chunk):
+            x = self.random_candidates(min(chunk, ncandidates - start))
+            y = self.emulator.predict(x, chunk, cap=False)
+            # keep only the best k so far:
+            x = np.vstack([bestx, x])
+            y = np.vstack([besty, y])
+            keep = np.argsort(sign * y[:, col], kind='stable')[:k]
+            bestx, besty = x[keep], y[keep]
+        return bestx, np.clip(besty, *self.emulator.limits)
+
+    def check_screen(self, bestx):
+        """Full model runs of the best candidates and of random ones.
+
+        Used to check that the screen beats a random draw: the best
+        candidates should do better, on average, by the full model, than
+        as many random candidates.
+
+        Args:
+            bestx: scenario inputs of the best candidates (see screen)
+
+        Returns:
+            Tuple of the model outputs of the best candidates, and of as
+            many random candidates (arrays of candidates x OUTPUTS)
+        """
+        randx = self.random_candidates(bestx.shape[0])
+        y = self.run_full(np.vstack([bestx, randx]))
+        return y[:bestx.shape[0]], y[bestx.shape[0]:]
+
+
+def main(argv):
+    """Main entry point for screening scenarios.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        inifile = nworkers = None
+        duration = 365
+        ndesign = 300
+        degree = 3
+        ncandidates = 1000000
+        k = 10
+        output = 'stressdays'
+        largest = False
+        seed = 0
+        minr2 = MIN_R2
+        opts, a = getopt.getopt(argv, "hi:n:d:g:c:k:o:m:w:s:r:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-i':           # initialization file flag
+                inifile = arg
+            elif opt == '-n':           # duration of model run flag
+                duration = int(arg)
+            elif opt == '-d':           # no. of design runs flag
+                ndesign = int(arg)
+            elif opt == '-g':           # degree of polynomials flag
+                degree = int(arg)
+            elif opt == '-c':           # no. of candidates flag
+                ncandidates = int(arg)
+            elif opt == '-k':           # no. of best candidates flag
+                k = int(arg)
+            elif opt == '-o':           # model output to rank by flag
+                output = arg
+            elif opt == '-m':           # rank by min. or max. flag
+                largest = arg.lower() == 'max'
+            elif opt == '-w':           # no. of worker processes flag
+                nworkers = int(arg)
+            elif opt == '-s':           # random seed flag
+                seed = int(arg)
+            elif opt == '-r':           # min. validation R2 flag
+                minr2 = float(arg)
+
+        if inifile is None:
+            print('Flag -i is missing. All other flags are optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        sur = Surrogate(inifile, duration, nworkers=nworkers, seed=seed)
+        print('Training on {} full model runs ...'.format(ndesign))
+        errors = sur.train(ndesign, degree)
+        print('Polynomials of total degree {}'.format(sur.emulator.degree))
+        for name, (rmse, r2) in errors.items():
+            print('Validation error of {}: RMSE {:.4g}, R2 {:.3f}'.format(
+                name, rmse, r2))
+        print('Screening {} candidates ...'.format(ncandidates))
+        try:
+            x, pred = sur.screen(ncandidates, output, k, largest,
+                                 minr2=minr2)
+        except ValueError as e:     # emulator too poor to rank by
+            print(e)
+            return 1
+        actual, randoms = sur.check_screen(x)
+        col = OUTPUTS.index(output)
+        names = list(sur.space)
+        print(('{:>8s}' * len(names)).format(*names) +
+              '{:>12s}{:>12s}'.format('emulated', 'full model'))
+        for point, p, f in zip(x.tolist(), pred[:, col], actual[:, col]):
+            print(('{:>8.2f}' * len(point)).format(*point) +
+                  '{:>12.4g}{:>12.4g}'.format(p, f))
+        best = actual[:, col].mean()
+        rand = randoms[:, col].mean()
+        better = best > rand if largest else best < rand
+        print('Mean {} by the full model: best {:.4g}, random {:.4g}'
+              ' ({})'.format(output, best, rand,
+                             'screen beats a random draw' if better
+                             else 'screen does NOT beat a random draw'))
+        if not better:
+            return 1
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
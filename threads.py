@@ -0,0 +1,211 @@
+"""Threads module.
+
+Run many independent soil water models on a pool of threads, in one
+process, where all the models share the same (read-only) daily data.
+On free-threaded (no GIL) Python, the models are run truly in parallel;
+otherwise, the threads take turns.
+
+The soil water model is thread-safe for independent models: every model
+(and every soil layer) keeps its own state, the daily data are only read,
+and the soil hydraulic properties cached by soil texture (see the
+pedotransfer module) are kept in a thread-safe cache.
+
+How to use (stress check, comparing threaded with serial model runs):
+
+    python threads.py <flags>
+
+where <flags> are the following:
+    -i <model input text file>
+    -m <no. of models, optional (default: 64)>
+    -n <number of daily time steps to run the model, in days, optional
+        (default: 90)>
+    -t <no. of threads, optional (default: no. of CPUs + 4, max. 32)>
+    -r <no. of repeats, optional (default: 3)>
+
+Exits with error code 1 if any threaded model run differs from its
+serial model run.
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import getopt
+import json
+import sys
+import time
+import traceback
+
+from dailydata import DailyData
+from facade import Facade
+from soilwater import SoilWater
+
+
+def run_model(ini, dailydata, duration):
+    """Run a soil water model.
+
+    Args:
+        ini: dictionary of the model inputs (only read)
+        dailydata: daily data (DailyData object, only read)
+        duration: no. of daily simulation days (days)
+
+    Returns:
+        List of the daily model outputs (see Facade.daily_outputs)
+    """
+    model = SoilWater(ini)
+    rows = []
+    for day in range(1, duration + 1):
+        data = dailydata[day]
+        model.daily_water_balance(*data)
+        rows.append(Facade.daily_outputs(model, data[0]))
+    return rows
+
+
+def run_threaded(inis, dailydata, duration, nthreads=None):
+    """Run many independent models on a pool of threads.
+
+    Args:
+        inis: list of dictionaries of the model inputs, one per model
+        dailydata: daily data (DailyData object), shared by all models
+        duration: no. of daily simulation days (days)
+        nthreads: no. of threads. Default: as given by ThreadPoolExecutor
+
+    Returns:
+        List of the daily model outputs of every model, in the same order
+        as the given model inputs
+    """
+    with ThreadPoolExecutor(nthreads) as pool:
+        return list(pool.map(run_model, inis, [dailydata] * len(inis),
+                             [duration] * len(inis)))
+
+
+def run_serial(inis, dailydata, duration):
+    """Run many independent models, one after another (see run_threaded).
+    """
+    return [run_model(ini, dailydata, duration) for ini in inis]
+
+
+def variants(ini, nmodels):
+    """Model inputs of many different models, made from given inputs.
+
+    Every model has a different soil texture, no. of soil layers, and
+    no. of integration intervals, so that mixing up the models' states
+    would show in their model results.
+
+    Args:
+        ini: dictionary of the model inputs
+        nmodels: no. of models
+
+    Returns:
+        List of dictionaries of the model inputs
+    """
+    inis = []
+    for i in range(nmodels):
+        new = copy.deepcopy(ini)
+        new['numlayers'] = 1 + i % len(new['layers'])
+        new['numintervals'] = ini['numintervals'] + i % 5
+        for j, layer in enumerate(new['layers']):
+            tex = layer['texture']
+            tex['clay'] = tex['clay'] + (i + j) % 7 - 3
+            tex['sand'] = tex['sand'] + (i * j) % 5 - 2
+        inis.append(new)
+    return inis
+
+
+def stress_check(ini, nmodels=64, duration=90, nthreads=None, repeats=3):
+    """Check that threaded model runs give the same results as serial.
+
+    Args:
+        ini: dictionary of the model inputs
+        nmodels: no. of (different) models
+        duration: no. of daily simulation days (days)
+        nthreads: no. of threads. Default: as given by ThreadPoolExecutor
+        repeats: no. of times the threaded model runs are repeated
+
+    Returns:
+        Tuple of the no. of threaded model runs that differ from their
+        serial model runs, the serial run time, and the (best) threaded
+        run time (seconds)
+    """
+    dailydata = DailyData(ini['dailydatafile'])
+    inis = variants(ini, nmodels)
+    start = time.perf_counter()
+    expected = run_serial(inis, dailydata, duration)
+    serial = time.perf_counter() - start
+    ndiffs = 0
+    threaded = None
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)     # switch threads often (if GIL)
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            results = run_threaded(inis, dailydata, duration, nthreads)
+            secs = time.perf_counter() - start
+            threaded = secs if threaded is None else min(threaded, secs)
+            ndiffs += sum(1 for res, exp in zip(results, expected)
+                          if res != exp)
+    finally:
+        sys.setswitchinterval(interval)
+    return ndiffs, serial, threaded
+
+
+def main(argv):
+    """Main entry point for the stress check.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        inifile = nthreads = None
+        nmodels = 64
+        duration = 90
+        repeats = 3
+        opts, a = getopt.getopt(argv, "hi:m:n:t:r:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-i':           # initialization file flag
+                inifile = arg
+            elif opt == '-m':           # no. of models flag
+                nmodels = int(arg)
+            elif opt == '-n':           # duration of model run flag
+                duration = int(arg)
+            elif opt == '-t':           # no. of threads flag
+                nthreads = int(arg)
+            elif opt == '-r':           # no. of repeats flag
+                repeats = int(arg)
+
+        if inifile is None:
+            print('Flag -i is missing. Flags -m, -n, -t, and -r are'
+                  ' optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        with open(inifile, 'rt') as fin:
+            ini = json.loads(fin.read())    # read everything in file
+        ndiffs, serial, threaded = stress_check(ini, nmodels, duration,
+                                                nthreads, repeats)
+        gil = getattr(sys, '_is_gil_enabled', lambda: True)()
+        print('GIL enabled: {}'.format(gil))
+        print('Serial: {:.3f} s, threaded: {:.3f} s'.format(serial,
+                                                            threaded))
+        print('Threaded runs that differ from serial: {}'.format(ndiffs))
+        if ndiffs:
+            return 1
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
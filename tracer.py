@@ -0,0 +1,287 @@
+"""Tracer module.
+
+Record the water fluxes, heads, hydraulic conductivity, and clamps of
+every soil layer at every sub-interval step of the water balance (see
+SoilWater._calc_water_fluxes), rather than only their daily totals, to
+find out why a soil layer behaves strangely (such as a layer whose water
+content is repeatedly clamped to its dry or saturation limit).
+
+The records are kept in a ring buffer of a fixed no. of records (steps),
+allocated once, so that only the latest steps are kept, however long the
+model is run. The buffer is saved to a binary file on demand (see dump),
+or whenever a given trigger fires (such as repeated clamps).
+
+Tracing costs nothing when it is not used: a model only records its
+steps after SoilWater.start_trace, which swaps in a recording step for
+that model alone, and SoilWater.stop_trace swaps the normal step back.
+
+Recorded for every soil layer (see TRACE_FIELDS):
+    t, e, influx, outflux, netflux - water fluxes of the step (m/day)
+    vwc - vol. water content, after the step (m3/m3)
+    matric, gravity - matric and gravity heads used in the step (m)
+    k - hydraulic conductivity used in the step (m/day)
+    clamp - 0 if not clamped, 1 if clamped to the dry limit, or 2 if
+            clamped to the saturation limit
+
+The binary file has a one-line JSON header (the fields, no. of soil
+layers, no. of integration intervals per day, and no. of records),
+followed by the step numbers (int64), then the records (float64, records
+x layers x fields), both in the order they were recorded. Step numbers
+start at 0 when tracing starts, so that step // numintervals is the day
+(from 0), and step % numintervals is the sub-interval in the day.
+
+How to use (trace a model run):
+
+    python tracer.py <flags>
+
+where <flags> are the following:
+    -i <model input text file>
+    -o <binary trace file to save the last recorded steps in>
+    -n <number of daily time steps to run the model, in days>
+    -s <size of the ring buffer, in steps, optional (default: 10000)>
+    -c <save the trace, to the trace file with the step number appended,
+        whenever a soil layer is clamped in this many steps in a row,
+        optional (default: never)>
+
+Example:
+    from soilwater import SoilWater
+    from tracer import Tracer, repeated_clamps
+
+    model = SoilWater('ini.txt')
+    tracer = Tracer(model.numlayers, 5000, trigger=repeated_clamps(20),
+                    fname='clamps.bin')
+    model.start_trace(tracer)
+    ...     # run the model
+    tracer.dump('last.bin')
+    header, steps, records = load_trace('last.bin')
+
+@author Christopher Teh Boon Sung
+
+"""
+
+
+from array import array
+import getopt
+import json
+import os
+import sys
+import traceback
+
+from dailydata import DailyData
+from soilwater import Fluxes, SoilWater
+
+
+# values recorded for every soil layer at every sub-interval step:
+TRACE_FIELDS = list(Fluxes._fields) + ['vwc', 'matric', 'gravity', 'k',
+                                       'clamp']
+
+
+def repeated_clamps(nsteps):
+    """Trigger that fires when a soil layer is clamped repeatedly.
+
+    Args:
+        nsteps: fire when any soil layer is clamped (to either its dry or
+                saturation limit) in this many steps in a row
+
+    Returns:
+        The trigger, a function of the step number and the clamps of
+        every soil layer in that step, returning True to fire
+    """
+    runs = []   # no. of steps in a row that each layer is clamped
+
+    def trigger(step, clamps):
+        if len(runs) != len(clamps):
+            runs[:] = [0] * len(clamps)
+        fire = False
+        for idx, clamp in enumerate(clamps):
+            runs[idx] = runs[idx] + 1 if clamp else 0
+            if runs[idx] >= nsteps:
+                runs[idx] = 0   # fire again only after as many steps
+                fire = True
+        return fire
+    return trigger
+
+
+def load_trace(fname):
+    """Read a trace saved by Tracer.dump (requires numpy).
+
+    Args:
+        fname: binary trace file
+
+    Returns:
+        Tuple of the header (dictionary), the step numbers (array), and
+        the records (array of records x layers x fields)
+    """
+    import numpy as np   # only needed to read the traces
+    with open(fname, 'rb') as fin:
+        header = json.loads(fin.readline())
+        n = header['nrecords']
+        steps = np.fromfile(fin, dtype='<i8', count=n)
+        records = np.fromfile(fin, dtype='<f8',
+                              count=n * header['nlayers'] *
+                              len(header['fields']))
+    shape = (n, header['nlayers'], len(header['fields']))
+    return header, steps, records.reshape(shape)
+
+
+class Tracer(object):
+    """Tracer class.
+
+    Record every sub-interval step of a model in a ring buffer.
+
+    ATTRIBUTES:
+        nlayers - no. of soil layers
+        size - size of the ring buffer (no. of steps kept)
+        numintervals - no. of integration intervals per day
+        trigger - function of the step number and the clamps of every
+                  soil layer, returning True to save the trace, if any
+        fname - binary file to save the trace in when the trigger fires
+                (the step number is appended to the file name)
+        nsteps - no. of steps recorded so far
+        ndumps - no. of times the trace has been saved
+
+    METHODS:
+        record - record a sub-interval step
+        dump - save the recorded steps to a binary file
+    """
+
+    def __init__(self, nlayers, size=10000, numintervals=1, trigger=None,
+                 fname=None):
+        """Create the Tracer object, and allocate its ring buffer.
+
+        Args:
+            nlayers: no. of soil layers
+            size: size of the ring buffer (no. of steps kept)
+            numintervals: no. of integration intervals per day (only
+                          saved in the header, to tell the days apart)
+            trigger: function of the step number and the clamps of every
+                     soil layer, returning True to save the trace (see
+                     repeated_clamps). Default: None (no trigger)
+            fname: binary file to save the trace in when the trigger
+                   fires. Default: None (trigger not used)
+        """
+        self.nlayers = nlayers
+        self.size = size
+        self.numintervals = numintervals
+        self.trigger = trigger if fname else None
+        self.fname = fname
+        self.nsteps = 0
+        self.ndumps = 0
+        self.__rowsize = nlayers * len(TRACE_FIELDS)
+        self.__steps = array('q', bytes(8 * size))
+        self.__records = array('d', bytes(8 * size * self.__rowsize))
+
+    def record(self, pf, layers, clamps):
+        """Record a sub-interval step.
+
+        Args:
+            pf: water fluxes of every soil layer in the step (list of
+                dictionaries, keyed by the Fluxes fields)
+            layers: the soil layers (SoilLayer objects), after the step
+            clamps: clamp of every soil layer (0, 1, or 2; see
+                    TRACE_FIELDS)
+
+        Returns:
+            None
+        """
+        pos = self.nsteps % self.size
+        self.__steps[pos] = self.nsteps
+        off = pos * self.__rowsize
+        buf = self.__records
+        for f, layer, clamp in zip(pf, layers, clamps):
+            buf[off:off + len(TRACE_FIELDS)] = array('d', (
+                f['t'], f['e'], f['influx'], f['outflux'], f['netflux'],
+                layer.vwc, layer.matric, layer.gravity, layer.k, clamp))
+            off += len(TRACE_FIELDS)
+        if self.trigger is not None and self.trigger(self.nsteps, clamps):
+            root, ext = os.path.splitext(self.fname)
+            self.dump('{}_{}{}'.format(root, self.nsteps, ext))
+        self.nsteps += 1
+
+    def dump(self, fname):
+        """Save the recorded steps to a binary file (oldest first).
+
+        Args:
+            fname: binary trace file
+
+        Returns:
+            No. of records saved
+        """
+        n = min(self.nsteps, self.size)
+        first = self.nsteps % self.size if self.nsteps > self.size else 0
+        order = list(range(first, n)) + list(range(first))
+        header = {'fields': TRACE_FIELDS, 'nlayers': self.nlayers,
+                  'numintervals': self.numintervals, 'nrecords': n}
+        steps = array('q', [self.__steps[pos] for pos in order])
+        records = array('d')
+        for pos in order:
+            off = pos * self.__rowsize
+            records.extend(self.__records[off:off + self.__rowsize])
+        if sys.byteorder != 'little':
+            steps.byteswap()
+            records.byteswap()
+        with open(fname, 'wb') as fout:
+            fout.write(json.dumps(header).encode() + b'\n')
+            steps.tofile(fout)
+            records.tofile(fout)
+        self.ndumps += 1
+        return n
+
+
+def main(argv):
+    """Main entry point for tracing a model run.
+
+    Args:
+        argv: the commandline options and arguments
+    """
+    if len(argv) == 0:      # no arguments given, so print help and exit
+        print(__doc__)
+        sys.exit(2)
+
+    try:
+        inifile = outfile = duration = nclamps = None
+        size = 10000
+        opts, a = getopt.getopt(argv, "hi:o:n:s:c:")
+        for opt, arg in opts:
+            if opt == '-h':             # help flag
+                print(__doc__)
+                sys.exit()
+            elif opt == '-i':           # initialization file flag
+                inifile = arg
+            elif opt == '-o':           # trace file flag
+                outfile = arg
+            elif opt == '-n':           # duration of model run flag
+                duration = int(arg)
+            elif opt == '-s':           # ring buffer size flag
+                size = int(arg)
+            elif opt == '-c':           # repeated clamps trigger flag
+                nclamps = int(arg)
+
+        if None in [inifile, outfile, duration]:
+            print('One or more flags are missing. Flags -s and -c are'
+                  ' optional.')
+            print(__doc__)
+            sys.exit(2)
+
+        model = SoilWater(inifile)
+        with open(inifile, 'rt') as fin:
+            dailydata = DailyData(json.loads(fin.read())['dailydatafile'])
+        trigger = repeated_clamps(nclamps) if nclamps else None
+        tracer = Tracer(model.numlayers, size, model.numintervals,
+                        trigger, outfile)
+        model.start_trace(tracer)
+        for day in range(1, duration + 1):
+            model.daily_water_balance(*dailydata[day])
+        n = tracer.dump(outfile)
+        print('Steps recorded: {}, saved: {}, triggered saves: {}'.format(
+            tracer.nsteps, n, tracer.ndumps - 1))
+
+    except getopt.GetoptError:
+        traceback.print_exc(file=sys.stdout)
+        sys.exit(2)
+
+    return 0    # error code 0 means no error
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))